@@ -1,8 +1,30 @@
-from flask import Flask, render_template, request, redirect, url_for, session
+from flask import (Flask, render_template, request, redirect, url_for, session,
+                   jsonify, Response, stream_with_context, g, has_app_context,
+                   get_template_attribute)
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.local import LocalProxy
+from werkzeug.security import safe_join
 import redis
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
 import time
+import gzip
+import json
+import re
+import math
+import bisect
+import random
+import hashlib
+import threading
+import hmac
+import struct
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import lru_cache
 from datetime import datetime, date, timezone, timedelta
 import os
+import click
 from dotenv import load_dotenv  # ⬅ 讀取 .env
 
 load_dotenv()  # ⬅ 讀取 .env
@@ -12,15 +34,140 @@ app = Flask(__name__)
 # Flask Secret Key 從環境變數來
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "dev-secret")
 
+# 模板編譯結果存成檔案，worker 重開 / 新開時不用重新編譯
+# （沒設定就放系統暫存目錄；多個 worker 共用同一個目錄沒問題）
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR")
+if JINJA_CACHE_DIR:
+    os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+
 # Redis URL 從環境變數來
+# REDIS_URLS 可以放多台（逗號分隔，可寫成 名稱=URL），依 owner 分散到各台 shard；
+# 只設定 REDIS_URL 就是單台。
 REDIS_URL = os.getenv("REDIS_URL")
+REDIS_URLS = os.getenv("REDIS_URLS") or REDIS_URL
 # print(">>> 使用的 REDIS_URL：", REDIS_URL)
 
-if not REDIS_URL:
-    raise RuntimeError("環境變數 REDIS_URL 沒有設定，請確認 .env 檔")
+# 儲存後端：redis（預設）或 sqlite（內嵌資料庫，單機 / 測試不用另外架 Redis）
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "redis")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "rot_index.db")
+
+if not REDIS_URLS:
+    if STORAGE_BACKEND != "sqlite":
+        raise RuntimeError("環境變數 REDIS_URL 沒有設定，請確認 .env 檔")
+    # sqlite 模式用不到 Redis；redis client 是 lazy 的，不會真的去連
+    REDIS_URLS = "redis://localhost:6379/0"
+
+REDIS_CLUSTER = os.getenv("REDIS_CLUSTER") == "1"
+
+# 每個指令 / 建立連線最多等幾秒（不設的話 Redis 卡住時 worker 會一直等下去）
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "1.0"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "0.5"))
+# backup / fsck / migrate 這些維運指令一次搬很多資料，用比較長的逾時
+REDIS_CLI_SOCKET_TIMEOUT = float(os.getenv("REDIS_CLI_SOCKET_TIMEOUT", "60"))
+# 連線錯誤最多重試幾次（很短的退避），再失敗就交給 circuit breaker。
+# 逾時不重試：指令可能已經在 server 上做完了，重送會讓 XADD / INCR / script 做兩次
+REDIS_RETRIES = int(os.getenv("REDIS_RETRIES", "1"))
+
+
+def split_named_urls(raw):
+    """ "a=redis://h1/0,redis://h2/0" → [("a", url), (None, url)] """
+    items = []
+    for item in (x.strip() for x in raw.split(",") if x.strip()):
+        name, sep, url = item.partition("=")
+        if not sep or "://" in name:
+            items.append((None, item))
+        else:
+            items.append((name.strip(), url.strip()))
+    return items
+
+
+def parse_shard_urls(raw):
+    """
+    "a=redis://h1/0,b=redis://h2/0" → [("a", url), ("b", url)]
+    沒寫名稱就依序叫 shard0、shard1…（名稱會拿去算 hash ring，上線後不要改）
+    """
+    return [
+        (name or f"shard{i}", url)
+        for i, (name, url) in enumerate(split_named_urls(raw))
+    ]
+
+
+def make_redis_client(url):
+    """連線到雲端 Redis（REDIS_CLUSTER=1 時改用 Cluster client）"""
+    options = {
+        "decode_responses": True,
+        "socket_timeout": REDIS_SOCKET_TIMEOUT,
+        "socket_connect_timeout": REDIS_CONNECT_TIMEOUT,
+        "retry": Retry(ExponentialBackoff(cap=0.1, base=0.01), REDIS_RETRIES,
+                       supported_errors=(redis.exceptions.ConnectionError,)),
+    }
+    if REDIS_CLUSTER:
+        from redis.cluster import RedisCluster
+        return RedisCluster.from_url(url, **options)
+    return redis.from_url(url, **options)
+
+
+SHARD_URLS = parse_shard_urls(REDIS_URLS)
+SHARDS = {name: make_redis_client(url) for name, url in SHARD_URLS}
+# 第一台同時當 directory：放登入用的 user:<name>、任務 ID 計數器、shard 搬家狀態
+DIRECTORY_SHARD = SHARD_URLS[0][0]
+directory = SHARDS[DIRECTORY_SHARD]
+
+
+# 唯讀 replica：REDIS_REPLICA_URLS（逗號分隔，可寫成 shard名稱=URL，沒寫就是第一台的）
+REDIS_REPLICA_URLS = os.getenv("REDIS_REPLICA_URLS", "")
+# 寫入之後這麼多秒內，同一個 session 的讀取都走 primary（讀得到自己剛寫的）
+REPLICA_PIN_SECONDS = float(os.getenv("REPLICA_PIN_SECONDS", "5"))
+READ_ONLY_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def parse_replica_urls(raw):
+    replicas = {}
+    for name, url in split_named_urls(raw):
+        name = name or DIRECTORY_SHARD
+        if name not in SHARDS:
+            raise RuntimeError(f"REDIS_REPLICA_URLS 裡的 {name} 不在 REDIS_URLS 裡")
+        replicas.setdefault(name, []).append(make_redis_client(url))
+    return replicas
+
+
+REPLICAS = parse_replica_urls(REDIS_REPLICA_URLS)
+
+
+def current_redis():
+    """這個 request 的 owner 所在的 shard（沒登入 / CLI 就是 directory）"""
+    if has_app_context():
+        g.redis_used = True
+        return g.get("redis", directory)
+    return directory
+
+
+def current_reader():
+    """唯讀 route 用：有 replica 而且不在寫入後的保護時間內就讀 replica"""
+    if has_app_context():
+        g.redis_used = True
+        return g.get("redis_read") or g.get("redis", directory)
+    return directory
+
+
+# 各 route 直接用 r，實際上會連到目前 owner 所在的那一台 primary；
+# 只讀不寫的地方用 rr，GET request 會分到 replica
+r = LocalProxy(current_redis)
+rr = LocalProxy(current_reader)
+
+
+def register_script(lua):
+    """
+    Cluster 模式下 pipeline 裡的 EVALSHA 不會自動補載 script，
+    所以一開始就先在每個 primary 上 SCRIPT LOAD。
+    """
+    script = directory.register_script(lua)
+    if REDIS_CLUSTER:
+        for client in SHARDS.values():
+            client.script_load(lua)
+    return script
 
-# 連線到雲端 Redis
-r = redis.from_url(REDIS_URL, decode_responses=True)
 
 # 統一用台灣時間（UTC+8）
 TZ = timezone(timedelta(hours=8))
@@ -29,6 +176,10 @@ TZ = timezone(timedelta(hours=8))
 # -----------------------------------------------------
 # 工具函式
 # -----------------------------------------------------
+# 剛建立 / 剛修改幾小時內不會變臭
+ROT_GRACE_HOURS = 6
+
+
 def calc_rot_info(created_at, deadline_ts, is_routine,
                   initial_rot=0, interval_days=0, last_checkin_ts=None):
     """
@@ -128,10 +279,9 @@ def calc_rot_info(created_at, deadline_ts, is_routine,
             base_level = 90
 
     # --------- 緩衝機制：剛建立 / 剛修改 6 小時內不會變臭 ---------
-    GRACE_HOURS = 6
     age_hours = max(0.0, (now - float(created_at)) / 3600.0)
 
-    if age_hours < GRACE_HOURS:
+    if age_hours < ROT_GRACE_HOURS:
         # 6 小時內 → 一律用你選的起始腐爛度
         level = initial_rot
     else:
@@ -249,18 +399,728 @@ def is_today(ts_value):
 
 
 # -----------------------------------------------------
-# 使用者相關小工具
+# Key 命名（Redis Cluster 相容）
 # -----------------------------------------------------
+# 同一個 owner 的所有 key 都帶同一段 hash tag「{o:xxxx}」，
+# 在 Redis Cluster 上會落在同一個 slot，MULTI / Lua 才能一次改多個 key。
+# 只有 user:<name>（登入用）和 task:id（ID 配發）是全域 key，而且都是單 key 操作。
+KEYSPACE_LAYOUT = "2"
+
+# 任務分類（英文代碼），舊資料可能還是中文
+CATEGORIES = ["homework", "exam", "life", "habit", "other"]
+CATEGORY_MAPPING = {
+    "作業": "homework",
+    "考試": "exam",
+    "生活": "life",
+    "習慣": "habit",
+    "其他": "other",
+}
+
+
+@lru_cache(maxsize=4096)
+def owner_tag(owner_key):
+    """
+    owner_key 可能含有大括號等任意字元，不能直接當 hash tag，
+    所以取雜湊值的前 16 碼。
+    """
+    digest = hashlib.sha1(owner_key.encode("utf-8")).hexdigest()[:16]
+    return "{o:" + digest + "}"
+
+
+def task_key(owner_key, task_id):
+    return f"task:{owner_tag(owner_key)}:{task_id}"
+
+
+def owner_tasks_key(owner_key):
+    """這個 owner 的任務 ID list（取代以前所有人共用的 tasks list）"""
+    return f"tasks:{owner_tag(owner_key)}"
+
+
+def cat_index_key(owner_key, category):
+    return f"idx:{owner_tag(owner_key)}:cat:{category}"
+
+
+def rot_rank_key(owner_key):
+    return f"rot_rank:{owner_tag(owner_key)}"
+
+
+def rot_due_key(owner_key):
+    """任務 ID → 腐爛度下一次可能改變的時間"""
+    return f"rot_due:{owner_tag(owner_key)}"
+
+
+def rot_series_key(owner_key, resolution):
+    """腐爛度趨勢，resolution 是 hour / day"""
+    return f"rot_ts:{owner_tag(owner_key)}:{resolution}"
+
+
+def stream_key(owner_key, stream):
+    """stream 是 task_events / task_done / task_checkin 其中之一"""
+    return f"{stream}:{owner_tag(owner_key)}"
+
+
+def owner_meta_key(owner_key):
+    """owner 的基本資料（owner_key 原文、key 版本），維運工具用 tag 反查 owner"""
+    return f"owner:{owner_tag(owner_key)}"
+
+
 def get_queue_keys(owner_key):
     """
     owner_key 是真正用來區分使用者的 key（名字 + 密語）
     """
     if owner_key:
-        return f"today_queue:{owner_key}", f"today_queue:{owner_key}:current"
+        tag = owner_tag(owner_key)
+        return f"today_queue:{tag}", f"today_queue:{tag}:current"
     # 沒設定時用共用 key（理論上現在不會用到）
     return "today_queue", "today_queue:current"
 
 
+# -----------------------------------------------------
+# 任務 ID 配發
+# -----------------------------------------------------
+# task:id 是全域計數器，Cluster 上只會在一個 slot。
+# 每個 worker 一次用 INCRBY 領一整段 ID 自己慢慢發，
+# 這個 key 的流量就只剩原本的 1 / TASK_ID_BLOCK。
+TASK_ID_BLOCK = int(os.getenv("TASK_ID_BLOCK", "100"))
+_task_id_lock = threading.Lock()
+_task_id_lease = {"next": 1, "end": 0}
+
+
+def allocate_task_ids(n=1):
+    """回傳 n 個全域不重複的任務 ID（字串）。ID 不保證連續或依時間排序。"""
+    if n >= TASK_ID_BLOCK:
+        # 大量配發（匯入）直接一次領，不動到手上這段
+        last_id = directory.incrby("task:id", n)
+        return [str(i) for i in range(last_id - n + 1, last_id + 1)]
+
+    ids = []
+    with _task_id_lock:
+        while len(ids) < n:
+            if _task_id_lease["next"] > _task_id_lease["end"]:
+                end = directory.incrby("task:id", TASK_ID_BLOCK)
+                _task_id_lease["next"] = end - TASK_ID_BLOCK + 1
+                _task_id_lease["end"] = end
+            ids.append(str(_task_id_lease["next"]))
+            _task_id_lease["next"] += 1
+    return ids
+
+
+# -----------------------------------------------------
+# 效能分析（opt-in）：某個 request 變慢時看時間花在哪
+# -----------------------------------------------------
+# 預設關閉，完全不會掛 hook。打開的方式（擇一）：
+#   PROFILE_SAMPLE_RATE=0.01     隨機抽 1% 的 request
+#   PROFILE_TOKEN=<密語>          帶 X-Profile: <密語> header 的 request（管理員用）
+# 被抽中的 request 由背景 thread 每 PROFILE_INTERVAL 秒記一次 call stack，
+# 結束時寫成 collapsed stack（flamegraph.pl / speedscope 直接吃）到 PROFILE_DIR，
+# 並在 log 印出 Redis / 腐爛度計算與格式化 / Jinja 各佔多少時間。
+# PROFILE_SLOW_MS 設了的話，只留下超過這個時間的 request。
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# 取樣 thread 也要搶 GIL，間隔設得比 sys.getswitchinterval()（預設 5ms）短也不會更準
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+
+# stack 裡由內往外第一個對到的分類，就是這個 sample 的時間算誰的
+PROFILE_HELPERS = {"calc_rot_info", "format_deadline", "safe_display_time", "is_today",
+                   "encode_task", "decode_task", "decode_entry"}
+
+
+def profile_category(frames):
+    for filename, func in frames:
+        path = filename.replace("\\", "/")
+        if "/redis/" in path:
+            return "redis"
+        if path.endswith("sqlite_store.py"):
+            return "sqlite"
+        if func in PROFILE_HELPERS:
+            return "rot/format"
+        if "/jinja2/" in path or path.endswith(".html"):
+            return "jinja"
+    return "other"
+
+
+def short_path(filename):
+    """flask/app.py 跟我們的 app.py 要分得出來，留最後一層目錄"""
+    head, tail = os.path.split(filename)
+    return f"{os.path.basename(head)}/{tail}"
+
+
+class StackSampler:
+    """在背景 thread 定期抓某個 thread 的 call stack（只用標準庫，不用裝 profiler）"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.categories = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return (time.perf_counter() - self.started) * 1000
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                frames.append((frame.f_code.co_filename, frame.f_code.co_name))
+                frame = frame.f_back
+            if not frames:
+                continue
+            stack = ";".join(f"{name} ({short_path(f)})" for f, name in reversed(frames))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            category = profile_category(frames)
+            self.categories[category] = self.categories.get(category, 0) + 1
+
+
+def profile_requested():
+    if PROFILE_TOKEN:
+        header = request.headers.get("X-Profile", "")
+        if header and hmac.compare_digest(header, PROFILE_TOKEN):
+            return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def start_profile():
+    if request.endpoint == "static" or not profile_requested():
+        return None
+    g.profiler = StackSampler(threading.get_ident(), PROFILE_INTERVAL)
+    g.profiler.start()
+    return None
+
+
+def finish_profile(response):
+    sampler = g.pop("profiler", None)
+    if sampler is None:
+        return response
+    total_ms = sampler.stop()
+    if total_ms < PROFILE_SLOW_MS:
+        return response
+
+    samples = sum(sampler.stacks.values()) or 1
+    breakdown = {
+        category: round(count * total_ms / samples, 1)
+        for category, count in sorted(sampler.categories.items(), key=lambda kv: -kv[1])
+    }
+    stamp = datetime.now(TZ).strftime("%Y%m%d-%H%M%S")
+    name = f"{stamp}-{request.endpoint or 'unknown'}-{os.urandom(3).hex()}.folded"
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, name), "w", encoding="utf-8") as f:
+        for stack, count in sorted(sampler.stacks.items()):
+            f.write(f"{stack} {count}\n")
+
+    app.logger.warning(
+        "profile %s %s %.1fms (%d samples) %s → %s",
+        request.method, request.path, total_ms, samples,
+        " ".join(f"{k}={v}ms" for k, v in breakdown.items()), name,
+    )
+    response.headers["X-Profile"] = name
+    return response
+
+
+def stop_profile(error=None):
+    # 中途丟例外、after_request 沒跑到時，也要把背景 thread 收掉
+    sampler = g.pop("profiler", None)
+    if sampler is not None:
+        sampler.stop()
+
+
+if PROFILE_SAMPLE_RATE > 0 or PROFILE_TOKEN:
+    # 最先註冊：before_request 最早開始、after_request 最後結束，整個 request 都量得到
+    app.before_request(start_profile)
+    app.after_request(finish_profile)
+    app.teardown_request(stop_profile)
+
+
+# -----------------------------------------------------
+# Owner → shard（consistent hashing）
+# -----------------------------------------------------
+# 每台 shard 在 ring 上放 RING_VNODES 個點，owner 的 hash tag 順時針找第一個點。
+# 加一台 shard 只會有約 1/N 的 owner 換位置。
+RING_VNODES = 64
+# 搬家中的 owner 記在 directory 的 shard:pins（tag → "來源" 或 "來源>目的"），
+# 每個 worker 每 SHARD_PIN_REFRESH 秒重新讀一次
+SHARD_PINS_KEY = "shard:pins"
+# shards pin 跑完到 shards move 跑完之間，要加進來的 shard 名稱（逗號分隔）：
+# 這段時間才出現的新 owner 也要照新的 ring 判斷要不要 pin
+SHARD_PENDING_KEY = "shard:pending"
+SHARD_PIN_REFRESH = 2.0
+_shard_pins = {"at": 0.0, "map": {}}
+
+
+def ring_hash(value):
+    return int(hashlib.md5(value.encode("utf-8")).hexdigest()[:16], 16)
+
+
+def build_ring(names):
+    return sorted(
+        (ring_hash(f"{name}#{i}"), name)
+        for name in names for i in range(RING_VNODES)
+    )
+
+
+SHARD_RING = build_ring(SHARDS)
+
+
+def ring_lookup(tag, ring=None):
+    ring = ring or SHARD_RING
+    i = bisect.bisect(ring, (ring_hash(tag), ""))
+    return ring[i % len(ring)][1]
+
+
+def shard_pins():
+    if len(SHARDS) == 1:
+        return {}
+    now = time.monotonic()
+    if now - _shard_pins["at"] > SHARD_PIN_REFRESH:
+        _shard_pins["map"] = directory.hgetall(SHARD_PINS_KEY)
+        _shard_pins["at"] = now
+    return _shard_pins["map"]
+
+
+def shard_for(owner_key):
+    """
+    回傳 (shard 名稱, 搬家目的地或 None)。
+    有 pin 就照 pin（還沒搬完的 owner 留在原本那台），沒有就看 ring。
+    """
+    return shard_for_tag(owner_tag(owner_key))
+
+
+def pin_new_owner(owner_key):
+    """
+    shards pin 之後才出現的 owner 沒被掃到：加了新 shard 之後會換位置的話，
+    現在就 pin 在目前這台，部署新設定後才不會跑去資料還沒搬過去的那台
+    """
+    pending = directory.get(SHARD_PENDING_KEY)
+    if not pending:
+        return
+    tag = owner_tag(owner_key)
+    current = shard_for_tag(tag)[0]
+    new_ring = build_ring(sorted(set(SHARDS) | set(pending.split(","))))
+    if ring_lookup(tag, new_ring) != current:
+        directory.hsetnx(SHARD_PINS_KEY, tag, current)
+
+
+def shard_for_tag(tag):
+    pin = shard_pins().get(tag)
+    if pin:
+        source, _, target = pin.partition(">")
+        return source, target or None
+    return ring_lookup(tag), None
+
+
+@app.before_request
+def bind_owner_shard():
+    """
+    把這個 request 的 r 綁到 owner 所在的 shard（rr 視情況綁到 replica）；
+    搬家中的 owner 暫停寫入。
+    """
+    owner_key = session.get("owner_key")
+    if not owner_key:
+        return None
+
+    name, moving_to = DIRECTORY_SHARD, None
+    if len(SHARDS) > 1:
+        name, moving_to = shard_for(owner_key)
+        g.redis = SHARDS[name]
+    g.shard = name
+
+    if request.method in READ_ONLY_METHODS:
+        replicas = REPLICAS.get(name)
+        if replicas and session.get("primary_until", 0) < time.time():
+            g.redis_read = random.choice(replicas)
+    elif moving_to:
+        return "資料搬家中，請過幾秒再試一次。", 503, {"Retry-After": "5"}
+    return None
+
+
+@app.after_request
+def pin_reads_to_primary(response):
+    """寫入之後短時間內都讀 primary，避免 replica 還沒跟上，畫面看不到剛剛的修改"""
+    if (REPLICAS and request.method not in READ_ONLY_METHODS
+            and session.get("owner_key")):
+        session["primary_until"] = time.time() + REPLICA_PIN_SECONDS
+    return response
+
+
+# -----------------------------------------------------
+# Redis 出狀況時的保護（circuit breaker + 首頁顯示舊資料）
+# -----------------------------------------------------
+# 連續 BREAKER_FAILURES 次連線錯誤 / 逾時，那台 shard 的 breaker 就打開：
+# 接下來 BREAKER_RESET_SECONDS 秒內的 request 不碰 Redis，直接回應
+# （首頁顯示上一次成功的畫面，寫入直接告訴使用者沒存到），worker 不會全部卡在等逾時。
+# 時間到了放一個 request 進去試，成功就恢復。
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "10"))
+# 不會碰到 Redis 的頁面，breaker 打開時照常服務
+BREAKER_EXEMPT = ("static", "root", "login", "logout")
+# 這些 route 回 JSON 錯誤
+JSON_ENDPOINTS = ("sync", "sync_checkins", "api_search", "import_data", "rot_history",
+                  "api_leaderboard")
+# 每個 worker 最多記幾個 owner 的首頁、最多顯示多久以前的
+STALE_HOME_MAX = 1024
+STALE_HOME_MAX_AGE = 86400
+
+
+class CircuitBreaker:
+    def __init__(self, failures, reset_seconds):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._count = 0
+        self._opened_at = None
+        self._trial_at = None
+
+    def allow(self):
+        """關著就放行；打開時冷卻時間到了放一個 request 進去試（half-open）"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.reset_seconds:
+                return False
+            if self._trial_at is not None and now - self._trial_at < self.reset_seconds:
+                return False  # 已經有一個在試了
+            self._trial_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._count = 0
+            self._opened_at = None
+            self._trial_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._count += 1
+            if self._trial_at is not None or self._count >= self.failures:
+                self._opened_at = time.monotonic()
+            self._trial_at = None
+
+
+BREAKERS = {name: CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET_SECONDS)
+            for name in SHARDS}
+_stale_home = OrderedDict()
+_stale_home_lock = threading.Lock()
+
+
+def current_breaker():
+    return BREAKERS[g.get("shard", DIRECTORY_SHARD)]
+
+
+def remember_home(owner_key, view):
+    """記下這個 owner 最後一次成功的首頁資料"""
+    with _stale_home_lock:
+        _stale_home[owner_key] = (time.time(), view)
+        _stale_home.move_to_end(owner_key)
+        while len(_stale_home) > STALE_HOME_MAX:
+            _stale_home.popitem(last=False)
+
+
+def render_stale_home(owner_key):
+    with _stale_home_lock:
+        item = _stale_home.get(owner_key)
+    if not item or time.time() - item[0] > STALE_HOME_MAX_AGE:
+        return None
+    saved_at, view = item
+    stale_since = datetime.fromtimestamp(saved_at, TZ).strftime("%m-%d %H:%M")
+    return render_template("index.html", stale_since=stale_since, **view)
+
+
+def storage_unavailable():
+    """Redis 連不上時的回應：首頁給舊資料，其他直接失敗（不要讓使用者一直等）"""
+    headers = {"Retry-After": str(int(BREAKER_RESET_SECONDS))}
+    owner_key = session.get("owner_key")
+    if request.endpoint == "index" and owner_key:
+        page = render_stale_home(owner_key)
+        if page is not None:
+            return page, 200, headers
+    if request.endpoint in JSON_ENDPOINTS:
+        return jsonify({"error": "storage unavailable"}), 503, headers
+    if request.method not in READ_ONLY_METHODS:
+        return "資料庫暫時連不上，這次的修改沒有存到，請稍後再試一次。", 503, headers
+    return "資料庫暫時連不上，請稍後再試一次。", 503, headers
+
+
+@app.before_request
+def check_breaker():
+    if STORAGE_BACKEND != "redis" or request.endpoint in BREAKER_EXEMPT:
+        return None
+    if not current_breaker().allow():
+        return storage_unavailable()
+    g.breaker_checked = True
+    return None
+
+
+@app.after_request
+def close_breaker(response):
+    if g.get("breaker_checked") and g.get("redis_used") and response.status_code < 500:
+        current_breaker().record_success()
+    return response
+
+
+@app.errorhandler(redis.exceptions.ConnectionError)
+@app.errorhandler(redis.exceptions.TimeoutError)
+def handle_redis_down(error):
+    current_breaker().record_failure()
+    return storage_unavailable()
+
+
+# -----------------------------------------------------
+# 寫入限流（每個 owner、每個 route 一個 token bucket）
+# -----------------------------------------------------
+# 寫入的 route 每次要花一個 token，桶子空了直接回 429，不碰任何資料 key。
+# 設定格式「次數/秒數」：容量是「次數」，每「秒數」秒補滿。
+#   RATE_LIMIT_DEFAULT=60/60                      所有寫入 route 的預設
+#   RATE_LIMITS=add_task=30/60,import_data=off    個別 route（endpoint 名稱）覆蓋預設
+# RATE_LIMIT_DEFAULT 設成 off 就只限 RATE_LIMITS 裡列出來的 route。
+# 桶子放在 owner 那台 shard 上，到補滿的時間就自動過期。sqlite 模式不限流。
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "60/60")
+RATE_LIMITS = os.getenv("RATE_LIMITS", "add_task=30/60,checkin_task=30/60,import_data=5/3600")
+# 換 owner / 登出一定要能用
+RATE_LIMIT_EXEMPT = ("static", "set_owner", "logout")
+
+
+def parse_rate(spec):
+    """ "30/60" → (容量 30, 每毫秒補幾個)；"off" / 空字串 → None """
+    spec = spec.strip()
+    if not spec or spec == "off":
+        return None
+    count, _, seconds = spec.partition("/")
+    count, seconds = int(count), float(seconds or 1)
+    if count <= 0 or seconds <= 0:
+        raise RuntimeError(f"限流設定看不懂：{spec}")
+    return count, count / (seconds * 1000)
+
+
+def parse_rate_limits(raw):
+    limits = {}
+    for item in raw.split(","):
+        if item.strip():
+            endpoint, _, spec = item.partition("=")
+            limits[endpoint.strip()] = parse_rate(spec)
+    return limits
+
+
+DEFAULT_RATE = parse_rate(RATE_LIMIT_DEFAULT)
+ROUTE_RATES = parse_rate_limits(RATE_LIMITS)
+
+# KEYS: bucket（hash：t = 上次扣的時間 ms，n = 剩幾個 token）
+# ARGV: 現在時間 ms, 容量, 每毫秒補幾個, 這次要扣幾個
+# 回傳 0 = 放行；不然回傳還要等幾毫秒（被擋下的不寫任何東西）
+RATE_LIMIT_LUA = """
+local now = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local rate = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 't', 'n')
+local tokens = capacity
+if state[1] then
+  local elapsed = math.max(0, now - tonumber(state[1]))
+  tokens = math.min(capacity, tonumber(state[2]) + elapsed * rate)
+end
+if tokens < cost then
+  return math.ceil((cost - tokens) / rate)
+end
+tokens = tokens - cost
+redis.call('HSET', KEYS[1], 't', ARGV[1], 'n', tostring(tokens))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate))
+return 0
+"""
+rate_limit_script = register_script(RATE_LIMIT_LUA)
+
+
+def rate_limit_key(owner_key, endpoint):
+    return f"ratelimit:{owner_tag(owner_key)}:{endpoint}"
+
+
+def route_rate(endpoint):
+    return ROUTE_RATES.get(endpoint, DEFAULT_RATE)
+
+
+def rate_limited(retry_ms):
+    headers = {"Retry-After": str(max(1, -(-retry_ms // 1000)))}
+    if request.endpoint in JSON_ENDPOINTS:
+        return jsonify({"error": "rate limited"}), 429, headers
+    return "操作太頻繁了，請稍等一下再試。", 429, headers
+
+
+@app.before_request
+def check_rate_limit():
+    owner_key = session.get("owner_key")
+    if (STORAGE_BACKEND != "redis" or not owner_key
+            or request.method in READ_ONLY_METHODS
+            or request.endpoint in RATE_LIMIT_EXEMPT):
+        return None
+    rate = route_rate(request.endpoint)
+    if rate is None:
+        return None
+    capacity, per_ms = rate
+    retry_ms = rate_limit_script(
+        keys=[rate_limit_key(owner_key, request.endpoint)],
+        args=[int(time.time() * 1000), capacity, per_ms, 1],
+        client=r,
+    )
+    if retry_ms:
+        return rate_limited(int(retry_ms))
+    return None
+
+
+# -----------------------------------------------------
+# 靜態檔案（指紋 + 長期快取）/ 回應壓縮
+# -----------------------------------------------------
+# url_for('static', ...) 會自動帶上 ?v=<檔案內容雜湊>，檔案一改網址就跟著變，
+# 所以帶 v 的請求可以讓瀏覽器快取一年、期間完全不用回來問（immutable）。
+STATIC_MAX_AGE = 365 * 86400
+# 小於這個大小就不壓縮（壓了也省不到多少）
+COMPRESS_MIN_BYTES = 500
+COMPRESS_MIMETYPES = (
+    "text/html", "text/css", "application/json",
+    "application/javascript", "text/javascript", "image/svg+xml",
+)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# 頁面上的圖最大只顯示到 140px，3 倍螢幕也只要 420px
+IMAGE_MAX_SIDE = 420
+
+try:
+    import brotli
+except ImportError:  # 沒裝 brotli 就只用 gzip
+    brotli = None
+
+
+@lru_cache(maxsize=256)
+def file_digest(path, mtime_ns):
+    """mtime 也當成 cache key，開發時改了檔案會重新算"""
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+
+def static_version(filename):
+    path = safe_join(app.static_folder, filename)
+    try:
+        return file_digest(path, os.stat(path).st_mtime_ns)
+    except (OSError, TypeError):
+        return None
+
+
+@app.url_defaults
+def fingerprint_static(endpoint, values):
+    if endpoint == "static" and "v" not in values:
+        version = static_version(values.get("filename", ""))
+        if version:
+            values["v"] = version
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+@lru_cache(maxsize=64)
+def compressed_static(path, mtime_ns, encoding):
+    """CSS / JS 壓縮過的內容留在記憶體，不用每個 request 重壓"""
+    with open(path, "rb") as f:
+        return compress(f.read(), encoding)
+
+
+def pick_encoding():
+    if brotli is not None and request.accept_encodings["br"]:
+        return "br"
+    if request.accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress_response(response):
+    """HTML / JSON / CSS / JS 用 brotli（有裝的話）或 gzip 壓縮"""
+    if (response.status_code != 200
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return
+    encoding = pick_encoding()
+    if encoding is None:
+        return
+
+    if request.endpoint == "static":
+        path = safe_join(app.static_folder, request.view_args["filename"])
+        stat = os.stat(path)
+        if stat.st_size < COMPRESS_MIN_BYTES:
+            return
+        response.direct_passthrough = False
+        response.set_data(compressed_static(path, stat.st_mtime_ns, encoding))
+    elif response.is_streamed:
+        return  # /export 這種邊產生邊送的不壓
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return
+        response.set_data(compress(data, encoding))
+
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    # byte range 對不上壓縮過的內容
+    response.headers.pop("Accept-Ranges", None)
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+        # send_file 是拿原本的 ETag 比 If-None-Match 的，換成壓縮版的 ETag 之後要再比一次，
+        # 不然瀏覽器帶著 "-gzip" 的 ETag 回來問永遠拿不到 304
+        response.make_conditional(request.environ)
+
+
+@app.after_request
+def cache_and_compress(response):
+    if request.endpoint == "static" and request.args.get("v"):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_MAX_AGE
+        response.cache_control.immutable = True
+    compress_response(response)
+    return response
+
+
+@app.cli.command("build-images")
+def build_images_command():
+    """
+    把 static/img 的 PNG 縮小轉成 WebP（需要 Pillow，只有改圖的時候要跑）。
+    原本的 PNG 留著，給不支援 WebP 的瀏覽器用。
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        raise click.ClickException("需要 Pillow：pip install Pillow")
+
+    img_dir = os.path.join(app.static_folder, "img")
+    for name in sorted(os.listdir(img_dir)):
+        stem, ext = os.path.splitext(name)
+        if ext != ".png" or stem.endswith("-64"):
+            continue
+        src = os.path.join(img_dir, name)
+        with Image.open(src) as im:
+            im.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE), Image.LANCZOS)
+            dest = os.path.join(img_dir, f"{stem}.webp")
+            im.save(dest, "WEBP", quality=82, method=6)
+            if stem == "favicon":
+                # 分頁上的小圖示，64px 就夠
+                im.thumbnail((64, 64), Image.LANCZOS)
+                im.save(os.path.join(img_dir, "favicon-64.png"), optimize=True)
+        click.echo(f"{name}: {os.path.getsize(src)} → {os.path.getsize(dest)} bytes")
+
+
+# -----------------------------------------------------
+# 使用者相關小工具
+# -----------------------------------------------------
 def get_current_owner():
     """
     回傳 (owner_key, display_name)
@@ -271,6 +1131,469 @@ def get_current_owner():
     return session.get("owner_key"), session.get("display_name")
 
 
+# -----------------------------------------------------
+# 同步用的變更序號（給離線用戶端 /sync 用）
+# -----------------------------------------------------
+# 今日救援 queue 有變動時，用這個保留字記在 changes 裡（任務 ID 都是數字，不會撞）
+SYNC_QUEUE_MEMBER = "queue"
+
+# 一次拿一個新序號，並把有變動 / 被刪掉的 ID 記到對應的 sorted set（score = 序號）
+# KEYS: seq, changes, tombstones
+# ARGV: 變動筆數 n, 變動的 ID * n, 刪除的 ID ...
+SYNC_TOUCH_LUA = """
+local seq = redis.call('INCR', KEYS[1])
+local n = tonumber(ARGV[1])
+for i = 2, n + 1 do
+  redis.call('ZADD', KEYS[2], seq, ARGV[i])
+  redis.call('ZREM', KEYS[3], ARGV[i])
+end
+for i = n + 2, #ARGV do
+  redis.call('ZREM', KEYS[2], ARGV[i])
+  redis.call('ZADD', KEYS[3], seq, ARGV[i])
+end
+return seq
+"""
+sync_touch_script = register_script(SYNC_TOUCH_LUA)
+
+
+def get_sync_keys(owner_key):
+    """
+    回傳 (seq_key, changes_key, tombstones_key)
+
+    - seq_key：這個 owner 的單調遞增變更序號
+    - changes_key：有變動的任務 ID → 最後一次變動的序號
+    - tombstones_key：被完成 / 刪除的任務 ID → 刪除時的序號
+    """
+    tag = owner_tag(owner_key)
+    return (
+        f"sync:{tag}:seq",
+        f"sync:{tag}:changes",
+        f"sync:{tag}:tombstones",
+    )
+
+
+def sync_seen_key(owner_key):
+    """離線打卡去重：client_id → 這筆記錄的到期時間（一個 owner 一個 sorted set，搬家時跟著搬）"""
+    return f"sync:{owner_tag(owner_key)}:seen"
+
+
+def legacy_seen_key(owner_key, client_id):
+    """舊版一個 client_id 一個 key，SYNC_DEDUP_TTL 之後全部過期，到時候這個可以拿掉"""
+    return f"sync:{owner_tag(owner_key)}:seen:{client_id}"
+
+
+def record_change(client, owner_key, changed=(), deleted=()):
+    """
+    記一筆變更（所有會改資料的 route 都要呼叫）。
+
+    client 可以是 r 或 pipeline，傳 pipeline 時會跟著同一個交易一起送出。
+    """
+    changed = [str(x) for x in changed]
+    deleted = [str(x) for x in deleted]
+    if not changed and not deleted:
+        return None
+    return sync_touch_script(
+        keys=list(get_sync_keys(owner_key)),
+        args=[len(changed)] + changed + deleted,
+        client=client,
+    )
+
+
+def task_rot_info(data):
+    """從 task hash 算目前腐爛度（calc_rot_info 的參數全部從 hash 拿）"""
+    return calc_rot_info(
+        data.get("created_at", time.time()),
+        data.get("deadline_ts", ""),
+        data.get("is_routine", "0"),
+        data.get("initial_rot", 0),
+        int(data.get("interval_days", 0) or 0),
+        data.get("last_checkin_ts"),
+    )
+
+
+# 更新排行榜上的腐爛度，同時把差值加到 owner meta 的 rot_sum（腐爛度總和）/
+# rot_critical（💥 任務數），全站排行榜只要看這兩個數字，不用再掃任務
+# KEYS: rot_rank, owner meta
+# ARGV: 任務 ID, 新腐爛度（"-" = 移除）, 任務 ID, 新腐爛度, ...
+ROT_RANK_LUA = """
+local dsum, dcrit = 0, 0
+for i = 1, #ARGV, 2 do
+  local old = tonumber(redis.call('ZSCORE', KEYS[1], ARGV[i]) or 0)
+  local new = 0
+  if ARGV[i + 1] == '-' then
+    redis.call('ZREM', KEYS[1], ARGV[i])
+  else
+    new = tonumber(ARGV[i + 1])
+    redis.call('ZADD', KEYS[1], new, ARGV[i])
+  end
+  dsum = dsum + new - old
+  if new >= 90 then dcrit = dcrit + 1 end
+  if old >= 90 then dcrit = dcrit - 1 end
+end
+if dsum ~= 0 then redis.call('HINCRBY', KEYS[2], 'rot_sum', dsum) end
+if dcrit ~= 0 then redis.call('HINCRBY', KEYS[2], 'rot_critical', dcrit) end
+return {dsum, dcrit}
+"""
+rot_rank_script = register_script(ROT_RANK_LUA)
+
+
+def set_rot_levels(pipe, owner_key, levels):
+    """levels = {任務 ID: 腐爛度，None 代表移除}"""
+    if not levels:
+        return
+    args = []
+    for tid, level in levels.items():
+        args += [tid, "-" if level is None else level]
+    rot_rank_script(
+        keys=[rot_rank_key(owner_key), owner_meta_key(owner_key)],
+        args=args,
+        client=pipe,
+    )
+    mark_rot_dirty(owner_key)
+
+
+def rot_next_change(data, now):
+    """
+    腐爛度下一次「可能」改變的時間，不會再變就回傳 None。
+    分段跟 calc_rot_info 一樣；排得早一點沒關係，到時候重算發現沒變就再排下一次。
+    """
+    try:
+        created_at = float(data.get("created_at") or now)
+        base_ts = float(data.get("last_checkin_ts") or created_at)
+        deadline_ts = float(data["deadline_ts"]) if data.get("deadline_ts") else None
+        interval_days = max(int(data.get("interval_days") or 0), 0) or 1
+    except (TypeError, ValueError):
+        return now + 3600  # 舊資料的 ISO 字串：每小時重算一次就好
+
+    checkpoints = [created_at + ROT_GRACE_HOURS * 3600]
+    if str(data.get("is_routine", "0")) == "1" or deadline_ts is None:
+        checkpoints += [base_ts + interval_days * 86400 * k for k in (0.3, 1, 3)]
+    else:
+        checkpoints += [deadline_ts + hours * 3600 for hours in (-48, 0, 72)]
+    upcoming = [ts for ts in checkpoints if ts > now]
+    return min(upcoming) if upcoming else None
+
+
+def rank_tasks(pipe, owner_key, tasks, now=None):
+    """
+    tasks = [(tid, data), ...]：更新排行榜上的腐爛度，
+    並在 rot_due 記下次要重算的時間（rot-snapshot 只重算到期的任務）
+    """
+    now = now or time.time()
+    levels, due = {}, {}
+    for tid, data in tasks:
+        levels[tid] = task_rot_info(data)["level"]
+        next_change = rot_next_change(data, now)
+        due[tid] = float("inf") if next_change is None else next_change
+    if levels:
+        set_rot_levels(pipe, owner_key, levels)
+        pipe.zadd(rot_due_key(owner_key), due)
+
+
+def fetch_tasks(owner_key, task_ids, client=None):
+    """用一個 pipeline 把多個 task hash 一次讀回來（已解碼），回傳 [(tid, data), ...]"""
+    task_ids = list(task_ids)
+    if not task_ids:
+        return []
+    pipe = (client or r).pipeline(transaction=False)
+    for tid in task_ids:
+        pipe.hgetall(task_key(owner_key, tid))
+    return [
+        (tid, decode_task(owner_key, tid, raw))
+        for tid, raw in zip(task_ids, pipe.execute())
+    ]
+
+
+# -----------------------------------------------------
+# 任務 hash 的精簡編碼（v=1）
+# -----------------------------------------------------
+# 以前每個 task hash 都存十個完整欄位名稱、created_at 這種 float 字串，
+# owner 欄位還每筆都重複一次「名字#密語」。新格式：
+#   - 欄位名稱改成一個字母（TASK_FIELD_CODES）
+#   - 時間只存整數秒
+#   - 0 / 空字串的欄位不存，讀的時候補回預設值
+#   - owner 換成很短的 owner ID（o），task id 本來就在 key 裡，不再存
+# 讀取一律經過 decode_task，舊格式（沒有 v）原樣回傳，所以兩種格式可以並存；
+# 任何寫入都會整個改存成新格式，`flask compact-tasks` 把剩下的舊資料一次轉完。
+# Stream entry 也是：owner 改存 o（owner ID），讀的時候 decode_entry 換回來。
+TASK_CODEC_VERSION = "1"
+TASK_FIELD_CODES = {
+    "title": "t",
+    "category": "c",
+    "created_at": "a",
+    "deadline_ts": "d",
+    "is_routine": "r",
+    "initial_rot": "i",
+    "interval_days": "n",
+    "last_checkin_ts": "k",
+}
+# 等於預設值就不存
+TASK_FIELD_DEFAULTS = {
+    "deadline_ts": "",
+    "is_routine": "0",
+    "initial_rot": "0",
+    "interval_days": "0",
+    "last_checkin_ts": "",
+}
+EPOCH_FIELDS = ("created_at", "deadline_ts", "last_checkin_ts")
+INT_FIELDS = ("is_routine", "initial_rot", "interval_days")
+
+# owner ID 計數器（directory 上），每個 owner 的 ID 記在 owner:{tag} 的 oid
+OWNER_ID_KEY = "owner:id"
+_owner_ids = {}
+
+
+def owner_id(owner_key, client=None):
+    """owner 的短 ID（字串），第一次用到時配發；配發過就不會變，所以直接留在記憶體"""
+    oid = _owner_ids.get(owner_key)
+    if oid is None:
+        client = client or r
+        meta_key = owner_meta_key(owner_key)
+        oid = client.hget(meta_key, "oid")
+        if oid is None:
+            # 兩個 worker 同時配發的話，以先寫進去的為準
+            client.hsetnx(meta_key, "oid", directory.incr(OWNER_ID_KEY))
+            client.hsetnx(meta_key, "owner", owner_key)
+            oid = client.hget(meta_key, "oid")
+        if len(_owner_ids) >= 4096:
+            _owner_ids.clear()
+        _owner_ids[owner_key] = oid
+    return oid
+
+
+def encode_task(owner_key, data):
+    """任務 dict（完整欄位名稱）→ 要寫進 Redis 的精簡 hash"""
+    encoded = {"v": TASK_CODEC_VERSION, "o": owner_id(owner_key)}
+    for name, code in TASK_FIELD_CODES.items():
+        value = data.get(name)
+        if value is None:
+            value = ""
+        if value != "" and name in EPOCH_FIELDS:
+            try:
+                value = int(float(value))
+            except (TypeError, ValueError):
+                pass  # 舊資料的 ISO 字串，原樣存
+        elif name in INT_FIELDS:
+            try:
+                value = int(float(value or 0))
+            except (TypeError, ValueError):
+                value = 0
+        if str(value) == TASK_FIELD_DEFAULTS.get(name):
+            continue
+        encoded[code] = value
+    return encoded
+
+
+def decode_task(owner_key, task_id, raw):
+    """Redis 裡的 task hash → 完整欄位名稱的 dict（舊格式原樣回傳）"""
+    if not raw or raw.get("v") != TASK_CODEC_VERSION:
+        return raw
+    data = {
+        name: raw.get(code, TASK_FIELD_DEFAULTS.get(name, ""))
+        for name, code in TASK_FIELD_CODES.items()
+    }
+    data["id"] = str(task_id)
+    data["owner"] = owner_key if raw.get("o") == owner_id(owner_key) else ""
+    return data
+
+
+def decode_entry(owner_key, fields):
+    """stream entry 的 o（owner ID）換回 owner（舊 entry 本來就是 owner）"""
+    if "o" not in fields:
+        return fields
+    fields = dict(fields)
+    oid = fields.pop("o")
+    fields["owner"] = owner_key if oid == owner_id(owner_key) else ""
+    return fields
+
+
+def write_task(pipe, owner_key, task_id, data):
+    """整個 hash 重寫成新格式（舊格式的欄位一起清掉）；放在交易裡別人才不會讀到一半"""
+    key = task_key(owner_key, task_id)
+    pipe.delete(key)
+    pipe.hset(key, mapping=encode_task(owner_key, data))
+
+
+# -----------------------------------------------------
+# 全文搜尋（任務標題 + 打卡備註）
+# -----------------------------------------------------
+# 中文沒有空白可以斷詞：連續的中日韓文字切成「單字 + 兩兩一組（bigram）」，
+# 英文 / 數字就是整個字（轉小寫）。
+# 查詢時中文只用 bigram（一個字的查詢才用單字），結果就是「每個 token 都有出現」的任務。
+#
+# Redis：每個 token 一個 set（search:{tag}:t:<token> → 任務 ID），
+# 打卡備註的 token 另外記在 search:{tag}:notes:<任務 ID>，
+# 改標題 / 刪除任務時才知道哪些 token 還要留著。
+SEARCH_MAX_RESULTS = 50
+# 查詢字串最多取幾個 token（太長的查詢只看前面）
+SEARCH_MAX_TOKENS = 16
+SEARCH_RUN_RE = re.compile(
+    r"[0-9a-z]+"
+    # 假名、中日韓漢字（含擴充 A、相容字）、韓文
+    r"|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+"
+)
+
+
+def search_runs(text):
+    return SEARCH_RUN_RE.findall((text or "").lower())
+
+
+def tokenize(text):
+    """建索引用：回傳 token set"""
+    tokens = set()
+    for run in search_runs(text):
+        if run.isascii():
+            tokens.add(run)
+            continue
+        tokens.update(run)
+        tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def query_tokens(query):
+    """查詢用：回傳不重複的 token list"""
+    tokens = []
+    for run in search_runs(query):
+        if run.isascii() or len(run) == 1:
+            candidates = [run]
+        else:
+            candidates = [run[i:i + 2] for i in range(len(run) - 1)]
+        for token in candidates:
+            if token not in tokens:
+                tokens.append(token)
+    return tokens[:SEARCH_MAX_TOKENS]
+
+
+def search_token_key(owner_key, token):
+    return f"search:{owner_tag(owner_key)}:t:{token}"
+
+
+def search_notes_key(owner_key, task_id):
+    return f"search:{owner_tag(owner_key)}:notes:{task_id}"
+
+
+def index_tokens(pipe, owner_key, task_id, tokens):
+    for token in tokens:
+        pipe.sadd(search_token_key(owner_key, token), task_id)
+
+
+def unindex_tokens(pipe, owner_key, task_id, tokens):
+    for token in tokens:
+        pipe.srem(search_token_key(owner_key, token), task_id)
+
+
+def index_note(pipe, owner_key, task_id, note):
+    """打卡備註的 token 加進索引，也記到這個任務的 notes set"""
+    tokens = tokenize(note)
+    if tokens:
+        pipe.sadd(search_notes_key(owner_key, task_id), *tokens)
+        index_tokens(pipe, owner_key, task_id, tokens)
+
+
+# -----------------------------------------------------
+# 寫入小工具：單筆 route 跟 /bulk 共用，全部只往 pipeline 裡塞指令
+# -----------------------------------------------------
+def checkin_tasks(pipe, owner_key, owned, note, now_ts):
+    """owned = [(tid, data), ...]，每個任務打一次卡"""
+    checked = []
+    for tid, data in owned:
+        title = data.get("title", "")
+        data = dict(data, last_checkin_ts=now_ts)
+        write_task(pipe, owner_key, tid, data)
+        checked.append((tid, data))
+        pipe.xadd(stream_key(owner_key, "task_checkin"), {
+            "task_id": tid,
+            "title": title,
+            "note": note,
+            "o": owner_id(owner_key),
+            "ts": str(int(now_ts)),
+        })
+        pipe.xadd(stream_key(owner_key, "task_events"), {
+            "type": "checkin",
+            "task_id": tid,
+            "title": title,
+            "o": owner_id(owner_key),
+            "ts": str(int(now_ts)),
+        })
+        index_note(pipe, owner_key, tid, note)
+    rank_tasks(pipe, owner_key, checked)
+    record_change(pipe, owner_key, changed=[tid for tid, _ in owned])
+
+
+def enqueue_tasks(pipe, owner_key, owned, queue_items, now_ts):
+    """
+    把還沒在今日救援 queue 裡的任務加到最後面。
+    queue_items 是目前 queue 的內容（呼叫端先讀好），回傳實際加入的 ID。
+    """
+    queue_key, _ = get_queue_keys(owner_key)
+    in_queue = set(queue_items)
+    added = []
+    for tid, data in owned:
+        if tid in in_queue:
+            continue
+        in_queue.add(tid)
+        added.append(tid)
+        pipe.xadd(stream_key(owner_key, "task_events"), {
+            "type": "queue_add",
+            "task_id": tid,
+            "title": data.get("title", "") or "",
+            "o": owner_id(owner_key),
+            "ts": str(int(now_ts)),
+        })
+    if added:
+        pipe.rpush(queue_key, *added)
+        record_change(pipe, owner_key, changed=[SYNC_QUEUE_MEMBER])
+    return added
+
+
+def remove_tasks(pipe, owner_key, owned, current_id, now_ts, done, note_tokens=None):
+    """
+    完成（done=True）或刪除任務：移出清單 / 索引 / 排行榜 / queue / 搜尋索引。
+    current_id 是目前抽中的救援任務、note_tokens 是 {任務 ID: 備註 token}
+    （都是呼叫端先讀好），被移掉的話一起清掉。
+    """
+    note_tokens = note_tokens or {}
+    queue_key, current_key = get_queue_keys(owner_key)
+    removed = []
+    for tid, data in owned:
+        title = data.get("title", "")
+        category = data.get("category", "other")
+        removed.append(tid)
+
+        if done:
+            pipe.xadd(stream_key(owner_key, "task_done"), {
+                "task_id": tid,
+                "title": title,
+                "category": category,
+                "o": owner_id(owner_key),
+                "ts": str(int(now_ts)),
+            })
+
+        pipe.delete(task_key(owner_key, tid))
+        pipe.lrem(owner_tasks_key(owner_key), 0, tid)
+        pipe.srem(cat_index_key(owner_key, category), tid)
+        pipe.zrem(rot_due_key(owner_key), tid)
+        pipe.lrem(queue_key, 0, tid)
+        unindex_tokens(pipe, owner_key, tid,
+                       tokenize(title) | set(note_tokens.get(tid, ())))
+        pipe.delete(search_notes_key(owner_key, tid))
+
+        if not done:
+            pipe.xadd(stream_key(owner_key, "task_events"), {
+                "type": "deleted",
+                "task_id": tid,
+                "title": title,
+                "o": owner_id(owner_key),
+                "ts": str(int(now_ts)),
+            })
+
+    set_rot_levels(pipe, owner_key, dict.fromkeys(removed))
+    if current_id and current_id in removed:
+        pipe.delete(current_key)
+    record_change(pipe, owner_key, changed=[SYNC_QUEUE_MEMBER], deleted=removed)
+    return removed
+
+
 # -----------------------------------------------------
 # 登入頁 / 根路徑
 # -----------------------------------------------------
@@ -338,14 +1661,15 @@ def set_owner():
             last_name=name,
         )
 
-    # Redis 裡用 user:<name> 來記「這個名字的密語」
-    user_key = f"user:{name}"
-    stored_secret = r.get(user_key)
+    # 記「這個名字的密語」（Redis 是 user:<name>）
+    stored_secret = store.get_user_secret(name)
 
     if stored_secret is None:
-        # 第一次使用這個名字 → 註冊並綁定密語
-        r.set(user_key, secret)
-    else:
+        # 第一次使用這個名字 → 註冊並綁定密語（同時有人搶註的話以先寫入的為準）
+        if not store.create_user(name, secret):
+            stored_secret = store.get_user_secret(name)
+
+    if stored_secret is not None:
         # 名字已存在，但密語不同 → 不允許重複名字
         if stored_secret != secret:
             return render_template(
@@ -360,12 +1684,54 @@ def set_owner():
     # 寫入 session
     session["owner_key"] = owner_key      # 後端 / Redis 用
     session["display_name"] = name        # 前端顯示用
+    session.pop("layout", None)           # 換人了，重新確認 key 版本
 
     # 登入成功 → 去首頁 /home
     return redirect(url_for("index"))
 
 
 
+# -----------------------------------------------------
+# 任務卡片：macro + 片段快取
+# -----------------------------------------------------
+# 卡片 HTML 只跟卡片上顯示的欄位有關（標題、分類、腐爛度、今天打卡了沒…），
+# 欄位一樣就直接拿上次 render 好的，不用每次重跑 macro。
+TASK_CARD_CACHE_MAX = int(os.getenv("TASK_CARD_CACHE_MAX", "5000"))
+
+_task_cards = OrderedDict()
+_task_cards_lock = threading.Lock()
+
+
+def task_card_key(task):
+    """
+    (任務版本, 腐爛度) 當 key：直接用卡片上所有欄位的值，
+    任務被改過、腐爛度升級、跨日打卡狀態變了，key 都會跟著變
+    """
+    return tuple(task.items())
+
+
+def clear_task_cards():
+    with _task_cards_lock:
+        _task_cards.clear()
+
+
+@app.template_global()
+def task_card(task):
+    key = task_card_key(task)
+    with _task_cards_lock:
+        html = _task_cards.get(key)
+        if html is not None:
+            _task_cards.move_to_end(key)
+            return html
+
+    html = get_template_attribute("_task_card.html", "task_card")(task)
+    with _task_cards_lock:
+        _task_cards[key] = html
+        while len(_task_cards) > TASK_CARD_CACHE_MAX:
+            _task_cards.popitem(last=False)
+    return html
+
+
 # -----------------------------------------------------
 # 首頁（登入後）
 # -----------------------------------------------------
@@ -377,39 +1743,16 @@ def index():
     if not owner_key:
         return redirect(url_for("login"))
 
-    # 讀出所有任務 ID（所有人共用 list，等等用 owner_key 過濾）
-    task_ids = r.lrange("tasks", 0, -1)
-
+    # 首頁只讀不寫（Redis 會走 replica），一次讀回這個 owner 的所有任務
     tasks = []
-    tasks_by_id = {}
-
-    category_mapping = {
-        "作業": "homework",
-        "考試": "exam",
-        "生活": "life",
-        "習慣": "habit",
-        "其他": "other",
-    }
-    categories = ["homework", "exam", "life", "habit", "other"]
 
-    for tid in task_ids:
-        key = f"task:{tid}"
-        data = r.hgetall(key)
-        if not data:
-            continue
-
-        task_owner = data.get("owner")
-        # 只顯示屬於目前登入者的任務
-        if task_owner != owner_key:
-            continue
+    category_mapping = CATEGORY_MAPPING
+    categories = CATEGORIES
 
-        # 正規化分類（舊資料如果是中文，改成英文代碼）
+    for tid, data in store.list_tasks(owner_key):
+        # 正規化分類（舊資料如果是中文，顯示時換成英文代碼；搬家時已經寫回）
         raw_cat = data.get("category", "other")
-        cat = raw_cat
-        if raw_cat in category_mapping:
-            cat = category_mapping[raw_cat]
-            if cat != raw_cat:
-                r.hset(key, "category", cat)
+        cat = category_mapping.get(raw_cat, raw_cat)
 
         interval_days = int(data.get("interval_days", 0) or 0)
         last_checkin_ts = data.get("last_checkin_ts")
@@ -442,59 +1785,39 @@ def index():
         }
 
         tasks.append(task_obj)
-        tasks_by_id[tid] = task_obj
 
     # 依照腐爛程度排序（越臭越前面）
     tasks.sort(key=lambda t: t["rot_level"], reverse=True)
 
     # -----------------------------------------------------
-    # 自動重建分類索引（Set Index）→ 跟 owner_key 綁在一起
+    # 分類數量：任務都已經讀出來了，直接數（分類索引由寫入時維護）
     # -----------------------------------------------------
-    for c in categories:
-        r.delete(f"idx:{owner_key}:cat:{c}")
-
+    category_counts = {c: 0 for c in categories}
     for t in tasks:
-        cat = t["category"]
-        if cat not in categories:
-            cat = "other"
-        r.sadd(f"idx:{owner_key}:cat:{cat}", t["id"])
-
-    category_counts = {
-        c: r.scard(f"idx:{owner_key}:cat:{c}") for c in categories
-    }
+        cat = t["category"] if t["category"] in category_counts else "other"
+        category_counts[cat] += 1
     total_tasks = len(tasks)
 
     # -----------------------------------------------------
-    # Sorted Set：最臭任務排行榜（每個 owner_key 一份）
+    # 最臭任務排行榜：tasks 已經照腐爛度排好，取前三名
+    # （rot_rank sorted set 由寫入時維護，這裡用的是剛算好的最新腐爛度）
     # -----------------------------------------------------
-    rot_rank_key = f"rot_rank:{owner_key}"
-    pipe = r.pipeline(transaction=False)
-    pipe.delete(rot_rank_key)
-    for tid, t in tasks_by_id.items():
-        pipe.zadd(rot_rank_key, {tid: t["rot_level"]})
-    pipe.execute()
-
-    top_rot_tasks = []
-    top_raw = r.zrevrange(rot_rank_key, 0, 2, withscores=True)
-    for tid, score in top_raw:
-        t = tasks_by_id.get(tid)
-        if t:
-            top_rot_tasks.append({
-                "id": tid,
-                "title": t["title"],
-                "rot_level": int(score),
-                "category": t["category"],
-            })
+    top_rot_tasks = [
+        {
+            "id": t["id"],
+            "title": t["title"],
+            "rot_level": t["rot_level"],
+            "category": t["category"],
+        }
+        for t in tasks[:3]
+    ]
 
     # -----------------------------------------------------
     # Streams：最近操作紀錄（含打卡）→ 只看自己的 owner_key
     # -----------------------------------------------------
-    events_raw = r.xrevrange("task_events", max="+", min="-", count=100)
+    events_raw = store.recent_feed(owner_key, "task_events", 100)
     events = []
     for ev_id, fields in events_raw:
-        if fields.get("owner") != owner_key:
-            continue
-
         ev_type = fields.get("type", "")
         title = fields.get("title")
         task_id = fields.get("task_id")
@@ -536,12 +1859,9 @@ def index():
     # -----------------------------------------------------
     # 完成任務紀錄（另一條 Streams）→ 只看自己的 owner_key
     # -----------------------------------------------------
-    done_raw = r.xrevrange("task_done", max="+", min="-", count=50)
+    done_raw = store.recent_feed(owner_key, "task_done", 50)
     done_events = []
     for ev_id, fields in done_raw:
-        if fields.get("owner") != owner_key:
-            continue
-
         title = fields.get("title")
         task_id = fields.get("task_id")
         ts_val = fields.get("ts")
@@ -566,15 +1886,13 @@ def index():
     # -----------------------------------------------------
     # 今日救援 Queue 狀態（每個 owner_key 自己一個 queue）
     # -----------------------------------------------------
-    queue_key, current_key = get_queue_keys(owner_key)
-    queue_count = r.llen(queue_key)
+    queue_items, current_id = store.queue_state(owner_key)
+    queue_count = len(queue_items)
 
     rescue_task = None
-    current_id = r.get(current_key)
     if current_id:
-        key = f"task:{current_id}"
-        data = r.hgetall(key)
-        if data and data.get("owner") == owner_key:
+        data = store.get_task(owner_key, current_id)
+        if data:
             interval_days = int(data.get("interval_days", 0) or 0)
             last_checkin_ts = data.get("last_checkin_ts")
             initial_rot = data.get("initial_rot", 0)
@@ -602,18 +1920,25 @@ def index():
                 "checked_today": is_today(last_checkin_ts),
             }
 
-    return render_template(
-        "index.html",
-        tasks=tasks,
-        rescue_task=rescue_task,
-        queue_count=queue_count,
-        top_rot_tasks=top_rot_tasks,
-        category_counts=category_counts,
-        total_tasks=total_tasks,
-        events=events,
-        done_events=done_events,
-        owner=display_name,
-    )
+    view = {
+        "tasks": tasks,
+        "rescue_task": rescue_task,
+        "queue_count": queue_count,
+        "top_rot_tasks": top_rot_tasks,
+        "leaderboard": store.rot_leaderboard("critical", LEADERBOARD_SIZE),
+        "category_counts": category_counts,
+        "total_tasks": total_tasks,
+        "events": events,
+        "done_events": done_events,
+        "owner": display_name,
+    }
+    # Redis 連不上時拿來顯示
+    remember_home(owner_key, view)
+    started = time.perf_counter()
+    page = render_template("index.html", **view)
+    render_ms = (time.perf_counter() - started) * 1000
+    # 瀏覽器 DevTools 的 Timing 分頁看得到模板花了多久
+    return page, 200, {"Server-Timing": f"render;dur={render_ms:.1f}"}
 
 
 # -----------------------------------------------------
@@ -666,13 +1991,7 @@ def add_task():
     if not title:
         return redirect(url_for("index"))
 
-    new_id = r.incr("task:id")
-    new_id_str = str(new_id)
-    key = f"task:{new_id_str}"
-
-    pipe = r.pipeline(transaction=True)
-    pipe.hset(key, mapping={
-        "id": new_id_str,
+    task_data = {
         "title": title,
         "category": category,
         "created_at": created_at,
@@ -681,20 +2000,8 @@ def add_task():
         "initial_rot": initial_rot,
         "interval_days": interval_days,
         "last_checkin_ts": "",
-        "owner": owner_key,
-    })
-    pipe.rpush("tasks", new_id_str)
-    pipe.sadd(f"idx:{owner_key}:cat:{category}", new_id_str)
-    pipe.execute()
-
-    r.xadd("task_events", {
-        "type": "created",
-        "task_id": new_id_str,
-        "title": title,
-        "category": category,
-        "owner": owner_key,
-        "ts": str(int(created_at)),
-    })
+    }
+    store.create_task(owner_key, task_data)
 
     return redirect(url_for("index"))
 
@@ -708,9 +2015,8 @@ def edit_task(task_id):
     if not owner_key:
         return redirect(url_for("index"))
 
-    key = f"task:{task_id}"
-    data = r.hgetall(key)
-    if not data or data.get("owner") != owner_key:
+    data = store.get_task(owner_key, task_id)
+    if not data:
         return redirect(url_for("index"))
 
     if request.method == "POST":
@@ -756,8 +2062,7 @@ def edit_task(task_id):
         if not title:
             return redirect(url_for("index"))
 
-        pipe = r.pipeline(transaction=True)
-        pipe.hset(key, mapping={
+        task_data = {
             "title": title,
             "category": category,
             "created_at": created_at,
@@ -766,23 +2071,8 @@ def edit_task(task_id):
             "initial_rot": initial_rot,
             "interval_days": interval_days,
             "last_checkin_ts": last_checkin_ts,
-            "owner": owner_key,
-        })
-
-        if old_category != category:
-            pipe.srem(f"idx:{owner_key}:cat:{old_category}", task_id)
-            pipe.sadd(f"idx:{owner_key}:cat:{category}", task_id)
-
-        pipe.execute()
-
-        r.xadd("task_events", {
-            "type": "updated",
-            "task_id": task_id,
-            "title": title,
-            "category": category,
-            "owner": owner_key,
-            "ts": str(int(time.time())),
-        })
+        }
+        store.update_task(owner_key, task_id, task_data, old_category)
 
         return redirect(url_for("index"))
 
@@ -812,32 +2102,13 @@ def checkin_task(task_id):
     if not owner_key:
         return redirect(url_for("index"))
 
-    key = f"task:{task_id}"
-    data = r.hgetall(key)
-    if not data or data.get("owner") != owner_key:
+    data = store.get_task(owner_key, task_id)
+    if not data:
         return redirect(url_for("index"))
 
     if request.method == "POST":
         note = request.form.get("note", "").strip()
-        now_ts = time.time()
-
-        r.hset(key, "last_checkin_ts", now_ts)
-
-        title = data.get("title", "")
-        r.xadd("task_checkin", {
-            "task_id": task_id,
-            "title": title,
-            "note": note,
-            "owner": owner_key,
-            "ts": str(int(now_ts)),
-        })
-        r.xadd("task_events", {
-            "type": "checkin",
-            "task_id": task_id,
-            "title": title,
-            "owner": owner_key,
-            "ts": str(int(now_ts)),
-        })
+        store.apply_action(owner_key, "checkin", [task_id], note=note)
 
         return redirect(url_for("index"))
 
@@ -874,13 +2145,10 @@ def view_checkins():
     if not owner_key:
         return redirect(url_for("index"))
 
-    events_raw = r.xrevrange("task_checkin", max="+", min="-", count=100)
+    events_raw = store.recent_feed(owner_key, "task_checkin", 100)
 
     records = []
     for ev_id, fields in events_raw:
-        if fields.get("owner") != owner_key:
-            continue
-
         title = fields.get("title", "")
         note = fields.get("note", "")
         task_id = fields.get("task_id", "")
@@ -914,35 +2182,8 @@ def done_task(task_id):
     if not owner_key:
         return redirect(url_for("index"))
 
-    key = f"task:{task_id}"
-    data = r.hgetall(key)
-    if not data or data.get("owner") != owner_key:
-        return redirect(url_for("index"))
-
-    title = data.get("title", "") if data else ""
-    category = data.get("category", "other") if data else "other"
-
-    now_ts = time.time()
-    r.xadd("task_done", {
-        "task_id": task_id,
-        "title": title,
-        "category": category,
-        "owner": owner_key,
-        "ts": str(int(now_ts)),
-    })
-
-    # 接著就像刪除一樣，把它從清單移除
-    if data:
-        r.delete(key)
-    r.lrem("tasks", 0, task_id)
-    r.srem(f"idx:{owner_key}:cat:{category}", task_id)
-    r.zrem(f"rot_rank:{owner_key}", task_id)
-
-    queue_key, current_key = get_queue_keys(owner_key)
-    r.lrem(queue_key, 0, task_id)
-    current_id = r.get(current_key)
-    if current_id == task_id:
-        r.delete(current_key)
+    # 記入完成紀錄，接著就像刪除一樣，把它從清單移除（不是自己的任務就什麼都不做）
+    store.apply_action(owner_key, "done", [task_id])
 
     return redirect(url_for("index"))
 
@@ -956,32 +2197,7 @@ def delete_task(task_id):
     if not owner_key:
         return redirect(url_for("index"))
 
-    key = f"task:{task_id}"
-    data = r.hgetall(key)
-    if not data or data.get("owner") != owner_key:
-        return redirect(url_for("index"))
-
-    category = data.get("category", "other")
-    title = data.get("title", "")
-
-    r.delete(key)
-    r.lrem("tasks", 0, task_id)
-    r.srem(f"idx:{owner_key}:cat:{category}", task_id)
-    r.zrem(f"rot_rank:{owner_key}", task_id)
-
-    queue_key, current_key = get_queue_keys(owner_key)
-    r.lrem(queue_key, 0, task_id)
-    current_id = r.get(current_key)
-    if current_id == task_id:
-        r.delete(current_key)
-
-    r.xadd("task_events", {
-        "type": "deleted",
-        "task_id": task_id,
-        "title": title,
-        "owner": owner_key,
-        "ts": str(int(time.time())),
-    })
+    store.apply_action(owner_key, "delete", [task_id])
 
     return redirect(url_for("index"))
 
@@ -995,23 +2211,7 @@ def add_to_queue(task_id):
     if not owner_key:
         return redirect(url_for("index"))
 
-    key = f"task:{task_id}"
-    data = r.hgetall(key)
-    if not data or data.get("owner") != owner_key:
-        return redirect(url_for("index"))
-
-    queue_key, _ = get_queue_keys(owner_key)
-    current_list = r.lrange(queue_key, 0, -1)
-    if task_id not in current_list:
-        r.rpush(queue_key, task_id)
-        title = data.get("title", "")
-        r.xadd("task_events", {
-            "type": "queue_add",
-            "task_id": task_id,
-            "title": title or "",
-            "owner": owner_key,
-            "ts": str(int(time.time())),
-        })
+    store.apply_action(owner_key, "queue", [task_id])
 
     return redirect(url_for("index"))
 
@@ -1022,22 +2222,39 @@ def next_rescue():
     if not owner_key:
         return redirect(url_for("index"))
 
-    queue_key, current_key = get_queue_keys(owner_key)
-    tid = r.lpop(queue_key)
-    if tid:
-        r.set(current_key, tid)
-        key = f"task:{tid}"
-        data = r.hgetall(key)
-        title = data.get("title") if data else ""
-        r.xadd("task_events", {
-            "type": "rescue_pick",
-            "task_id": tid,
-            "title": title or "",
-            "owner": owner_key,
-            "ts": str(int(time.time())),
-        })
-    else:
-        r.delete(current_key)
+    store.next_rescue(owner_key)
+    return redirect(url_for("index"))
+
+
+# -----------------------------------------------------
+# 批次操作：勾選多個任務一次完成 / 刪除 / 加入救援 / 打卡
+# -----------------------------------------------------
+BULK_ACTIONS = ("done", "delete", "queue", "checkin")
+# 一次最多處理幾個任務
+BULK_MAX_TASKS = 500
+
+
+@app.route("/bulk", methods=["POST"])
+def bulk_action():
+    """
+    表單欄位：action（done / delete / queue / checkin）、task_ids（可多個）、
+    note（打卡備註，選填）。所有寫入放在同一個交易裡，最後只 redirect 一次。
+    """
+    owner_key, display_name = get_current_owner()
+    if not owner_key:
+        return redirect(url_for("index"))
+
+    action = request.form.get("action", "")
+    # 去掉重複但保留勾選順序
+    task_ids = list(dict.fromkeys(
+        tid for tid in request.form.getlist("task_ids") if tid
+    ))[:BULK_MAX_TASKS]
+    if action not in BULK_ACTIONS or not task_ids:
+        return redirect(url_for("index"))
+
+    note = request.form.get("note", "").strip()
+    store.apply_action(owner_key, action, task_ids, note=note)
+
     return redirect(url_for("index"))
 
 
@@ -1051,18 +2268,15 @@ def view_task_checkins_by_task(task_id):
     if not owner_key:
         return redirect(url_for("index"))
 
-    key = f"task:{task_id}"
-    data = r.hgetall(key)
-    if not data or data.get("owner") != owner_key:
+    data = store.get_task(owner_key, task_id)
+    if not data:
         return redirect(url_for("index"))
 
     title = data.get("title", f"任務 #{task_id}") if data else f"任務 #{task_id}"
 
-    events_raw = r.xrevrange("task_checkin", max="+", min="-", count=200)
+    events_raw = store.recent_feed(owner_key, "task_checkin", 200)
     records = []
     for ev_id, fields in events_raw:
-        if fields.get("owner") != owner_key:
-            continue
         if fields.get("task_id") != str(task_id):
             continue
 
@@ -1090,6 +2304,2254 @@ def view_task_checkins_by_task(task_id):
     )
 
 
+# -----------------------------------------------------
+# 搜尋任務（標題 + 打卡備註）
+# -----------------------------------------------------
+def search_owner_tasks(owner_key, query):
+    """回傳 (符合的任務, 符合的總數)，只讀回前 SEARCH_MAX_RESULTS 筆"""
+    tokens = query_tokens(query)
+    if not tokens:
+        return [], 0
+    rows, total = store.search(owner_key, tokens, SEARCH_MAX_RESULTS)
+
+    results = []
+    for tid, data in rows:
+        rot_info = task_rot_info(data)
+        title = data.get("title", "")
+        results.append({
+            "id": tid,
+            "title": title,
+            "category": data.get("category", "other"),
+            "deadline_str": format_deadline(data.get("deadline_ts", "")),
+            "rot_level": rot_info["level"],
+            "rot_emoji": rot_info["emoji"],
+            "rot_bucket": rot_info["bucket"],
+            # 標題沒有全部對到，就是打卡備註裡有
+            "matched_note": not set(tokens) <= tokenize(title),
+        })
+    return results, total
+
+
+@app.route("/search")
+def search_tasks():
+    """GET /search?q=關鍵字"""
+    owner_key, display_name = get_current_owner()
+    if not owner_key:
+        return redirect(url_for("login"))
+
+    query = request.args.get("q", "").strip()
+    results, total = search_owner_tasks(owner_key, query)
+    return render_template(
+        "search.html",
+        query=query,
+        results=results,
+        total=total,
+    )
+
+
+@app.route("/api/search")
+def api_search():
+    """GET /api/search?q=關鍵字 → JSON"""
+    owner_key, display_name = get_current_owner()
+    if not owner_key:
+        return jsonify({"error": "not logged in"}), 401
+
+    query = request.args.get("q", "").strip()
+    results, total = search_owner_tasks(owner_key, query)
+    return jsonify({"query": query, "total": total, "tasks": results})
+
+
+@app.cli.command("search-reindex")
+def search_reindex_command():
+    """幫建立搜尋索引之前就有的任務補建索引（可重跑）"""
+    if STORAGE_BACKEND == "redis":
+        use_cli_timeouts()
+    owners = tasks = 0
+    for owner in store.iter_owners():
+        tasks += store.reindex_search(owner)
+        owners += 1
+    click.echo(f"reindexed {tasks} tasks for {owners} owners")
+
+
+# -----------------------------------------------------
+# 離線同步：只回傳 since 之後有變動 / 被刪掉的任務
+# -----------------------------------------------------
+# 一次最多上傳幾筆離線打卡
+SYNC_MAX_CHECKINS = 200
+# client_id 去重記錄保留多久（秒），重送同一批不會重複打卡
+SYNC_DEDUP_TTL = 7 * 86400
+
+
+def task_sync_payload(tid, data):
+    """把 task hash 轉成給用戶端的 JSON（原始欄位 + 目前腐爛度）"""
+    rot_info = task_rot_info(data)
+    return {
+        "id": tid,
+        "title": data.get("title", ""),
+        "category": data.get("category", "other"),
+        "created_at": data.get("created_at", ""),
+        "deadline_ts": data.get("deadline_ts", ""),
+        "is_routine": data.get("is_routine", "0") == "1",
+        "initial_rot": int(data.get("initial_rot", 0) or 0),
+        "interval_days": int(data.get("interval_days", 0) or 0),
+        "last_checkin_ts": data.get("last_checkin_ts", ""),
+        "rot_level": rot_info["level"],
+        "rot_bucket": rot_info["bucket"],
+    }
+
+
+@app.route("/sync")
+def sync():
+    """
+    GET /sync?since=<seq>
+
+    回傳 since 之後有變動的任務（tasks）和被完成 / 刪除的任務 ID（deleted），
+    用戶端下次帶回傳的 seq 就好。since=0 代表全部重抓。
+    """
+    owner_key, display_name = get_current_owner()
+    if not owner_key:
+        return jsonify({"error": "not logged in"}), 401
+
+    try:
+        since = max(0, int(request.args.get("since", "0")))
+    except ValueError:
+        return jsonify({"error": "since must be an integer"}), 400
+
+    seq, changed, deleted = store.changes_since(owner_key, since)
+
+    full = since == 0
+    if full:
+        # 全量同步：舊資料沒有變更紀錄，直接讀整個任務清單
+        rows = store.list_tasks(owner_key)
+        deleted = []
+    else:
+        rows = store.get_tasks(
+            owner_key, [tid for tid in changed if tid != SYNC_QUEUE_MEMBER]
+        )
+    tasks = [task_sync_payload(tid, data) for tid, data in rows]
+
+    payload = {
+        "seq": seq,
+        "full": full,
+        "tasks": tasks,
+        "deleted": deleted,
+    }
+
+    if full or SYNC_QUEUE_MEMBER in changed:
+        queue_items, current_id = store.queue_state(owner_key)
+        payload["queue"] = {"items": queue_items, "current": current_id}
+
+    return jsonify(payload)
+
+
+@app.route("/sync/checkins", methods=["POST"])
+def sync_checkins():
+    """
+    POST /sync/checkins，一次上傳離線時累積的打卡：
+
+        {"checkins": [{"task_id": "12", "note": "...", "ts": 1700000000,
+                       "client_id": "uuid"}, ...]}
+
+    ts 是用戶端打卡當下的時間（不能比現在還晚），
+    client_id 用來去重，同一筆重送不會重複記錄。
+    """
+    owner_key, display_name = get_current_owner()
+    if not owner_key:
+        return jsonify({"error": "not logged in"}), 401
+
+    body = request.get_json(silent=True) or {}
+    items = body.get("checkins")
+    if not isinstance(items, list):
+        return jsonify({"error": "checkins must be a list"}), 400
+    if len(items) > SYNC_MAX_CHECKINS:
+        return jsonify({"error": f"at most {SYNC_MAX_CHECKINS} checkins per request"}), 413
+
+    now_ts = time.time()
+    parsed = []
+    rejected = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get("task_id"):
+            rejected.append({"item": item, "reason": "invalid"})
+            continue
+        try:
+            ts = float(item.get("ts", now_ts))
+        except (TypeError, ValueError):
+            ts = now_ts
+        if not math.isfinite(ts):
+            # "NaN" / "1e400" 轉得成 float，但之後 int(ts) 會炸
+            rejected.append({"task_id": str(item["task_id"]), "reason": "invalid ts"})
+            continue
+        # 不能比現在晚，也不能是 1970 以前
+        ts = min(max(ts, 1.0), now_ts)
+        parsed.append({
+            "task_id": str(item["task_id"]),
+            "note": str(item.get("note", "")).strip(),
+            "ts": ts,
+            "client_id": str(item.get("client_id") or ""),
+        })
+
+    accepted, not_found, seq = store.sync_checkins(owner_key, parsed)
+    return jsonify({
+        "seq": seq,
+        "accepted": accepted,
+        "rejected": rejected + not_found,
+    })
+
+
+# -----------------------------------------------------
+# 匯出 / 匯入（NDJSON，一行一筆，用來在不同機器之間搬使用者）
+# -----------------------------------------------------
+# task hash 裡會匯出 / 匯入的欄位（owner 不匯出，匯入時換成目前登入者）
+TASK_FIELDS = (
+    "title", "category", "created_at", "deadline_ts", "is_routine",
+    "initial_rot", "interval_days", "last_checkin_ts",
+)
+# NDJSON 的 type → Redis Stream
+EXPORT_STREAMS = (
+    ("checkin", "task_checkin"),
+    ("done", "task_done"),
+    ("event", "task_events"),
+)
+STREAM_BY_TYPE = dict(EXPORT_STREAMS)
+# 每次讀 / 寫幾筆（記憶體只會跟這個數字有關，跟歷史多長無關）
+EXPORT_CHUNK = 500
+IMPORT_CHUNK = 500
+
+
+def ndjson_line(obj):
+    return json.dumps(obj, ensure_ascii=False) + "\n"
+
+
+def iter_owner_export(owner_key):
+    """一段一段讀，邊讀邊吐 NDJSON，不會把整份歷史放進記憶體"""
+    yield ndjson_line({
+        "type": "meta",
+        "version": 1,
+        "exported_at": int(time.time()),
+    })
+
+    for tid, data in store.iter_tasks(owner_key, EXPORT_CHUNK):
+        record = {"type": "task", "id": tid}
+        record.update({f: data[f] for f in TASK_FIELDS if f in data})
+        yield ndjson_line(record)
+
+    # 打卡 / 完成 / 操作紀錄：分頁讀，從舊到新
+    for rec_type, stream in EXPORT_STREAMS:
+        for ev_id, fields in store.iter_feed(owner_key, stream, EXPORT_CHUNK):
+            # 紀錄本身也有 type 欄位（task_events），所以整包放在 fields 底下
+            yield ndjson_line({
+                "type": rec_type,
+                "fields": {k: v for k, v in fields.items() if k != "owner"},
+            })
+
+
+@app.route("/export")
+def export_data():
+    owner_key, display_name = get_current_owner()
+    if not owner_key:
+        return redirect(url_for("login"))
+
+    filename = f"rot-index-{int(time.time())}.ndjson"
+    return Response(
+        stream_with_context(iter_owner_export(owner_key)),
+        mimetype="application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+# 匯入時各欄位要是什麼型別
+IMPORT_TIME_FIELDS = ("created_at", "deadline_ts", "last_checkin_ts")
+IMPORT_INT_FIELDS = ("initial_rot", "interval_days")
+
+
+def import_scalar(value):
+    """JSON 的字串 / 數字轉成字串；bool、list、dict 這些不收（丟 ValueError）"""
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError(value)
+    return str(value).strip()
+
+
+def import_time(value):
+    """數字或數字字串（舊資料的 created_at 可能是 ISO 字串，照 calc_rot_info 的格式轉）"""
+    text = import_scalar(value)
+    try:
+        ts = float(text)
+    except ValueError:
+        ts = datetime.strptime(text, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=TZ).timestamp()
+    if not math.isfinite(ts) or ts <= 0:
+        raise ValueError(value)
+    return str(ts)
+
+
+def clean_import_record(rec):
+    """
+    檢查 / 轉換一筆匯入紀錄，欄位都變成 task hash 用的字串；
+    型別不對回傳 None（算 skipped，不要讓整個匯入 500）
+    """
+    try:
+        if rec["type"] != "task":
+            fields = {k: import_scalar(v) for k, v in rec["fields"].items() if v is not None}
+            return dict(rec, fields=fields)
+
+        task = {"type": "task", "id": import_scalar(rec.get("id") or "")}
+        title = rec.get("title")
+        task["title"] = "" if title is None else import_scalar(title)
+        category = import_scalar(rec.get("category") or "other")
+        category = CATEGORY_MAPPING.get(category, category)
+        task["category"] = category if category in CATEGORIES else "other"
+        for field in IMPORT_TIME_FIELDS:
+            if rec.get(field) not in (None, ""):
+                task[field] = import_time(rec[field])
+        for field in IMPORT_INT_FIELDS:
+            if rec.get(field) not in (None, ""):
+                number = float(import_scalar(rec[field]))
+                if not math.isfinite(number):
+                    raise ValueError(number)
+                task[field] = str(max(int(number), 0))
+        if rec.get("is_routine") not in (None, ""):
+            task["is_routine"] = "1" if rec["is_routine"] in (True, 1, "1", "true") else "0"
+        return task
+    except (TypeError, ValueError):
+        return None
+
+
+@app.route("/import", methods=["POST"])
+def import_data():
+    """
+    匯入 /export 產生的 NDJSON（上傳檔案欄位 file，或直接放在 request body）。
+    一律當成新任務匯入到目前登入者名下，不會覆蓋原本的任務。
+    """
+    owner_key, display_name = get_current_owner()
+    if not owner_key:
+        return jsonify({"error": "not logged in"}), 401
+
+    upload = request.files.get("file")
+    stream = upload.stream if upload else request.stream
+
+    stats = {"tasks": 0, "skipped": 0}
+    stats.update({rec_type: 0 for rec_type, _ in EXPORT_STREAMS})
+    id_map = {}
+    chunk = []
+    for raw in iter(stream.readline, b""):
+        line = raw.strip()
+        if not line:
+            continue
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            stats["skipped"] += 1
+            continue
+        rec_type = rec.get("type") if isinstance(rec, dict) else None
+        if rec_type == "meta":
+            continue
+        if not (rec_type == "task" or (
+            rec_type in STREAM_BY_TYPE and isinstance(rec.get("fields"), dict)
+        )):
+            stats["skipped"] += 1
+            continue
+        rec = clean_import_record(rec)
+        if rec is None:
+            stats["skipped"] += 1
+            continue
+
+        chunk.append(rec)
+        if len(chunk) >= IMPORT_CHUNK:
+            store.import_records(owner_key, chunk, id_map, stats)
+            chunk = []
+
+    if chunk:
+        store.import_records(owner_key, chunk, id_map, stats)
+
+    return jsonify(stats)
+
+
+# -----------------------------------------------------
+# 儲存層：route 只透過 store 讀寫（STORAGE_BACKEND=redis / sqlite）
+# -----------------------------------------------------
+class RedisStore:
+    """
+    Redis 版儲存層，方法就是原本寫在 route 裡的 Redis 指令。
+    sqlite_store.SqliteStore 有一樣的方法；回傳的任務資料都是「欄位都是字串」的 dict，
+    只會回傳屬於 owner_key 的任務。
+    """
+
+    # ---------- 使用者 ----------
+    def get_user_secret(self, name):
+        return directory.get(f"user:{name}")
+
+    def create_user(self, name, secret):
+        """名字還沒被用過才寫入，回傳是否註冊成功"""
+        return bool(directory.set(f"user:{name}", secret, nx=True))
+
+    def ensure_owner(self, owner_key):
+        """確認這個 owner 的資料在新版 key 上，回傳 False 代表 migrate-keyspace 還沒搬到"""
+        return ensure_redis_owner_layout(owner_key)
+
+    # ---------- 任務 ----------
+    def list_tasks(self, owner_key):
+        task_ids = rr.lrange(owner_tasks_key(owner_key), 0, -1)
+        return self.get_tasks(owner_key, task_ids)
+
+    def iter_tasks(self, owner_key, chunk):
+        """list 一段一段 LRANGE，再用 pipeline 讀 hash"""
+        tasks_key = owner_tasks_key(owner_key)
+        start = 0
+        while True:
+            task_ids = rr.lrange(tasks_key, start, start + chunk - 1)
+            if not task_ids:
+                return
+            start += len(task_ids)
+            yield from self.get_tasks(owner_key, task_ids)
+
+    def get_task(self, owner_key, task_id):
+        data = decode_task(owner_key, task_id, rr.hgetall(task_key(owner_key, task_id)))
+        return data if data and data.get("owner") == owner_key else {}
+
+    def get_tasks(self, owner_key, task_ids):
+        return [
+            (tid, data) for tid, data in fetch_tasks(owner_key, task_ids, client=rr)
+            if data and data.get("owner") == owner_key
+        ]
+
+    def create_task(self, owner_key, task_data):
+        task_id = allocate_task_ids(1)[0]
+        data = dict(task_data)
+        category = data.get("category", "other")
+
+        pipe = r.pipeline(transaction=True)
+        write_task(pipe, owner_key, task_id, data)
+        pipe.rpush(owner_tasks_key(owner_key), task_id)
+        pipe.sadd(cat_index_key(owner_key, category), task_id)
+        rank_tasks(pipe, owner_key, [(task_id, data)])
+        index_tokens(pipe, owner_key, task_id, tokenize(data.get("title")))
+        pipe.xadd(stream_key(owner_key, "task_events"), {
+            "type": "created",
+            "task_id": task_id,
+            "title": data.get("title", ""),
+            "category": category,
+            "o": owner_id(owner_key),
+            "ts": str(int(float(data.get("created_at") or time.time()))),
+        })
+        record_change(pipe, owner_key, changed=[task_id])
+        pipe.execute()
+        return task_id
+
+    def update_task(self, owner_key, task_id, task_data, old_category):
+        data = dict(task_data)
+        category = data.get("category", "other")
+
+        # 舊標題的 token 要拿掉，但備註裡也有的要留著
+        pipe = r.pipeline(transaction=False)
+        pipe.hmget(task_key(owner_key, task_id), TASK_FIELD_CODES["title"], "title")
+        pipe.smembers(search_notes_key(owner_key, task_id))
+        (new_format_title, old_format_title), note_tokens = pipe.execute()
+        old_title = new_format_title or old_format_title
+        new_tokens = tokenize(data.get("title"))
+
+        pipe = r.pipeline(transaction=True)
+        write_task(pipe, owner_key, task_id, data)
+        unindex_tokens(pipe, owner_key, task_id,
+                       tokenize(old_title) - new_tokens - note_tokens)
+        index_tokens(pipe, owner_key, task_id, new_tokens)
+        if old_category != category:
+            pipe.srem(cat_index_key(owner_key, old_category), task_id)
+            pipe.sadd(cat_index_key(owner_key, category), task_id)
+        rank_tasks(pipe, owner_key, [(task_id, data)])
+        pipe.xadd(stream_key(owner_key, "task_events"), {
+            "type": "updated",
+            "task_id": task_id,
+            "title": data.get("title", ""),
+            "category": category,
+            "o": owner_id(owner_key),
+            "ts": str(int(time.time())),
+        })
+        record_change(pipe, owner_key, changed=[task_id])
+        pipe.execute()
+
+    def apply_action(self, owner_key, action, task_ids, note="", now_ts=None):
+        """
+        action 是 done / delete / queue / checkin（單筆 route 跟 /bulk 共用）。
+        一次讀回所有任務 + queue 內容 + 目前抽中的任務，寫入放在同一個交易，
+        回傳實際處理到的任務 ID。
+        """
+        task_ids = [str(tid) for tid in task_ids]
+        keys = [task_key(owner_key, tid) for tid in dict.fromkeys(task_ids)]
+        with r.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    # 讀到寫之間任務被刪 / queue 被改就整批重讀重做，
+                    # 不會把刪掉的任務寫回去，也不會重複排進 queue
+                    pipe.watch(*keys, *get_queue_keys(owner_key))
+                    return self._apply_action_pass(owner_key, action, task_ids, note,
+                                                   now_ts, pipe)
+                except redis.WatchError:
+                    continue
+
+    def _apply_action_pass(self, owner_key, action, task_ids, note, now_ts, pipe):
+        removing = action in ("done", "delete")
+        queue_key, current_key = get_queue_keys(owner_key)
+        reader = r.pipeline(transaction=False)
+        for tid in task_ids:
+            reader.hgetall(task_key(owner_key, tid))
+        if removing:
+            for tid in task_ids:
+                reader.smembers(search_notes_key(owner_key, tid))
+        reader.lrange(queue_key, 0, -1)
+        reader.get(current_key)
+        *rows, queue_items, current_id = reader.execute()
+        note_tokens = {}
+        if removing:
+            note_tokens = dict(zip(task_ids, rows[len(task_ids):]))
+            rows = rows[:len(task_ids)]
+
+        owned = [
+            (tid, data) for tid, data in (
+                (tid, decode_task(owner_key, tid, raw)) for tid, raw in zip(task_ids, rows)
+            )
+            if data and data.get("owner") == owner_key
+        ]
+        if not owned:
+            pipe.unwatch()
+            return []
+
+        now_ts = now_ts or time.time()
+        pipe.multi()
+        if removing:
+            result = remove_tasks(pipe, owner_key, owned, current_id, now_ts,
+                                  done=action == "done", note_tokens=note_tokens)
+        elif action == "queue":
+            result = enqueue_tasks(pipe, owner_key, owned, queue_items, now_ts)
+        else:
+            checkin_tasks(pipe, owner_key, owned, note, now_ts)
+            result = [tid for tid, _ in owned]
+        if result:
+            pipe.execute()
+        return result
+
+    # ---------- 今日救援 queue ----------
+    def queue_state(self, owner_key):
+        """回傳 (queue 裡的任務 ID, 目前抽中的任務 ID 或 None)"""
+        queue_key, current_key = get_queue_keys(owner_key)
+        pipe = rr.pipeline(transaction=False)
+        pipe.lrange(queue_key, 0, -1)
+        pipe.get(current_key)
+        queue_items, current_id = pipe.execute()
+        return queue_items, current_id
+
+    def next_rescue(self, owner_key):
+        queue_key, current_key = get_queue_keys(owner_key)
+        tid = r.lpop(queue_key)
+        if not tid:
+            if r.delete(current_key):
+                record_change(r, owner_key, changed=[SYNC_QUEUE_MEMBER])
+            return None
+
+        r.set(current_key, tid)
+        record_change(r, owner_key, changed=[SYNC_QUEUE_MEMBER])
+        data = decode_task(owner_key, tid, r.hgetall(task_key(owner_key, tid)))
+        r.xadd(stream_key(owner_key, "task_events"), {
+            "type": "rescue_pick",
+            "task_id": tid,
+            "title": (data.get("title") if data else "") or "",
+            "o": owner_id(owner_key),
+            "ts": str(int(time.time())),
+        })
+        return tid
+
+    # ---------- 紀錄（Redis Streams）----------
+    def recent_feed(self, owner_key, stream, count):
+        """最新的 count 筆，新的在前面：[(entry id, fields), ...]"""
+        entries = rr.xrevrange(stream_key(owner_key, stream),
+                               max="+", min="-", count=count)
+        return [(ev_id, decode_entry(owner_key, fields)) for ev_id, fields in entries]
+
+    def iter_feed(self, owner_key, stream, chunk):
+        """XRANGE 分頁，從舊到新"""
+        last_id = "-"
+        while True:
+            entries = rr.xrange(stream_key(owner_key, stream),
+                                min=last_id, max="+", count=chunk)
+            if not entries:
+                return
+            last_id = f"({entries[-1][0]}"
+            for ev_id, fields in entries:
+                fields = decode_entry(owner_key, fields)
+                if fields.get("owner") == owner_key:
+                    yield ev_id, fields
+
+    # ---------- 離線同步 ----------
+    def changes_since(self, owner_key, since):
+        """回傳 (目前序號, since 之後有變動的 ID, since 之後被刪掉的 ID)"""
+        seq_key, changes_key, tombstones_key = get_sync_keys(owner_key)
+        # 用交易一次讀完，序號跟變動清單才會對得起來
+        pipe = rr.pipeline(transaction=True)
+        pipe.get(seq_key)
+        pipe.zrangebyscore(changes_key, f"({since}", "+inf")
+        pipe.zrangebyscore(tombstones_key, f"({since}", "+inf")
+        seq, changed, deleted = pipe.execute()
+        return int(seq or 0), changed, deleted
+
+    def sync_checkins(self, owner_key, items):
+        """
+        items = [{"task_id", "note", "ts", "client_id"}, ...]
+        回傳 (accepted, rejected, 目前序號)
+
+        去重記錄跟打卡在同一個 MULTI 裡寫入，只記真的打上去的那幾筆：
+        交易沒送出去（斷線、breaker 打開）時用戶端重送還是會被收下。
+        """
+        seen_key = sync_seen_key(owner_key)
+        keys = [task_key(owner_key, tid) for tid in dict.fromkeys(c["task_id"] for c in items)]
+        with r.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    pipe.watch(seen_key, *keys)
+                    result = self._sync_checkins_pass(owner_key, items, pipe)
+                    break
+                except redis.WatchError:
+                    continue  # 同時有別的寫入，整批重讀重做
+        seq = r.get(get_sync_keys(owner_key)[0])
+        return (*result, int(seq or 0))
+
+    def _sync_checkins_pass(self, owner_key, items, pipe):
+        seen_key = sync_seen_key(owner_key)
+        now_ts = time.time()
+        # 一次讀回所有任務的 owner / 標題 / 上次打卡時間，和每個 client_id 有沒有收過
+        reader = r.pipeline(transaction=False)
+        for c in items:
+            reader.hgetall(task_key(owner_key, c["task_id"]))
+        for c in items:
+            if c["client_id"]:
+                reader.zscore(seen_key, c["client_id"])
+                reader.exists(legacy_seen_key(owner_key, c["client_id"]))
+        results = reader.execute()
+        task_rows = {
+            c["task_id"]: decode_task(owner_key, c["task_id"], raw)
+            for c, raw in zip(items, results[:len(items)])
+        }
+        seen_results = iter(results[len(items):])
+
+        accepted = []
+        rejected = []
+        latest = {}
+        applied = set()
+        pipe.multi()
+        for c in items:
+            data = task_rows[c["task_id"]]
+            title = data.get("title")
+            last_ts = data.get("last_checkin_ts")
+            seen = False
+            if c["client_id"]:
+                expires_at, legacy = next(seen_results), next(seen_results)
+                seen = ((expires_at is not None and expires_at > now_ts) or legacy
+                        or c["client_id"] in applied)
+            if data.get("owner") != owner_key:
+                rejected.append({"task_id": c["task_id"], "reason": "not found"})
+                continue
+            if seen:
+                # 之前已經收過了，當作成功
+                accepted.append(c["task_id"])
+                continue
+
+            try:
+                prev = float(last_ts) if last_ts else 0.0
+            except ValueError:
+                prev = 0.0
+            latest[c["task_id"]] = max(latest.get(c["task_id"], prev), c["ts"])
+
+            pipe.xadd(stream_key(owner_key, "task_checkin"), {
+                "task_id": c["task_id"],
+                "title": title or "",
+                "note": c["note"],
+                "o": owner_id(owner_key),
+                "ts": str(int(c["ts"])),
+            })
+            pipe.xadd(stream_key(owner_key, "task_events"), {
+                "type": "checkin",
+                "task_id": c["task_id"],
+                "title": title or "",
+                "o": owner_id(owner_key),
+                "ts": str(int(c["ts"])),
+            })
+            index_note(pipe, owner_key, c["task_id"], c["note"])
+            if c["client_id"]:
+                applied.add(c["client_id"])
+            accepted.append(c["task_id"])
+
+        checked = [(tid, dict(task_rows[tid], last_checkin_ts=ts)) for tid, ts in latest.items()]
+        for tid, data in checked:
+            write_task(pipe, owner_key, tid, data)
+        rank_tasks(pipe, owner_key, checked)
+        record_change(pipe, owner_key, changed=list(latest))
+        if applied:
+            pipe.zadd(seen_key, dict.fromkeys(applied, now_ts + SYNC_DEDUP_TTL))
+            pipe.zremrangebyscore(seen_key, "-inf", now_ts)
+            pipe.expire(seen_key, SYNC_DEDUP_TTL)
+        pipe.execute()
+        return accepted, rejected
+
+    # ---------- 全文搜尋 ----------
+    def search(self, owner_key, tokens, limit):
+        """一次 SINTER 找出所有 token 都有的任務，只讀回前 limit 筆（新的在前面）"""
+        task_ids = rr.sinter([search_token_key(owner_key, t) for t in tokens])
+        task_ids = sorted(task_ids, key=int, reverse=True)
+        return self.get_tasks(owner_key, task_ids[:limit]), len(task_ids)
+
+    def iter_owners(self):
+        """維運用：逐一列出 owner，並把 r 綁到那個 owner 所在的 shard"""
+        for name, client in SHARDS.items():
+            for owner in scan_owners(client):
+                if shard_for(owner)[0] == name:
+                    g.redis = client
+                    yield owner
+
+    def reindex_search(self, owner_key):
+        """從任務標題和打卡紀錄重建搜尋索引（SADD 可以重跑）"""
+        task_ids = set()
+        pipe = r.pipeline(transaction=False)
+        for tid, data in self.iter_tasks(owner_key, EXPORT_CHUNK):
+            task_ids.add(tid)
+            index_tokens(pipe, owner_key, tid, tokenize(data.get("title")))
+            if len(pipe) >= EXPORT_CHUNK:
+                pipe.execute()
+        # 已經完成 / 刪除的任務的備註不用補
+        for _, fields in self.iter_feed(owner_key, "task_checkin", EXPORT_CHUNK):
+            if fields.get("task_id") in task_ids:
+                index_note(pipe, owner_key, fields["task_id"], fields.get("note"))
+            if len(pipe) >= EXPORT_CHUNK:
+                pipe.execute()
+        pipe.execute()
+        return len(task_ids)
+
+    # ---------- 腐爛度趨勢 ----------
+    def rot_counts(self, owner_key, now):
+        """
+        {腐爛度: 任務數}。只重算 rot_due 到期的任務（其他任務的腐爛度不會變），
+        再用 ZCOUNT 數排行榜，不用把每個任務都讀出來。
+        """
+        rank_key, due_key = rot_rank_key(owner_key), rot_due_key(owner_key)
+        pipe = r.pipeline(transaction=False)
+        pipe.zrangebyscore(due_key, "-inf", now)
+        pipe.zcard(due_key)
+        pipe.zcard(rank_key)
+        due_ids, n_due, n_ranked = pipe.execute()
+        if n_due != n_ranked:
+            # 還沒排過重算時間的舊任務：這次全部重算一次
+            due_ids = r.zrange(rank_key, 0, -1)
+
+        if due_ids:
+            with r.pipeline(transaction=True) as pipe:
+                try:
+                    # 重算途中任務被改了就放棄這輪（下次還是到期的，會再算）
+                    pipe.watch(*[task_key(owner_key, tid) for tid in due_ids])
+                    tasks = [
+                        (tid, data) for tid, data in fetch_tasks(owner_key, due_ids)
+                        if data and data.get("owner") == owner_key
+                    ]
+                    gone = set(due_ids) - {tid for tid, _ in tasks}
+                    pipe.multi()
+                    rank_tasks(pipe, owner_key, tasks, now)
+                    if gone:
+                        # 走 ROT_RANK_LUA 移除，owner 的 rot_sum / rot_critical 才會跟著扣
+                        set_rot_levels(pipe, owner_key, dict.fromkeys(gone))
+                        pipe.zrem(due_key, *gone)
+                    pipe.execute()
+                except redis.WatchError:
+                    pass
+
+        pipe = r.pipeline(transaction=False)
+        for level in ROT_LEVELS:
+            pipe.zcount(rank_key, level, level)
+        return dict(zip(ROT_LEVELS, pipe.execute()))
+
+    def add_rot_sample(self, owner_key, counts, slots):
+        """slots 是 rot_slots() 的結果，每種解析度的那一格各加一個樣本"""
+        rot_sample_script(
+            keys=[rot_series_key(owner_key, resolution) for resolution, _, _ in slots],
+            args=[counts[level] for level in ROT_LEVELS]
+            + [x for _, slot, period in slots for x in (slot, period)],
+            client=r,
+        )
+
+    def rot_series(self, owner_key, resolution):
+        """一個 HVALS 讀回整個環：[(時段開始, 樣本數, 四個加總...), ...]"""
+        raw = rr.hvals(rot_series_key(owner_key, resolution))
+        return [tuple(int(x) for x in value.split(",")) for value in raw]
+
+    def rot_leaderboard(self, by, limit):
+        """全站排行榜：一個 ZREVRANGE，[(名字, 分數), ...]"""
+        rows = directory.zrevrange(LEADERBOARD_KEYS[by], 0, limit - 1, withscores=True)
+        return [(name, int(score)) for name, score in rows]
+
+    # ---------- 匯入 ----------
+    def import_records(self, owner_key, records, id_map, stats):
+        """
+        匯入一段 records：
+        - 這段裡沒看過的舊任務 ID 一次配發新 ID（數量夠多時就是一次 INCRBY task:id）
+        - 任務 hash / 分類索引 / 排行榜 / 紀錄全部丟進同一個 pipeline
+        """
+        unseen = []
+        for rec in records:
+            if rec["type"] == "task":
+                old_id = str(rec.get("id") or "")
+            else:
+                old_id = str(rec["fields"].get("task_id") or "")
+            if old_id and old_id not in id_map and old_id not in unseen:
+                unseen.append(old_id)
+        if unseen:
+            id_map.update(zip(unseen, allocate_task_ids(len(unseen))))
+
+        new_task_ids = []
+        pipe = r.pipeline(transaction=False)
+        for rec in records:
+            if rec["type"] == "task":
+                old_id = str(rec.get("id") or "")
+                if not old_id:
+                    stats["skipped"] += 1
+                    continue
+                new_id = id_map[old_id]
+                mapping = {f: rec[f] for f in TASK_FIELDS if rec.get(f) is not None}
+                mapping.setdefault("title", "")
+                mapping.setdefault("category", "other")
+                mapping.setdefault("created_at", time.time())
+                write_task(pipe, owner_key, new_id, mapping)
+                pipe.rpush(owner_tasks_key(owner_key), new_id)
+                pipe.sadd(cat_index_key(owner_key, mapping["category"]), new_id)
+                rank_tasks(pipe, owner_key, [(new_id, mapping)])
+                index_tokens(pipe, owner_key, new_id, tokenize(mapping["title"]))
+                new_task_ids.append(new_id)
+                stats["tasks"] += 1
+            else:
+                fields = {
+                    k: str(v) for k, v in rec["fields"].items() if v is not None
+                }
+                if fields.get("task_id"):
+                    fields["task_id"] = id_map[str(fields["task_id"])]
+                fields.pop("owner", None)
+                fields["o"] = owner_id(owner_key)
+                pipe.xadd(stream_key(owner_key, STREAM_BY_TYPE[rec["type"]]), fields)
+                if rec["type"] == "checkin" and fields.get("task_id"):
+                    index_note(pipe, owner_key, fields["task_id"], fields.get("note"))
+                stats[rec["type"]] += 1
+
+        record_change(pipe, owner_key, changed=new_task_ids)
+        pipe.execute()
+
+
+def make_store():
+    if STORAGE_BACKEND == "sqlite":
+        from sqlite_store import SqliteStore
+        return SqliteStore(
+            SQLITE_PATH,
+            queue_member=SYNC_QUEUE_MEMBER,
+            dedup_ttl=SYNC_DEDUP_TTL,
+            stream_by_type=STREAM_BY_TYPE,
+            tokenize=tokenize,
+            rot_level=lambda data: task_rot_info(data)["level"],
+        )
+    if STORAGE_BACKEND != "redis":
+        raise RuntimeError(f"不認得的 STORAGE_BACKEND：{STORAGE_BACKEND}（redis / sqlite）")
+    return RedisStore()
+
+
+store = make_store()
+
+
+# -----------------------------------------------------
+# 腐爛度趨勢（rot-snapshot 定期記下每個 owner 各腐爛度的任務數）
+# -----------------------------------------------------
+# 每種解析度是一個固定大小的環：格子編號 = 時段編號 % 格數，
+# 新時段直接蓋掉一整圈以前的舊格子，不用另外清，每個 owner 最多 7×24 + 365 格。
+# 一格存「時段開始,樣本數,四個等級的任務數加總」，同一個時段記好幾次就累加，
+# 讀的時候除以樣本數 —— 每小時的 snapshot 同時加進「天」那一格，就是 downsample。
+ROT_LEVELS = (0, 30, 60, 90)
+ROT_BUCKETS = ("fresh", "mild", "medium", "critical")
+ROT_SERIES = {
+    "hour": (3600, 24 * 7),   # 一小時一格，留一週
+    "day": (86400, 365),      # 一天一格（台灣時間），留一年
+}
+
+# KEYS: 每種解析度的 hash（格子編號 → 那一格的內容）
+# ARGV: 四個等級的任務數，接著每個 KEY 一組（格子編號, 時段開始）
+ROT_SAMPLE_LUA = """
+local counts = {tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])}
+for i, key in ipairs(KEYS) do
+  local slot, period = ARGV[3 + 2 * i], ARGV[4 + 2 * i]
+  local values = {period, 0, 0, 0, 0, 0}
+  local old = redis.call('HGET', key, slot)
+  if old then
+    local parts = {}
+    for part in string.gmatch(old, '[^,]+') do parts[#parts + 1] = part end
+    if parts[1] == period then
+      for j = 2, 6 do values[j] = tonumber(parts[j]) end
+    end
+  end
+  values[2] = values[2] + 1
+  for j = 1, 4 do values[2 + j] = values[2 + j] + counts[j] end
+  redis.call('HSET', key, slot, table.concat(values, ','))
+end
+return 1
+"""
+rot_sample_script = register_script(ROT_SAMPLE_LUA)
+
+
+def rot_slots(now):
+    """[(解析度, 格子編號, 時段開始), ...]；天的邊界用台灣時間切"""
+    offset = TZ.utcoffset(None).total_seconds()
+    slots = []
+    for resolution, (seconds, size) in ROT_SERIES.items():
+        index = int((now + offset) // seconds)
+        slots.append((resolution, index % size, int(index * seconds - offset)))
+    return slots
+
+
+def rot_points(rows, start, end, seconds):
+    """store.rot_series 的 [(時段開始, 樣本數, 四個加總...)] → API 格式，時間由舊到新"""
+    points = []
+    for period, samples, *sums in sorted(rows):
+        if samples <= 0 or period + seconds <= start or period > end:
+            continue
+        counts = [s / samples for s in sums]
+        total = sum(counts)
+        mean = sum(level * c for level, c in zip(ROT_LEVELS, counts)) / total if total else 0
+        point = {"ts": period, "samples": samples, "mean": round(mean, 1)}
+        point.update({bucket: round(c, 2) for bucket, c in zip(ROT_BUCKETS, counts)})
+        points.append(point)
+    return points
+
+
+@app.route("/api/rot-history")
+def rot_history():
+    """
+    GET /api/rot-history?resolution=hour|day&start=<ts>&end=<ts> → JSON
+    沒給 start / end 就是整個保留範圍（hour：一週、day：一年），一次讀完
+    """
+    owner_key, display_name = get_current_owner()
+    if not owner_key:
+        return jsonify({"error": "not logged in"}), 401
+
+    resolution = request.args.get("resolution", "hour")
+    if resolution not in ROT_SERIES:
+        return jsonify({"error": "resolution must be hour or day"}), 400
+    seconds, size = ROT_SERIES[resolution]
+    try:
+        end = float(request.args.get("end") or time.time())
+        start = float(request.args.get("start") or end - seconds * size)
+    except ValueError:
+        return jsonify({"error": "start / end must be timestamps"}), 400
+
+    rows = store.rot_series(owner_key, resolution)
+    return jsonify({
+        "resolution": resolution,
+        "buckets": list(ROT_BUCKETS),
+        "points": rot_points(rows, start, end, seconds),
+    })
+
+
+@app.cli.command("rot-snapshot")
+def rot_snapshot_command():
+    """
+    記一筆每個 owner 的腐爛度分布（cron 每小時跑一次）。
+    Redis 只會重算腐爛度到期要變的任務，其他直接數排行榜。
+    """
+    if STORAGE_BACKEND == "redis":
+        use_cli_timeouts()
+    now = time.time()
+    slots = rot_slots(now)
+    owners = 0
+    for owner in store.iter_owners():
+        counts = store.rot_counts(owner, now)
+        counts = {level: counts.get(level, 0) for level in ROT_LEVELS}
+        store.add_rot_sample(owner, counts, slots)
+        if STORAGE_BACKEND == "redis":
+            publish_dirty_rot()
+        owners += 1
+    click.echo(f"記錄了 {owners} 個 owner 的腐爛度")
+
+
+# -----------------------------------------------------
+# 全站最臭排行榜（directory 上的兩個 sorted set，member 是使用者名字）
+# -----------------------------------------------------
+# 任務腐爛度一變（新增 / 修改 / 打卡 / 完成 / 刪除 / rot-snapshot 重算），
+# set_rot_levels 就把差值加到 owner 的 rot_sum / rot_critical，
+# request 結束時再把這兩個數字寫到排行榜（寫的是絕對值，重送 / 漏送一次下次就對了）。
+LEADERBOARD_KEYS = {
+    "sum": "leaderboard:rot_sum",            # 腐爛度總和
+    "critical": "leaderboard:rot_critical",  # 💥 任務數
+}
+LEADERBOARD_SIZE = 10
+
+
+def mark_rot_dirty(owner_key):
+    if has_app_context():
+        g.setdefault("rot_dirty", set()).add(owner_key)
+
+
+def publish_rot(owner_key):
+    """owner shard 上的總和 → directory 上的排行榜"""
+    rot_sum, critical = r.hmget(owner_meta_key(owner_key), "rot_sum", "rot_critical")
+    name = owner_key.split("#", 1)[0]
+    pipe = directory.pipeline(transaction=False)
+    for key, value in ((LEADERBOARD_KEYS["sum"], rot_sum),
+                       (LEADERBOARD_KEYS["critical"], critical)):
+        if int(value or 0) > 0:
+            pipe.zadd(key, {name: int(value)})
+        else:
+            pipe.zrem(key, name)
+    pipe.execute()
+
+
+def publish_dirty_rot():
+    for owner_key in g.pop("rot_dirty", ()):
+        publish_rot(owner_key)
+
+
+@app.after_request
+def publish_rot_changes(response):
+    if g.get("rot_dirty"):
+        try:
+            publish_dirty_rot()
+        except redis.exceptions.RedisError:
+            # 資料已經寫進去了，排行榜晚一點（下次寫入 / rot-snapshot）再更新就好
+            app.logger.warning("leaderboard update failed", exc_info=True)
+    return response
+
+
+@app.route("/api/leaderboard")
+def api_leaderboard():
+    """GET /api/leaderboard?by=sum|critical&limit=10 → JSON"""
+    owner_key, display_name = get_current_owner()
+    if not owner_key:
+        return jsonify({"error": "not logged in"}), 401
+    by = request.args.get("by", "sum")
+    if by not in LEADERBOARD_KEYS:
+        return jsonify({"error": "by must be sum or critical"}), 400
+    try:
+        limit = min(max(int(request.args.get("limit", LEADERBOARD_SIZE)), 1), 100)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    return jsonify({
+        "by": by,
+        "owners": [{"name": name, "score": score} for name, score in store.rot_leaderboard(by, limit)],
+    })
+
+
+# -----------------------------------------------------
+# 舊版 key 搬家（共用 tasks / streams → 每個 owner 自己的 hash tag）
+# -----------------------------------------------------
+# 上線步驟：
+#   1. 部署新版程式後馬上跑 `flask migrate-keyspace` 搬完所有人：
+#      每一批 owner 搬完就在 owner meta 記 layout，全部搬完會設定 keyspace:layout。
+#      request 只看這兩個旗標，還沒搬到的 owner 先回 503（不在 request 裡掃舊資料）。
+#   2. 全部搬完之後第一次出現的 owner 就是新 owner，直接記成新版。
+#   3. 確認沒問題後 `flask migrate-keyspace --purge` 刪掉舊 key。
+LAYOUT_FLAG_KEY = "keyspace:layout"
+LEGACY_STREAMS = ("task_events", "task_done", "task_checkin")
+MIGRATE_BATCH = 500
+
+# 搬一個任務：新 key 已經存在就跳過（可以重跑）
+# KEYS: 新 task key, owner 任務 list, 分類索引
+# ARGV: task id, field1, value1, field2, value2, ...
+MIGRATE_TASK_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('RPUSH', KEYS[2], ARGV[1])
+redis.call('SADD', KEYS[3], ARGV[1])
+return 1
+"""
+migrate_task_script = register_script(MIGRATE_TASK_LUA)
+
+
+def legacy_owner_key_pairs(owner_key):
+    """舊 key → 新 key（今日救援 queue / 排行榜 / 同步序號），分類索引搬任務時會重建"""
+    queue_key, current_key = get_queue_keys(owner_key)
+    seq_key, changes_key, tombstones_key = get_sync_keys(owner_key)
+    return [
+        (f"today_queue:{owner_key}", queue_key),
+        (f"today_queue:{owner_key}:current", current_key),
+        (f"rot_rank:{owner_key}", rot_rank_key(owner_key)),
+        (f"sync:{owner_key}:seq", seq_key),
+        (f"sync:{owner_key}:changes", changes_key),
+        (f"sync:{owner_key}:tombstones", tombstones_key),
+    ]
+
+
+def pending_owners(owners, cache):
+    """從 owners 裡挑出還沒搬完的（cache 記住查過的結果，避免一直查）"""
+    unknown = [o for o in owners if o not in cache]
+    if unknown:
+        pipe = r.pipeline(transaction=False)
+        for o in unknown:
+            pipe.hget(owner_meta_key(o), "layout")
+        for o, layout in zip(unknown, pipe.execute()):
+            cache[o] = layout == KEYSPACE_LAYOUT
+    return {o for o in owners if not cache[o]}
+
+
+def migrate_legacy_tasks(pause=0.0):
+    """走一遍舊的共用 tasks list，把任務搬到 owner 自己的 key，回傳搬到的 owner"""
+    migrated_cache = {}
+    seen = set()
+    start = 0
+    while True:
+        task_ids = r.lrange("tasks", start, start + MIGRATE_BATCH - 1)
+        if not task_ids:
+            break
+        start += len(task_ids)
+
+        pipe = r.pipeline(transaction=False)
+        for tid in task_ids:
+            pipe.hgetall(f"task:{tid}")
+        rows = [
+            (tid, data) for tid, data in zip(task_ids, pipe.execute())
+            if data.get("owner")
+        ]
+        todo = pending_owners({d["owner"] for _, d in rows}, migrated_cache)
+        rows = [(tid, d) for tid, d in rows if d["owner"] in todo]
+
+        pipe = r.pipeline(transaction=False)
+        for tid, data in rows:
+            owner = data["owner"]
+            seen.add(owner)
+            # 順便把中文分類換成英文代碼
+            category = data.get("category", "other")
+            data["category"] = CATEGORY_MAPPING.get(category, category)
+            args = [tid]
+            for field, value in data.items():
+                args += [field, value]
+            migrate_task_script(
+                keys=[
+                    task_key(owner, tid),
+                    owner_tasks_key(owner),
+                    cat_index_key(owner, data["category"]),
+                ],
+                args=args,
+                client=pipe,
+            )
+        pipe.execute()
+        if pause:
+            time.sleep(pause)
+    return seen
+
+
+def stream_id_tuple(ev_id):
+    ms, _, seq = ev_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def migrate_legacy_streams(pause=0.0):
+    """
+    走一遍舊的共用 streams，依 owner 分到各自的 stream。
+    保留原本的 entry ID，目標 stream 已經有的（ID 比較小）就跳過，可以重跑。
+    """
+    migrated_cache = {}
+    seen = set()
+    for stream in LEGACY_STREAMS:
+        dest_last = {}
+        last_id = "-"
+        while True:
+            entries = r.xrange(stream, min=last_id, max="+", count=MIGRATE_BATCH)
+            if not entries:
+                break
+            last_id = f"({entries[-1][0]}"
+
+            batch = [
+                (ev_id, fields) for ev_id, fields in entries
+                if fields.get("owner")
+            ]
+            todo = pending_owners({f["owner"] for _, f in batch}, migrated_cache)
+            batch = [(ev_id, f) for ev_id, f in batch if f["owner"] in todo]
+
+            # 第一次碰到的 owner，先查目標 stream 目前最後一筆
+            new_owners = list({f["owner"] for _, f in batch} - dest_last.keys())
+            if new_owners:
+                pipe = r.pipeline(transaction=False)
+                for owner in new_owners:
+                    pipe.xrevrange(stream_key(owner, stream), count=1)
+                for owner, tail in zip(new_owners, pipe.execute()):
+                    dest_last[owner] = stream_id_tuple(tail[0][0]) if tail else (0, 0)
+
+            pipe = r.pipeline(transaction=False)
+            for ev_id, fields in batch:
+                owner = fields["owner"]
+                if stream_id_tuple(ev_id) <= dest_last[owner]:
+                    continue
+                pipe.xadd(stream_key(owner, stream), fields, id=ev_id)
+                dest_last[owner] = stream_id_tuple(ev_id)
+                seen.add(owner)
+            # 跟線上新寫入撞 ID 的那幾筆就放掉，不要讓整批失敗
+            pipe.execute(raise_on_error=False)
+            if pause:
+                time.sleep(pause)
+    return seen
+
+
+def migrate_legacy_owner_keys(owners):
+    """queue / 排行榜 / 同步序號這些小 key 用 DUMP + RESTORE 原封不動搬過去"""
+    pairs = [p for owner in owners for p in legacy_owner_key_pairs(owner)]
+    if not pairs:
+        return
+    pipe = r.pipeline(transaction=False)
+    for old_key, _ in pairs:
+        pipe.dump(old_key)
+    dumps = pipe.execute()
+
+    pipe = r.pipeline(transaction=False)
+    for (old_key, new_key), payload in zip(pairs, dumps):
+        if payload is not None:
+            pipe.restore(new_key, 0, payload)
+    # 新 key 已經存在（BUSYKEY）代表已經搬過或已經有新資料，保留新的
+    pipe.execute(raise_on_error=False)
+
+
+def mark_owners_migrated(owners):
+    pipe = r.pipeline(transaction=False)
+    for owner in owners:
+        pipe.hset(owner_meta_key(owner), mapping={
+            "owner": owner,
+            "layout": KEYSPACE_LAYOUT,
+        })
+    pipe.execute()
+
+
+def ensure_redis_owner_layout(owner_key):
+    """只看旗標：回傳 False 代表 migrate-keyspace 還沒搬到這個 owner"""
+    pipe = r.pipeline(transaction=False)
+    pipe.hget(owner_meta_key(owner_key), "layout")
+    pipe.get(LAYOUT_FLAG_KEY)
+    pipe.exists("tasks", *LEGACY_STREAMS)
+    layout, global_layout, legacy_keys = pipe.execute()
+
+    if layout == KEYSPACE_LAYOUT:
+        return True
+    if global_layout != KEYSPACE_LAYOUT and not legacy_keys and len(SHARDS) == 1:
+        # 全新的資料庫，沒有舊資料要搬
+        r.set(LAYOUT_FLAG_KEY, KEYSPACE_LAYOUT)
+        global_layout = KEYSPACE_LAYOUT
+    if global_layout == KEYSPACE_LAYOUT or len(SHARDS) > 1:
+        # 全部都搬完了（多台 shard 前一定要先在單台搬完），這是新 owner
+        pin_new_owner(owner_key)
+        mark_owners_migrated([owner_key])
+        return True
+    return False
+
+
+@app.before_request
+def ensure_owner_layout():
+    """每個 session 只檢查一次：這個 owner 的資料是不是已經在新 key 上"""
+    owner_key = session.get("owner_key")
+    if (not owner_key or request.endpoint in BREAKER_EXEMPT
+            or session.get("layout") == KEYSPACE_LAYOUT):
+        return None
+    if not store.ensure_owner(owner_key):
+        # 還沒搬到的 owner 先別讀寫新 key（會看到空的、寫進去的也會被搬家蓋掉）
+        headers = {"Retry-After": "60"}
+        if request.endpoint in JSON_ENDPOINTS:
+            return jsonify({"error": "keyspace migration in progress"}), 503, headers
+        return "資料升級中，請過幾分鐘再試一次。", 503, headers
+    session["layout"] = KEYSPACE_LAYOUT
+    return None
+
+
+def use_cli_timeouts():
+    """維運指令改用 REDIS_CLI_SOCKET_TIMEOUT（已經開好的連線丟掉，之後新開的才會用新設定）"""
+    clients = list(SHARDS.values()) + [c for group in REPLICAS.values() for c in group]
+    for client in clients:
+        if REDIS_CLUSTER:
+            pools = [node.redis_connection.connection_pool
+                     for node in client.get_nodes() if node.redis_connection]
+        else:
+            pools = [client.connection_pool]
+        for pool in pools:
+            pool.connection_kwargs["socket_timeout"] = REDIS_CLI_SOCKET_TIMEOUT
+            pool.reset()
+
+
+def require_redis_backend():
+    if STORAGE_BACKEND != "redis":
+        raise click.ClickException("這個指令只適用於 STORAGE_BACKEND=redis")
+    use_cli_timeouts()
+
+
+@app.cli.command("migrate-keyspace")
+@click.option("--pause", default=0.0, show_default=True,
+              help="每批之間休息幾秒，避免影響線上延遲")
+@click.option("--purge", is_flag=True,
+              help="搬完後刪掉舊 key（要先完整搬過一次）")
+def migrate_keyspace_command(pause, purge):
+    """把舊版共用 key 搬到每個 owner 自己的 hash tag（可重跑）"""
+    require_redis_backend()
+    if len(SHARDS) > 1:
+        raise click.ClickException("舊資料只在單台上，請先用單台 REDIS_URL 搬完再加 shard")
+    if purge:
+        if r.get(LAYOUT_FLAG_KEY) != KEYSPACE_LAYOUT:
+            raise click.ClickException("還沒完整搬過一次，先不加 --purge 跑一次")
+        purge_legacy_keyspace(pause)
+        return
+
+    owners = migrate_legacy_tasks(pause=pause)
+    click.echo(f"tasks: {len(owners)} owners")
+    owners |= migrate_legacy_streams(pause=pause)
+    click.echo(f"streams: {len(owners)} owners")
+    owners = sorted(owners)
+    for i in range(0, len(owners), MIGRATE_BATCH):
+        batch = owners[i:i + MIGRATE_BATCH]
+        migrate_legacy_owner_keys(batch)
+        mark_owners_migrated(batch)
+    r.set(LAYOUT_FLAG_KEY, KEYSPACE_LAYOUT)
+    click.echo(f"done: {len(owners)} owners migrated")
+
+
+def purge_legacy_keyspace(pause=0.0):
+    """刪掉舊版 key：task:<id>、tasks、三條共用 streams、每個 owner 的舊 queue / 序號"""
+    owners = set()
+    while True:
+        task_ids = r.lrange("tasks", 0, MIGRATE_BATCH - 1)
+        if not task_ids:
+            break
+        pipe = r.pipeline(transaction=False)
+        for tid in task_ids:
+            pipe.hget(f"task:{tid}", "owner")
+        owners.update(o for o in pipe.execute() if o)
+
+        pipe = r.pipeline(transaction=False)
+        for tid in task_ids:
+            pipe.unlink(f"task:{tid}")
+        pipe.ltrim("tasks", len(task_ids), -1)
+        pipe.execute()
+        if pause:
+            time.sleep(pause)
+
+    for stream in LEGACY_STREAMS:
+        last_id = "-"
+        while True:
+            entries = r.xrange(stream, min=last_id, max="+", count=MIGRATE_BATCH)
+            if not entries:
+                break
+            last_id = f"({entries[-1][0]}"
+            owners.update(f["owner"] for _, f in entries if f.get("owner"))
+        r.unlink(stream)
+
+    keys = [old for owner in owners for old, _ in legacy_owner_key_pairs(owner)]
+    keys += [f"idx:{owner}:cat:{c}" for owner in owners for c in CATEGORIES]
+    for i in range(0, len(keys), MIGRATE_BATCH):
+        r.unlink(*keys[i:i + MIGRATE_BATCH])
+    click.echo(f"purged legacy keys for {len(owners)} owners")
+
+
+# -----------------------------------------------------
+# Shard 搬家（加 shard 之後把 owner 搬到 ring 上的新位置）
+# -----------------------------------------------------
+# 步驟：
+#   1. 舊設定下跑 `flask shards pin --add 名稱=URL`：
+#      算出加了新 shard 之後會換位置的 owner，先 pin 在原本那台（行為不變）。
+#      之後到 move 跑完前才出現的新 owner，第一次進來時也會照新的 ring pin 住。
+#   2. 部署新設定（REDIS_URLS 加上新 shard）。
+#   3. 跑 `flask shards move`：一批一批把 pin 住的 owner 搬到 ring 上的位置。
+#      每個 owner 搬的那幾秒只能讀不能寫（回 503），搬完解除 pin。
+SHARD_MOVE_BATCH = 50
+
+
+def scan_owners(client):
+    """掃 owner:{...} 這些 meta hash，列出這台 shard 上有哪些 owner"""
+    batch = []
+    for key in client.scan_iter(match="owner:{o:*}", count=MIGRATE_BATCH):
+        if not key.endswith("}"):
+            continue  # 跳過 owner:{...}:migrating 這種
+        batch.append(key)
+        if len(batch) >= MIGRATE_BATCH:
+            yield from owner_names(client, batch)
+            batch = []
+    if batch:
+        yield from owner_names(client, batch)
+
+
+def owner_names(client, meta_keys):
+    pipe = client.pipeline(transaction=False)
+    for key in meta_keys:
+        pipe.hget(key, "owner")
+    return [owner for owner in pipe.execute() if owner]
+
+
+def unlink_tag_keys(client, tag):
+    """刪掉這台 shard 上所有帶這個 owner hash tag 的 key（SCAN 整台），回傳刪了幾個"""
+    deleted = 0
+    batch = []
+    for key in client.scan_iter(match=f"*{tag}*", count=MIGRATE_BATCH):
+        batch.append(key)
+        if len(batch) >= MIGRATE_BATCH:
+            deleted += client.unlink(*batch)
+            batch = []
+    if batch:
+        deleted += client.unlink(*batch)
+    return deleted
+
+
+def scan_tag_keys(client, tags):
+    """
+    SCAN 整台一次，把帶這些 owner hash tag 的 key 全部找出來：{tag: [key]}。
+    任務、搜尋索引、去重記錄、限流桶子…不管是哪一種都算，不會漏搬 / 漏刪。
+    """
+    found = {tag: [] for tag in tags}
+    for key in client.scan_iter(match="*{o:*}*", count=MIGRATE_BATCH):
+        m = OWNER_TAG_RE.search(key)
+        if m and m.group(0) in found:
+            found[m.group(0)].append(key)
+    return found
+
+
+def copy_owner_keys(keys, source, target):
+    """DUMP / PTTL → RESTORE REPLACE（保留 TTL），回傳搬過去的 key"""
+    pipe = source.pipeline(transaction=False)
+    for key in keys:
+        pipe.dump(key)
+        pipe.pttl(key)
+    results = pipe.execute()
+
+    pipe = target.pipeline(transaction=False)
+    copied = []
+    for i, key in enumerate(keys):
+        payload, ttl = results[2 * i], results[2 * i + 1]
+        if payload is None:
+            continue
+        pipe.restore(key, max(ttl, 0), payload, replace=True)
+        copied.append(key)
+    pipe.execute()
+    return copied
+
+
+@app.cli.group("shards")
+def shards_group():
+    """owner shard 的搬家工具"""
+    require_redis_backend()
+
+
+@shards_group.command("status")
+def shards_status_command():
+    pins = directory.hgetall(SHARD_PINS_KEY)
+    moving = sum(1 for v in pins.values() if ">" in v)
+    click.echo(f"shards: {', '.join(SHARDS)} (directory: {DIRECTORY_SHARD})")
+    click.echo(f"pinned owners: {len(pins)} (moving: {moving})")
+    pending = directory.get(SHARD_PENDING_KEY)
+    if pending:
+        click.echo(f"pending shards: {pending}（新 owner 會自動 pin）")
+
+
+@shards_group.command("pin")
+@click.option("--add", "added", multiple=True, required=True,
+              help="要加入的 shard，格式 名稱=URL（可以多個）")
+def shards_pin_command(added):
+    """用目前的設定跑：把加了新 shard 後會換位置的 owner 先 pin 在原本那台"""
+    new_names = [name for name, _ in parse_shard_urls(",".join(added))]
+    new_ring = build_ring(list(SHARDS) + new_names)
+    # 先記下來，掃描途中 / 之後才出現的 owner 由 pin_new_owner 自己 pin
+    directory.set(SHARD_PENDING_KEY, ",".join(new_names))
+    total = 0
+    for name, client in SHARDS.items():
+        pins = {}
+        for owner in scan_owners(client):
+            tag = owner_tag(owner)
+            current, _ = shard_for(owner)
+            if current == name and ring_lookup(tag, new_ring) != name:
+                pins[tag] = name
+        if pins:
+            directory.hset(SHARD_PINS_KEY, mapping=pins)
+        total += len(pins)
+        click.echo(f"{name}: pinned {len(pins)} owners")
+    click.echo(f"done: {total} owners will move after the new shard is deployed")
+
+
+@shards_group.command("move")
+@click.option("--pause", default=0.0, show_default=True,
+              help="每批之間休息幾秒")
+def shards_move_command(pause):
+    """用新設定跑：把 pin 住的 owner 搬到 ring 上的位置，搬完解除 pin"""
+    # 要等所有 worker 都看到最新的 pin 才能開始搬 / 刪
+    settle = SHARD_PIN_REFRESH * 2 + 1
+
+    owners_by_tag = {}
+    for client in SHARDS.values():
+        for owner in scan_owners(client):
+            owners_by_tag[owner_tag(owner)] = owner
+
+    todo = []
+    for tag, pin in directory.hgetall(SHARD_PINS_KEY).items():
+        source = pin.partition(">")[0]
+        target = ring_lookup(tag)
+        owner = owners_by_tag.get(tag)
+        if source not in SHARDS or owner is None or target == source:
+            directory.hdel(SHARD_PINS_KEY, tag)
+            continue
+        todo.append((tag, owner, source, target))
+
+    moved = 0
+    for i in range(0, len(todo), SHARD_MOVE_BATCH):
+        batch = todo[i:i + SHARD_MOVE_BATCH]
+
+        # 1. 先凍結寫入（還是從來源讀）
+        directory.hset(SHARD_PINS_KEY, mapping={
+            tag: f"{source}>{target}" for tag, _, source, target in batch
+        })
+        time.sleep(settle)
+
+        # 2. 寫入都停了，每台來源掃一次找出這批 owner 的所有 key，
+        #    複製到目的地，解除 pin → 之後讀寫都走 ring
+        keys_by_tag = {}
+        for source in {source for _, _, source, _ in batch}:
+            keys_by_tag.update(scan_tag_keys(
+                SHARDS[source], [tag for tag, _, s, _ in batch if s == source]))
+        for tag, owner, source, target in batch:
+            copy_owner_keys(keys_by_tag[tag], SHARDS[source], SHARDS[target])
+        directory.hdel(SHARD_PINS_KEY, *[tag for tag, _, _, _ in batch])
+        time.sleep(settle)
+
+        # 3. 確定沒人再讀來源了才刪掉
+        for tag, owner, source, target in batch:
+            keys = keys_by_tag[tag]
+            for i in range(0, len(keys), MIGRATE_BATCH):
+                SHARDS[source].unlink(*keys[i:i + MIGRATE_BATCH])
+
+        moved += len(batch)
+        click.echo(f"moved {moved}/{len(todo)} owners")
+        if pause:
+            time.sleep(pause)
+
+    # 新 shard 都已經在設定裡了，之後的新 owner 直接照 ring 走
+    pending = directory.get(SHARD_PENDING_KEY)
+    if pending and set(pending.split(",")) <= set(SHARDS):
+        directory.delete(SHARD_PENDING_KEY)
+    left = directory.hlen(SHARD_PINS_KEY)
+    if left:
+        click.echo(f"還有 {left} 個 owner 在 pin 住（搬的途中才出現的），請再跑一次 shards move")
+
+
+# -----------------------------------------------------
+# fsck：檢查 / 修復每個 owner 的索引跟 task hash 對不對得起來
+# -----------------------------------------------------
+# 會檢查：tasks list、分類索引、排行榜（rot_rank / rot_due）、今日救援 queue、
+# 搜尋索引都只指向存在的任務，存在的任務也都在該在的索引裡；分類還是中文的舊資料改成代碼。
+# 可以邊跑線上服務邊跑：--rate 限制每秒送出的 Redis 指令數，修復用 WATCH 包住。
+FSCK_BATCH = 200
+FSCK_RETRIES = 3
+FSCK_KEY_RE = re.compile(r"^(task|search|owner):(\{o:[0-9a-f]+\})(?::(.*))?$")
+
+
+class Throttle:
+    """平均每秒最多送 rate 個 Redis 指令（0 = 不限）"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.started = time.monotonic()
+        self.spent = 0
+
+    def spend(self, n):
+        if not self.rate:
+            return
+        self.spent += n
+        ahead = self.spent / self.rate - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def scan_owner_keys(client, throttle):
+    """
+    SCAN 整台 shard 一次，把 task hash / 搜尋索引的 key 依 owner tag 分好：
+    {tag: {"meta": bool, "task": {id}, "notes": {id}, "token": {token}}}
+    （只留 ID / token 字串，不讀內容）
+    """
+    owners = {}
+    cursor = 0
+    while True:
+        cursor, keys = client.scan(cursor, count=1000)
+        throttle.spend(1)
+        for key in keys:
+            m = FSCK_KEY_RE.match(key)
+            if not m:
+                continue
+            kind, tag, rest = m.groups()
+            found = owners.setdefault(tag, {"meta": False, "task": set(), "notes": set(), "token": set()})
+            if kind == "owner":
+                found["meta"] = found["meta"] or rest is None
+            elif kind == "task" and rest:
+                found["task"].add(rest)
+            elif kind == "search" and rest:
+                sub, _, value = rest.partition(":")
+                if sub == "notes":
+                    found["notes"].add(value)
+                elif sub == "t":
+                    found["token"].add(value)
+        if cursor == 0:
+            return owners
+
+
+def batched_read(items, make_command, throttle):
+    """items 每 FSCK_BATCH 個一個 pipeline，回傳跟 items 一樣順序的結果"""
+    results = []
+    for i in range(0, len(items), FSCK_BATCH):
+        reader = r.pipeline(transaction=False)
+        for item in items[i:i + FSCK_BATCH]:
+            make_command(reader, item)
+        results += reader.execute()
+        throttle.spend(len(items[i:i + FSCK_BATCH]))
+    return results
+
+
+def dedupe(ids, keep):
+    """保留原本順序，去掉重複和不在 keep 裡的"""
+    seen = set()
+    out = []
+    for tid in ids:
+        if tid in keep and tid not in seen:
+            seen.add(tid)
+            out.append(tid)
+    return out
+
+
+def fsck_pass(owner_key, found, pipe, repair, throttle):
+    """
+    檢查一次，回傳 {問題: 筆數}。
+    先 WATCH 再讀，讀完才 MULTI 把修復指令排進去；repair 才 EXEC。
+    """
+    tasks_key = owner_tasks_key(owner_key)
+    queue_key, current_key = get_queue_keys(owner_key)
+    rank_key, due_key = rot_rank_key(owner_key), rot_due_key(owner_key)
+    cat_keys = {c: cat_index_key(owner_key, c) for c in CATEGORIES}
+    meta_key = owner_meta_key(owner_key)
+    fixed_keys = [tasks_key, queue_key, current_key, rank_key, due_key, meta_key,
+                  *cat_keys.values()]
+    pipe.watch(*fixed_keys)
+
+    reader = r.pipeline(transaction=False)
+    reader.lrange(tasks_key, 0, -1)
+    for key in cat_keys.values():
+        reader.smembers(key)
+    reader.zrange(rank_key, 0, -1, withscores=True)
+    reader.zrange(due_key, 0, -1)
+    reader.lrange(queue_key, 0, -1)
+    reader.get(current_key)
+    reader.hmget(meta_key, "rot_sum", "rot_critical")
+    listed, *cat_members, rank_scores, due, queued, current, totals = reader.execute()
+    throttle.spend(len(fixed_keys))
+    cat_members = dict(zip(CATEGORIES, cat_members))
+    ranked, due = {tid for tid, _ in rank_scores}, set(due)
+
+    # 讀到之後有人改 / 刪任務，EXEC 就會失敗整個重來
+    candidates = set(listed).union(*cat_members.values(), ranked, due, queued, found["task"])
+    candidates = sorted(candidates, key=lambda x: (len(x), x))
+    for i in range(0, len(candidates), FSCK_BATCH):
+        pipe.watch(*[task_key(owner_key, tid) for tid in candidates[i:i + FSCK_BATCH]])
+    raws = batched_read(candidates, lambda p, tid: p.hgetall(task_key(owner_key, tid)), throttle)
+
+    issues = {}
+
+    def report(issue, n=1):
+        if n:
+            issues[issue] = issues.get(issue, 0) + n
+
+    valid = {}
+    for tid, raw in zip(candidates, raws):
+        data = decode_task(owner_key, tid, raw)
+        if not data:
+            continue
+        if data.get("owner") != owner_key:
+            report("task hash 的 owner 不符（只回報）")
+            continue
+        valid[tid] = data
+
+    notes_of = dict(zip(valid, batched_read(
+        list(valid), lambda p, tid: p.smembers(search_notes_key(owner_key, tid)), throttle)))
+    expected_tokens = {}
+    for tid, data in valid.items():
+        for token in tokenize(data.get("title")) | notes_of[tid]:
+            expected_tokens.setdefault(token, set()).add(tid)
+    tokens = sorted(found["token"] | set(expected_tokens))
+    token_members = batched_read(
+        tokens, lambda p, tok: p.smembers(search_token_key(owner_key, tok)), throttle)
+
+    # 讀完了，下面的修復指令都先排在交易裡
+    pipe.multi()
+
+    # tasks list：去重、拿掉不存在的、補上沒被列到的
+    fixed_list = dedupe(listed, valid)
+    unlisted = [tid for tid in sorted(valid, key=int) if tid not in set(fixed_list)]
+    report("tasks list 指向不存在的任務", len(set(listed) - set(valid)))
+    report("tasks list 重複", len(listed) - len(set(listed)))
+    report("任務不在 tasks list 裡", len(unlisted))
+    if fixed_list + unlisted != listed:
+        pipe.delete(tasks_key)
+        if fixed_list + unlisted:
+            pipe.rpush(tasks_key, *(fixed_list + unlisted))
+
+    # 分類：舊的中文分類改成代碼，索引跟著修
+    for tid, data in valid.items():
+        raw_cat = data.get("category", "other")
+        if raw_cat in CATEGORY_MAPPING:
+            report("舊格式分類（中文）")
+            valid[tid] = dict(data, category=CATEGORY_MAPPING[raw_cat])
+            write_task(pipe, owner_key, tid, valid[tid])
+    for cat, members in cat_members.items():
+        expected = {tid for tid, data in valid.items() if data.get("category") == cat}
+        extra, missing = members - expected, expected - members
+        report("分類索引多出來的 ID", len(extra))
+        report("分類索引少了的任務", len(missing))
+        if extra:
+            pipe.srem(cat_keys[cat], *extra)
+        if missing:
+            pipe.sadd(cat_keys[cat], *missing)
+
+    # 排行榜 / 腐爛度重算時間；owner 的腐爛度總和要跟排行榜上的對得起來
+    # （後面的修復會用差值更新總和，所以這裡先把原本的落差補掉）
+    drift_sum = int(totals[0] or 0) - int(sum(score for _, score in rank_scores))
+    drift_critical = int(totals[1] or 0) - sum(1 for _, score in rank_scores if score >= 90)
+    report("owner 腐爛度總和不符", int(bool(drift_sum or drift_critical)))
+    if drift_sum:
+        pipe.hincrby(meta_key, "rot_sum", -drift_sum)
+    if drift_critical:
+        pipe.hincrby(meta_key, "rot_critical", -drift_critical)
+    if drift_sum or drift_critical:
+        mark_rot_dirty(owner_key)
+
+    extra = (ranked | due) - set(valid)
+    unranked = [(tid, data) for tid, data in valid.items() if tid not in ranked or tid not in due]
+    report("排行榜指向不存在的任務", len(extra))
+    report("任務不在排行榜裡", len(unranked))
+    if extra:
+        set_rot_levels(pipe, owner_key, dict.fromkeys(extra))
+        pipe.zrem(due_key, *extra)
+    rank_tasks(pipe, owner_key, unranked)
+
+    # 今日救援 queue
+    fixed_queue = dedupe(queued, valid)
+    report("救援 queue 指向不存在的任務", len(set(queued) - set(valid)))
+    report("救援 queue 重複", len(queued) - len(set(queued)))
+    if fixed_queue != queued:
+        pipe.delete(queue_key)
+        if fixed_queue:
+            pipe.rpush(queue_key, *fixed_queue)
+    if current and current not in valid:
+        report("抽中的救援任務已經不存在")
+        pipe.delete(current_key)
+
+    # 搜尋索引：token set 裡只能有「標題或備註有這個 token」的任務
+    for token, members in zip(tokens, token_members):
+        expected = expected_tokens.get(token, set())
+        extra, missing = members - expected, expected - members
+        report("搜尋索引多出來的 ID", len(extra))
+        report("搜尋索引少了的任務", len(missing))
+        if extra:
+            pipe.srem(search_token_key(owner_key, token), *extra)
+        if missing:
+            pipe.sadd(search_token_key(owner_key, token), *missing)
+    stale_notes = found["notes"] - set(valid)
+    report("已刪除任務的備註 token", len(stale_notes))
+    if stale_notes:
+        pipe.delete(*[search_notes_key(owner_key, tid) for tid in stale_notes])
+
+    if repair and issues:
+        throttle.spend(len(pipe.command_stack))
+        pipe.execute()
+    return issues
+
+
+def fsck_owner(owner_key, found, repair, throttle):
+    """中間有人寫入（WatchError）就整個 owner 重來，最多 FSCK_RETRIES 次"""
+    for _ in range(FSCK_RETRIES):
+        with r.pipeline(transaction=True) as pipe:
+            try:
+                return fsck_pass(owner_key, found, pipe, repair, throttle)
+            except redis.WatchError:
+                continue
+    return {"一直有人在寫入，這次跳過": 1}
+
+
+@app.cli.command("fsck")
+@click.option("--repair", is_flag=True, help="發現問題就修（沒加只回報）")
+@click.option("--rate", default=2000, show_default=True,
+              help="每秒最多送幾個 Redis 指令（0 = 不限），避免影響線上延遲")
+def fsck_command(repair, rate):
+    """檢查每個 owner 的索引跟 task hash 對不對得起來，--repair 順便修好"""
+    require_redis_backend()
+    throttle = Throttle(rate)
+    totals = {}
+    for name, client in SHARDS.items():
+        found_by_tag = scan_owner_keys(client, throttle)
+        meta_tags = [tag for tag, found in found_by_tag.items() if found["meta"]]
+        orphan_tags = len(found_by_tag) - len(meta_tags)
+        if orphan_tags:
+            click.echo(f"[{name}] {orphan_tags} 個 tag 有資料但沒有 owner meta（只回報）")
+            totals["沒有 owner meta 的 tag"] = totals.get("沒有 owner meta 的 tag", 0) + orphan_tags
+        g.redis = client
+        owners = batched_read(meta_tags, lambda p, tag: p.hget(f"owner:{tag}", "owner"), throttle)
+        checked = 0
+        for tag, owner in zip(meta_tags, owners):
+            if not owner or shard_for(owner)[0] != name:
+                continue  # 搬家中 / 殘留的副本，不歸這台管
+            issues = fsck_owner(owner, found_by_tag[tag], repair, throttle)
+            if repair:
+                publish_dirty_rot()
+            else:
+                g.pop("rot_dirty", None)
+            checked += 1
+            if issues:
+                click.echo(f"[{name}] {tag}: " + "，".join(f"{k} {v}" for k, v in issues.items()))
+            for issue, n in issues.items():
+                totals[issue] = totals.get(issue, 0) + n
+        click.echo(f"[{name}] 檢查了 {checked} 個 owner")
+
+    if not totals:
+        click.echo("沒有發現問題")
+        return
+    click.echo("== 總計" + ("（已修復）" if repair else "（加 --repair 修復）"))
+    for issue, n in sorted(totals.items(), key=lambda kv: -kv[1]):
+        click.echo(f"{issue}: {n}")
+
+
+# -----------------------------------------------------
+# 備份 / 還原（SCAN + DUMP / PTTL → 壓縮的 chunk 檔 + manifest.json）
+# -----------------------------------------------------
+# 備份目錄裡每個 chunk 檔是 gzip 過的一串紀錄：
+#   (key 長度, 到期時間 ms epoch（0 = 不會過期）, DUMP 長度) + key + DUMP 內容
+# manifest.json 記每個 chunk 是哪台 shard 的、幾個 key、sha256。
+# 每個 key 各自是 DUMP 當下的內容（不是整台同一瞬間的快照），備份時線上寫入照常。
+# DUMP 的格式跟 Redis 版本綁在一起，只能還原到同版或更新版的 Redis。
+BACKUP_FORMAT = 1
+BACKUP_CHUNK_KEYS = 5000
+# 一個 pipeline 最多幾個 DUMP / RESTORE，避免單次回應太大卡住 Redis
+BACKUP_PIPELINE = 500
+BACKUP_RECORD = struct.Struct(">IqI")
+OWNER_TAG_RE = re.compile(r"\{o:[0-9a-f]+\}")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_batches(client, size, pause=0.0):
+    """SCAN 整台，每 size 個 key 交出一批"""
+    batch = []
+    for key in client.scan_iter(count=1000):
+        batch.append(key)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+            if pause:
+                time.sleep(pause)
+    if batch:
+        yield batch
+
+
+def backup_chunk(client, shard, seq, keys, out_dir):
+    """一批 key 用 pipeline DUMP + PTTL，邊讀邊寫進一個 chunk 檔"""
+    name = f"{shard}-{seq:06d}.bin.gz"
+    path = os.path.join(out_dir, name)
+    written = 0
+    with gzip.open(path, "wb", compresslevel=6) as f:
+        for i in range(0, len(keys), BACKUP_PIPELINE):
+            batch = keys[i:i + BACKUP_PIPELINE]
+            pipe = client.pipeline(transaction=False)
+            for key in batch:
+                pipe.dump(key)
+                pipe.pttl(key)
+            results = pipe.execute()
+            now_ms = int(time.time() * 1000)
+            for j, key in enumerate(batch):
+                payload, ttl = results[2 * j], results[2 * j + 1]
+                if payload is None:
+                    continue  # SCAN 到之後就被刪掉了
+                expire_at = now_ms + ttl if ttl > 0 else 0
+                raw_key = key.encode("utf-8")
+                f.write(BACKUP_RECORD.pack(len(raw_key), expire_at, len(payload)))
+                f.write(raw_key)
+                f.write(payload)
+                written += 1
+    return {
+        "file": name,
+        "shard": shard,
+        "keys": written,
+        "bytes": os.path.getsize(path),
+        "sha256": file_sha256(path),
+    }
+
+
+def read_chunk(path):
+    """一筆一筆讀 chunk 檔：(key, 到期時間 ms, DUMP 內容)，不會整個檔案讀進記憶體"""
+    with gzip.open(path, "rb") as f:
+        while True:
+            header = f.read(BACKUP_RECORD.size)
+            if not header:
+                return
+            key_len, expire_at, payload_len = BACKUP_RECORD.unpack(header)
+            key = f.read(key_len).decode("utf-8")
+            yield key, expire_at, f.read(payload_len)
+
+
+def run_parallel(workers, jobs, fn):
+    """jobs 是 generator，最多同時 workers * 2 個在跑 / 排隊（記憶體不會跟著 key 數變大）"""
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for job in jobs:
+            pending.add(pool.submit(fn, *job))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                results += [fut.result() for fut in done]
+        results += [fut.result() for fut in pending]
+    return results
+
+
+def restore_shard(key, source_shard):
+    """key 要還原到哪台：有 owner tag 照目前的 ring / pin 決定，其他回原本那台（沒了就 directory）"""
+    m = OWNER_TAG_RE.search(key)
+    if m:
+        return shard_for_tag(m.group(0))[0]
+    return source_shard if source_shard in SHARDS else DIRECTORY_SHARD
+
+
+def restore_chunk(path, source_shard, wanted, replace):
+    """wanted(key) 回傳 False 的跳過；回傳 {restored / exists / expired / errors: 數量}"""
+    stats = {"restored": 0, "exists": 0, "expired": 0, "errors": 0}
+    pipes = {}
+
+    def flush(pipe):
+        for result in pipe.execute(raise_on_error=False):
+            if not isinstance(result, Exception):
+                stats["restored"] += 1
+            elif "BUSYKEY" in str(result):
+                stats["exists"] += 1
+            else:
+                stats["errors"] += 1
+
+    now_ms = int(time.time() * 1000)
+    for key, expire_at, payload in read_chunk(path):
+        if not wanted(key):
+            continue
+        if expire_at and expire_at <= now_ms:
+            stats["expired"] += 1
+            continue
+        name = restore_shard(key, source_shard)
+        pipe = pipes.get(name)
+        if pipe is None:
+            pipe = pipes[name] = SHARDS[name].pipeline(transaction=False)
+        # 到期時間記的是絕對時間，備份放多久都不會讓 key 多活
+        ttl = expire_at - now_ms if expire_at else 0
+        pipe.restore(key, ttl, payload, replace=replace)
+        if len(pipe) >= BACKUP_PIPELINE:
+            flush(pipe)
+    for pipe in pipes.values():
+        if len(pipe):
+            flush(pipe)
+    return stats
+
+
+@app.cli.command("backup")
+@click.argument("out_dir")
+@click.option("--workers", default=4, show_default=True, help="同時 DUMP / 寫檔的 thread 數")
+@click.option("--chunk-keys", default=BACKUP_CHUNK_KEYS, show_default=True, help="每個 chunk 檔幾個 key")
+@click.option("--pause", default=0.0, show_default=True, help="每批 SCAN 之間休息幾秒")
+def backup_command(out_dir, workers, chunk_keys, pause):
+    """把每台 shard 的所有 key 備份到 OUT_DIR（可以邊跑線上服務邊備份）"""
+    require_redis_backend()
+    os.makedirs(out_dir, exist_ok=False)
+    started = datetime.now(TZ)
+
+    def jobs():
+        for name, client in SHARDS.items():
+            for seq, keys in enumerate(scan_batches(client, chunk_keys, pause)):
+                yield client, name, seq, keys, out_dir
+
+    chunks = sorted(run_parallel(workers, jobs(), backup_chunk), key=lambda c: c["file"])
+    manifest = {
+        "format": BACKUP_FORMAT,
+        "started_at": started.isoformat(),
+        "finished_at": datetime.now(TZ).isoformat(),
+        "shards": list(SHARDS),
+        "directory": DIRECTORY_SHARD,
+        "keyspace_layout": KEYSPACE_LAYOUT,
+        "task_codec": TASK_CODEC_VERSION,
+        "keys": sum(c["keys"] for c in chunks),
+        "bytes": sum(c["bytes"] for c in chunks),
+        "chunks": chunks,
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    click.echo(f"backed up {manifest['keys']} keys in {len(chunks)} chunks "
+               f"({human_bytes(manifest['bytes'])}) → {out_dir}")
+
+
+@app.cli.command("restore")
+@click.argument("backup_dir")
+@click.option("--owner", "owner_key", default=None,
+              help="只還原這個 owner（格式：名字#密語），包含登入用的 user:名字；"
+                   "會先刪掉這個 owner 目前所有的 key，還原成備份當下的樣子")
+@click.option("--replace", is_flag=True, help="已經存在的 key 直接蓋掉（沒加就跳過；--owner 一律覆蓋）")
+@click.option("--workers", default=4, show_default=True, help="同時還原的 chunk 數")
+def restore_command(backup_dir, owner_key, replace, workers):
+    """
+    從 backup 的目錄還原。owner 的 key 依目前的 shard 設定放到該去的那台，
+    所以備份之後加減過 shard 也可以還原。
+    """
+    require_redis_backend()
+    with open(os.path.join(backup_dir, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != BACKUP_FORMAT:
+        raise click.ClickException(f"不認得的備份格式：{manifest.get('format')}")
+    if manifest.get("keyspace_layout") != KEYSPACE_LAYOUT:
+        raise click.ClickException("備份的 key 配置版本跟目前不同，請先用同版程式還原再 migrate-keyspace")
+
+    for chunk in manifest["chunks"]:
+        if file_sha256(os.path.join(backup_dir, chunk["file"])) != chunk["sha256"]:
+            raise click.ClickException(f"{chunk['file']} 的 sha256 不符，備份可能壞了")
+
+    if owner_key:
+        tag = owner_tag(owner_key)
+        user_key = f"user:{owner_key.split('#', 1)[0]}"
+
+        def wanted(key):
+            return tag in key or key == user_key
+
+        # 還原成備份當下的樣子：備份之後才出現的任務 / 索引先清掉，
+        # 不然會新舊混在一起（之後 fsck --repair 還會把孤兒任務接回去）
+        cleared = sum(unlink_tag_keys(client, tag) for client in SHARDS.values())
+        click.echo(f"cleared {cleared} current keys of {owner_key}")
+        replace = True
+    else:
+        def wanted(key):
+            return True
+
+    jobs = (
+        (os.path.join(backup_dir, chunk["file"]), chunk["shard"], wanted, replace)
+        for chunk in manifest["chunks"]
+    )
+    totals = {}
+    for stats in run_parallel(workers, jobs, restore_chunk):
+        for k, v in stats.items():
+            totals[k] = totals.get(k, 0) + v
+    click.echo(", ".join(f"{k} {v}" for k, v in totals.items()))
+    if owner_key:
+        # 排行榜在 directory 上，只還原一個 owner 時要自己補回去
+        g.redis = SHARDS[shard_for(owner_key)[0]]
+        publish_rot(owner_key)
+    if totals.get("exists") and not replace:
+        click.echo("已經存在的 key 沒有動；要覆蓋請加 --replace")
+
+
+# -----------------------------------------------------
+# 精簡編碼轉換 / 記憶體用量報告
+# -----------------------------------------------------
+COMPACT_BATCH = 100
+# memory-report：這些前綴是 stream，另外算「每筆 entry 幾 bytes」
+STREAM_KINDS = LEGACY_STREAMS
+
+
+def compact_owner_tasks(owner_key, pause=0.0):
+    """
+    把一個 owner 還是舊格式的 task hash 轉成新格式，回傳轉了幾個。
+    用 WATCH 包住每一批，中間剛好有人改到就整批重讀重做，不會蓋掉線上的寫入。
+    """
+    converted = 0
+    task_ids = r.lrange(owner_tasks_key(owner_key), 0, -1)
+    for i in range(0, len(task_ids), COMPACT_BATCH):
+        batch = task_ids[i:i + COMPACT_BATCH]
+        keys = [task_key(owner_key, tid) for tid in batch]
+        with r.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    pipe.watch(*keys)
+                    reader = r.pipeline(transaction=False)
+                    for key in keys:
+                        reader.hgetall(key)
+                    legacy = [
+                        (tid, raw) for tid, raw in zip(batch, reader.execute())
+                        if raw and raw.get("v") != TASK_CODEC_VERSION
+                        and raw.get("owner") == owner_key
+                    ]
+                    pipe.multi()
+                    for tid, raw in legacy:
+                        write_task(pipe, owner_key, tid, raw)
+                    pipe.execute()
+                    converted += len(legacy)
+                    break
+                except redis.WatchError:
+                    continue
+        if pause:
+            time.sleep(pause)
+    return converted
+
+
+@app.cli.command("compact-tasks")
+@click.option("--pause", default=0.0, show_default=True,
+              help="每批之間休息幾秒，避免影響線上延遲")
+def compact_tasks_command(pause):
+    """把舊格式的 task hash 全部轉成精簡編碼（可以邊跑線上服務邊轉，可重跑）"""
+    require_redis_backend()
+    owners = converted = 0
+    for owner in store.iter_owners():
+        converted += compact_owner_tasks(owner, pause)
+        owners += 1
+    click.echo(f"compacted {converted} tasks for {owners} owners")
+
+
+def human_bytes(n):
+    if n < 1024:
+        return f"{n:.0f} B"
+    for unit in ("KB", "MB"):
+        n /= 1024.0
+        if n < 1024:
+            return f"{n:.1f} {unit}"
+    return f"{n / 1024.0:.1f} GB"
+
+
+def sample_keyspace(client, sample, pause=0.0):
+    """
+    SCAN 整個 keyspace，依前綴（第一個冒號前）數 key，
+    每一類用 reservoir sampling 留最多 sample 個 key 來量 MEMORY USAGE
+    """
+    counts = {}
+    samples = {}
+    for key in client.scan_iter(count=1000):
+        kind = key.split(":", 1)[0]
+        if key in (OWNER_ID_KEY, "task:id"):
+            kind = "counter"
+        n = counts.get(kind, 0) + 1
+        counts[kind] = n
+        bucket = samples.setdefault(kind, [])
+        if len(bucket) < sample:
+            bucket.append(key)
+        else:
+            j = random.randrange(n)
+            if j < sample:
+                bucket[j] = key
+        if pause and n % 1000 == 0:
+            time.sleep(pause)
+    return counts, samples
+
+
+@app.cli.command("memory-report")
+@click.option("--sample", default=200, show_default=True,
+              help="每一類 key 最多抽幾個量 MEMORY USAGE")
+@click.option("--pause", default=0.0, show_default=True,
+              help="SCAN 每 1000 個 key 休息幾秒")
+def memory_report_command(sample, pause):
+    """抽樣估算每個任務 / 每筆 stream entry / 每個 owner 佔多少記憶體"""
+    require_redis_backend()
+    for name, client in SHARDS.items():
+        counts, samples = sample_keyspace(client, sample, pause)
+
+        pipe = client.pipeline(transaction=False)
+        for kind, keys in samples.items():
+            for key in keys:
+                pipe.memory_usage(key)
+                if kind in STREAM_KINDS:
+                    pipe.xlen(key)
+                elif kind == "task":
+                    pipe.hget(key, "v")
+        results = iter(pipe.execute(raise_on_error=False))
+
+        rows = []
+        total = 0
+        stream_bytes = stream_entries = 0
+        compact = 0
+        for kind, keys in sorted(samples.items()):
+            used = []
+            for key in keys:
+                size = next(results)
+                extra = next(results) if kind in STREAM_KINDS or kind == "task" else None
+                if not isinstance(size, int):
+                    continue
+                used.append(size)
+                if kind in STREAM_KINDS and isinstance(extra, int):
+                    stream_bytes += size
+                    stream_entries += extra
+                elif kind == "task" and extra == TASK_CODEC_VERSION:
+                    compact += 1
+            avg = sum(used) / len(used) if used else 0
+            estimate = avg * counts[kind]
+            total += estimate
+            rows.append((kind, counts[kind], avg, estimate))
+
+        click.echo(f"== {name}: {sum(counts.values())} keys, ~{human_bytes(total)}")
+        click.echo(f"{'kind':<16}{'keys':>10}{'avg':>12}{'estimate':>12}")
+        for kind, count, avg, estimate in sorted(rows, key=lambda x: -x[3]):
+            click.echo(f"{kind:<16}{count:>10}{human_bytes(avg):>12}{human_bytes(estimate):>12}")
+
+        tasks = counts.get("task", 0)
+        owners = counts.get("owner", 0)
+        if tasks:
+            task_avg = next(avg for kind, _, avg, _ in rows if kind == "task")
+            sampled = len(samples["task"])
+            click.echo(f"per task hash: {human_bytes(task_avg)} "
+                       f"(compact encoding: {compact}/{sampled} sampled)")
+        if stream_entries:
+            click.echo(f"per stream entry: {human_bytes(stream_bytes / stream_entries)}")
+        if owners:
+            owner_total = sum(e for kind, _, _, e in rows
+                              if kind not in ("user", "counter", "shard", "keyspace"))
+            click.echo(f"per owner: {human_bytes(owner_total / owners)} ({owners} owners)")
+
+
+# -----------------------------------------------------
+# 首頁模板 render 量測
+# -----------------------------------------------------
+@app.cli.command("bench-render")
+@click.option("--sizes", default="10,100,1000", show_default=True, help="任務數量，逗號分隔")
+@click.option("--repeat", default=5, show_default=True, help="每個大小跑幾次取中位數")
+def bench_render_command(sizes, repeat):
+    """用假任務量測首頁模板的 render 時間與 HTML 大小（不會碰到資料庫）"""
+    # 四個等級的 emoji / 毒雞湯 / bucket 都跟正式資料一樣從 calc_rot_info 來
+    now = time.time()
+    levels = [calc_rot_info(now, "", "0", level) for level in (0, 30, 60, 90)]
+    categories = list(CATEGORIES)
+    for n in (int(x) for x in sizes.split(",") if x.strip()):
+        tasks = []
+        for i in range(n):
+            rot_info = levels[i % len(levels)]
+            tasks.append({
+                "id": str(i + 1),
+                "title": f"測試任務 {i + 1}",
+                "category": categories[i % len(categories)],
+                "created_at": "2024-01-01 10:00",
+                "deadline_str": "2024-01-02 10:00",
+                "is_routine": i % 3 == 0,
+                "initial_rot": 0,
+                "rot_level": rot_info["level"],
+                "rot_emoji": rot_info["emoji"],
+                "rot_message": rot_info["message"],
+                "rot_bucket": rot_info["bucket"],
+                "interval_days": 2 if i % 3 == 0 else 0,
+                "checked_today": i % 2 == 0,
+            })
+        tasks.sort(key=lambda t: t["rot_level"], reverse=True)
+        view = {
+            "tasks": tasks,
+            "rescue_task": None,
+            "queue_count": 0,
+            "top_rot_tasks": tasks[:3],
+            "leaderboard": [(f"使用者{i + 1}", LEADERBOARD_SIZE - i)
+                            for i in range(LEADERBOARD_SIZE)],
+            "category_counts": {c: n // len(categories) for c in categories},
+            "total_tasks": n,
+            "events": [],
+            "done_events": [],
+            "owner": "bench",
+        }
+        # 第一次沒有卡片快取（任務剛改過），之後是快取都在的情況
+        clear_task_cards()
+        timings = []
+        with app.test_request_context("/home"):
+            for _ in range(repeat):
+                started = time.perf_counter()
+                html = render_template("index.html", **view)
+                timings.append((time.perf_counter() - started) * 1000)
+        first, warm = timings[0], sorted(timings[1:] or timings)
+        click.echo(f"{n:>5} 個任務：第一次 {first:.1f} ms，"
+                   f"之後中位數 {warm[len(warm) // 2]:.1f} ms，HTML {len(html.encode()) / 1024:.0f} KiB")
+
+
 if __name__ == "__main__":
     # 這樣手機在同一個 Wi-Fi 下，用 http://你的IP:5000 就能連進來
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,760 @@
+"""
+內嵌 SQLite 儲存層（STORAGE_BACKEND=sqlite）
+
+跟 app.py 裡的 RedisStore 有一樣的方法，單機安裝 / CI 不用另外架 Redis。
+回傳的任務資料刻意做成跟 Redis hash 一樣「全部都是字串」的 dict，
+route 那邊不用分兩套寫法。
+"""
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    name   TEXT PRIMARY KEY,
+    secret TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS counters (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+
+-- 每個 owner 一列：同步序號、目前抽中的救援任務
+CREATE TABLE IF NOT EXISTS owners (
+    owner      TEXT PRIMARY KEY,
+    seq        INTEGER NOT NULL DEFAULT 0,
+    current_id TEXT
+);
+
+CREATE TABLE IF NOT EXISTS tasks (
+    id              INTEGER PRIMARY KEY,
+    owner           TEXT NOT NULL,
+    title           TEXT NOT NULL DEFAULT '',
+    category        TEXT NOT NULL DEFAULT 'other',
+    created_at      REAL,
+    deadline_ts     REAL,
+    is_routine      INTEGER NOT NULL DEFAULT 0,
+    initial_rot     INTEGER NOT NULL DEFAULT 0,
+    interval_days   INTEGER NOT NULL DEFAULT 0,
+    last_checkin_ts REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_owner_category ON tasks (owner, category);
+CREATE INDEX IF NOT EXISTS tasks_owner_deadline ON tasks (owner, deadline_ts);
+
+-- 今日救援 queue：pos 越小越前面
+CREATE TABLE IF NOT EXISTS queue (
+    pos     INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner   TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    UNIQUE (owner, task_id)
+);
+CREATE INDEX IF NOT EXISTS queue_owner_pos ON queue (owner, pos);
+
+-- 對應 Redis 的 task_events / task_done / task_checkin 三條 stream
+CREATE TABLE IF NOT EXISTS feed (
+    id     INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner  TEXT NOT NULL,
+    stream TEXT NOT NULL,
+    fields TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS feed_owner_stream ON feed (owner, stream, id);
+
+-- /sync 用：每個任務最後一次變動的序號（deleted=1 是 tombstone）
+CREATE TABLE IF NOT EXISTS changes (
+    owner   TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    seq     INTEGER NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (owner, task_id)
+);
+CREATE INDEX IF NOT EXISTS changes_owner_seq ON changes (owner, seq);
+
+-- 全文搜尋：token → 任務 ID（token 跟 app.py 的 tokenize 一樣切法）
+CREATE TABLE IF NOT EXISTS search_index (
+    owner   TEXT NOT NULL,
+    token   TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    PRIMARY KEY (owner, token, task_id)
+) WITHOUT ROWID;
+
+-- 打卡備註的 token（改標題 / 刪除任務時才知道哪些要留）
+CREATE TABLE IF NOT EXISTS search_notes (
+    owner   TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    token   TEXT NOT NULL,
+    PRIMARY KEY (owner, task_id, token)
+) WITHOUT ROWID;
+
+-- 腐爛度趨勢：跟 Redis 的 rot_ts hash 一樣是固定格數的環（slot 重複使用）
+CREATE TABLE IF NOT EXISTS rot_series (
+    owner      TEXT NOT NULL,
+    resolution TEXT NOT NULL,
+    slot       INTEGER NOT NULL,
+    period     INTEGER NOT NULL,
+    samples    INTEGER NOT NULL,
+    fresh      INTEGER NOT NULL,
+    mild       INTEGER NOT NULL,
+    medium     INTEGER NOT NULL,
+    critical   INTEGER NOT NULL,
+    PRIMARY KEY (owner, resolution, slot)
+) WITHOUT ROWID;
+
+-- /sync/checkins 的 client_id 去重
+CREATE TABLE IF NOT EXISTS seen (
+    owner      TEXT NOT NULL,
+    client_id  TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (owner, client_id)
+);
+"""
+
+TASK_COLUMNS = (
+    "id", "owner", "title", "category", "created_at", "deadline_ts",
+    "is_routine", "initial_rot", "interval_days", "last_checkin_ts",
+)
+SELECT_TASK = "SELECT " + ", ".join(TASK_COLUMNS) + " FROM tasks"
+
+
+def to_hash(row):
+    """SQLite row → 跟 Redis hash 一樣的字串 dict（NULL 變成空字串）"""
+    return {k: "" if row[k] is None else str(row[k]) for k in row.keys()}
+
+
+def to_number(value):
+    """表單 / 匯入進來的值，能轉數字就轉，空字串當 NULL"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value  # 舊資料的 ISO 字串，原樣存
+
+
+def to_int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+class SqliteStore:
+    """每個 thread 自己一條連線；寫入一律包在 BEGIN IMMEDIATE 交易裡"""
+
+    def __init__(self, path, queue_member, dedup_ttl, stream_by_type, tokenize, rot_level):
+        self.path = path
+        # 以下都是 app.py 傳進來的設定 / 函式，避免兩邊各寫一份
+        self.queue_member = queue_member
+        self.dedup_ttl = dedup_ttl
+        self.stream_by_type = stream_by_type
+        self.tokenize = tokenize
+        self.rot_level = rot_level
+        self._local = threading.local()
+        # executescript 會自己 COMMIT，不能包在 _tx 裡
+        self._conn().executescript(SCHEMA)
+
+    # -------------------------------------------------
+    # 連線 / 交易
+    # -------------------------------------------------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # 固定的 SQL 字串 + 參數，sqlite3 會把 prepared statement 留在快取裡重複用
+            conn = sqlite3.connect(
+                self.path,
+                timeout=5.0,
+                isolation_level=None,
+                cached_statements=256,
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _tx(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _allocate_ids(self, conn, n):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES ('task:id', 0) "
+            "ON CONFLICT (name) DO NOTHING"
+        )
+        conn.execute(
+            "UPDATE counters SET value = value + ? WHERE name = 'task:id'", (n,)
+        )
+        last_id = conn.execute(
+            "SELECT value FROM counters WHERE name = 'task:id'"
+        ).fetchone()[0]
+        return [str(i) for i in range(last_id - n + 1, last_id + 1)]
+
+    def _touch(self, conn, owner_key, changed=(), deleted=()):
+        """跟 Redis 版的 record_change 一樣：序號 +1，記下有變動 / 被刪掉的 ID"""
+        if not changed and not deleted:
+            return None
+        conn.execute(
+            "INSERT INTO owners (owner, seq) VALUES (?, 1) "
+            "ON CONFLICT (owner) DO UPDATE SET seq = seq + 1",
+            (owner_key,),
+        )
+        seq = conn.execute(
+            "SELECT seq FROM owners WHERE owner = ?", (owner_key,)
+        ).fetchone()[0]
+        conn.executemany(
+            "INSERT INTO changes (owner, task_id, seq, deleted) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (owner, task_id) DO UPDATE "
+            "SET seq = excluded.seq, deleted = excluded.deleted",
+            [(owner_key, str(t), seq, 0) for t in changed]
+            + [(owner_key, str(t), seq, 1) for t in deleted],
+        )
+        return seq
+
+    def _feed(self, conn, owner_key, stream, fields):
+        conn.execute(
+            "INSERT INTO feed (owner, stream, fields) VALUES (?, ?, ?)",
+            (owner_key, stream, json.dumps(fields, ensure_ascii=False)),
+        )
+
+    def _index(self, conn, owner_key, task_id, tokens):
+        conn.executemany(
+            "INSERT INTO search_index (owner, token, task_id) VALUES (?, ?, ?) "
+            "ON CONFLICT DO NOTHING",
+            [(owner_key, t, str(task_id)) for t in tokens],
+        )
+
+    def _unindex(self, conn, owner_key, task_id, tokens):
+        conn.executemany(
+            "DELETE FROM search_index WHERE owner = ? AND token = ? AND task_id = ?",
+            [(owner_key, t, str(task_id)) for t in tokens],
+        )
+
+    def _note_tokens(self, conn, owner_key, task_id):
+        return {row[0] for row in conn.execute(
+            "SELECT token FROM search_notes WHERE owner = ? AND task_id = ?",
+            (owner_key, str(task_id)),
+        )}
+
+    def _index_note(self, conn, owner_key, task_id, note):
+        tokens = self.tokenize(note)
+        conn.executemany(
+            "INSERT INTO search_notes (owner, task_id, token) VALUES (?, ?, ?) "
+            "ON CONFLICT DO NOTHING",
+            [(owner_key, str(task_id), t) for t in tokens],
+        )
+        self._index(conn, owner_key, task_id, tokens)
+
+    def _owned(self, conn, owner_key, task_ids):
+        if not task_ids:
+            return []
+        marks = ",".join("?" * len(task_ids))
+        rows = conn.execute(
+            f"{SELECT_TASK} WHERE owner = ? AND id IN ({marks})",
+            (owner_key, *task_ids),
+        ).fetchall()
+        by_id = {str(row["id"]): to_hash(row) for row in rows}
+        return [(tid, by_id[tid]) for tid in task_ids if tid in by_id]
+
+    # -------------------------------------------------
+    # 使用者
+    # -------------------------------------------------
+    def get_user_secret(self, name):
+        row = self._conn().execute(
+            "SELECT secret FROM users WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def create_user(self, name, secret):
+        with self._tx() as conn:
+            cur = conn.execute(
+                "INSERT INTO users (name, secret) VALUES (?, ?) "
+                "ON CONFLICT (name) DO NOTHING",
+                (name, secret),
+            )
+            return cur.rowcount == 1
+
+    def ensure_owner(self, owner_key):
+        return True
+
+    # -------------------------------------------------
+    # 任務
+    # -------------------------------------------------
+    def list_tasks(self, owner_key):
+        rows = self._conn().execute(
+            f"{SELECT_TASK} WHERE owner = ? ORDER BY id", (owner_key,)
+        ).fetchall()
+        return [(str(row["id"]), to_hash(row)) for row in rows]
+
+    def iter_tasks(self, owner_key, chunk):
+        last_id = 0
+        while True:
+            rows = self._conn().execute(
+                f"{SELECT_TASK} WHERE owner = ? AND id > ? ORDER BY id LIMIT ?",
+                (owner_key, last_id, chunk),
+            ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1]["id"]
+            for row in rows:
+                yield str(row["id"]), to_hash(row)
+
+    def get_task(self, owner_key, task_id):
+        owned = self._owned(self._conn(), owner_key, [str(task_id)])
+        return owned[0][1] if owned else {}
+
+    def get_tasks(self, owner_key, task_ids):
+        return self._owned(self._conn(), owner_key, [str(t) for t in task_ids])
+
+    def _insert_task(self, conn, owner_key, task_id, data):
+        conn.execute(
+            "INSERT INTO tasks (id, owner, title, category, created_at, deadline_ts, "
+            "is_routine, initial_rot, interval_days, last_checkin_ts) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                int(task_id), owner_key,
+                data.get("title", ""),
+                data.get("category", "other"),
+                to_number(data.get("created_at")),
+                to_number(data.get("deadline_ts")),
+                to_int(data.get("is_routine")),
+                to_int(data.get("initial_rot")),
+                to_int(data.get("interval_days")),
+                to_number(data.get("last_checkin_ts")),
+            ),
+        )
+
+    def create_task(self, owner_key, task_data):
+        with self._tx() as conn:
+            task_id = self._allocate_ids(conn, 1)[0]
+            self._insert_task(conn, owner_key, task_id, task_data)
+            self._index(conn, owner_key, task_id, self.tokenize(task_data.get("title")))
+            self._feed(conn, owner_key, "task_events", {
+                "type": "created",
+                "task_id": task_id,
+                "title": task_data.get("title", ""),
+                "category": task_data.get("category", "other"),
+                "owner": owner_key,
+                "ts": str(int(float(task_data.get("created_at") or time.time()))),
+            })
+            self._touch(conn, owner_key, changed=[task_id])
+        return task_id
+
+    def update_task(self, owner_key, task_id, task_data, old_category):
+        with self._tx() as conn:
+            old = self._owned(conn, owner_key, [str(task_id)])
+            old_tokens = self.tokenize(old[0][1].get("title")) if old else set()
+            new_tokens = self.tokenize(task_data.get("title"))
+            self._unindex(conn, owner_key, task_id,
+                          old_tokens - new_tokens
+                          - self._note_tokens(conn, owner_key, task_id))
+            self._index(conn, owner_key, task_id, new_tokens)
+            conn.execute(
+                "UPDATE tasks SET title = ?, category = ?, created_at = ?, "
+                "deadline_ts = ?, is_routine = ?, initial_rot = ?, "
+                "interval_days = ?, last_checkin_ts = ? "
+                "WHERE owner = ? AND id = ?",
+                (
+                    task_data.get("title", ""),
+                    task_data.get("category", "other"),
+                    to_number(task_data.get("created_at")),
+                    to_number(task_data.get("deadline_ts")),
+                    to_int(task_data.get("is_routine")),
+                    to_int(task_data.get("initial_rot")),
+                    to_int(task_data.get("interval_days")),
+                    to_number(task_data.get("last_checkin_ts")),
+                    owner_key, int(task_id),
+                ),
+            )
+            self._feed(conn, owner_key, "task_events", {
+                "type": "updated",
+                "task_id": str(task_id),
+                "title": task_data.get("title", ""),
+                "category": task_data.get("category", "other"),
+                "owner": owner_key,
+                "ts": str(int(time.time())),
+            })
+            self._touch(conn, owner_key, changed=[task_id])
+
+    # -------------------------------------------------
+    # 完成 / 刪除 / 加入救援 / 打卡（單筆跟批次共用）
+    # -------------------------------------------------
+    def apply_action(self, owner_key, action, task_ids, note="", now_ts=None):
+        now_ts = now_ts or time.time()
+        ts = str(int(now_ts))
+        with self._tx() as conn:
+            owned = self._owned(conn, owner_key, [str(t) for t in task_ids])
+            if not owned:
+                return []
+            ids = [tid for tid, _ in owned]
+
+            if action in ("done", "delete"):
+                for tid, data in owned:
+                    if action == "done":
+                        self._feed(conn, owner_key, "task_done", {
+                            "task_id": tid,
+                            "title": data.get("title", ""),
+                            "category": data.get("category", "other"),
+                            "owner": owner_key,
+                            "ts": ts,
+                        })
+                    else:
+                        self._feed(conn, owner_key, "task_events", {
+                            "type": "deleted",
+                            "task_id": tid,
+                            "title": data.get("title", ""),
+                            "owner": owner_key,
+                            "ts": ts,
+                        })
+                marks = ",".join("?" * len(ids))
+                conn.execute(
+                    f"DELETE FROM tasks WHERE owner = ? AND id IN ({marks})",
+                    (owner_key, *[int(t) for t in ids]),
+                )
+                conn.execute(
+                    f"DELETE FROM queue WHERE owner = ? AND task_id IN ({marks})",
+                    (owner_key, *ids),
+                )
+                conn.execute(
+                    f"UPDATE owners SET current_id = NULL "
+                    f"WHERE owner = ? AND current_id IN ({marks})",
+                    (owner_key, *ids),
+                )
+                conn.execute(
+                    f"DELETE FROM search_index WHERE owner = ? AND task_id IN ({marks})",
+                    (owner_key, *ids),
+                )
+                conn.execute(
+                    f"DELETE FROM search_notes WHERE owner = ? AND task_id IN ({marks})",
+                    (owner_key, *ids),
+                )
+                self._touch(conn, owner_key, changed=[self.queue_member], deleted=ids)
+
+            elif action == "queue":
+                added = []
+                for tid, data in owned:
+                    cur = conn.execute(
+                        "INSERT INTO queue (owner, task_id) VALUES (?, ?) "
+                        "ON CONFLICT (owner, task_id) DO NOTHING",
+                        (owner_key, tid),
+                    )
+                    if cur.rowcount:
+                        added.append(tid)
+                        self._feed(conn, owner_key, "task_events", {
+                            "type": "queue_add",
+                            "task_id": tid,
+                            "title": data.get("title", ""),
+                            "owner": owner_key,
+                            "ts": ts,
+                        })
+                if added:
+                    self._touch(conn, owner_key, changed=[self.queue_member])
+                ids = added
+
+            else:  # checkin
+                for tid, data in owned:
+                    conn.execute(
+                        "UPDATE tasks SET last_checkin_ts = ? WHERE owner = ? AND id = ?",
+                        (now_ts, owner_key, int(tid)),
+                    )
+                    for stream, extra in (("task_checkin", {"note": note}),
+                                          ("task_events", {"type": "checkin"})):
+                        fields = dict(extra, task_id=tid,
+                                      title=data.get("title", ""),
+                                      owner=owner_key, ts=ts)
+                        self._feed(conn, owner_key, stream, fields)
+                    self._index_note(conn, owner_key, tid, note)
+                self._touch(conn, owner_key, changed=ids)
+        return ids
+
+    # -------------------------------------------------
+    # 今日救援 queue
+    # -------------------------------------------------
+    def queue_state(self, owner_key):
+        conn = self._conn()
+        items = [row[0] for row in conn.execute(
+            "SELECT task_id FROM queue WHERE owner = ? ORDER BY pos", (owner_key,)
+        )]
+        row = conn.execute(
+            "SELECT current_id FROM owners WHERE owner = ?", (owner_key,)
+        ).fetchone()
+        return items, (row[0] if row else None)
+
+    def next_rescue(self, owner_key):
+        with self._tx() as conn:
+            row = conn.execute(
+                "SELECT pos, task_id FROM queue WHERE owner = ? ORDER BY pos LIMIT 1",
+                (owner_key,),
+            ).fetchone()
+            conn.execute(
+                "INSERT INTO owners (owner) VALUES (?) ON CONFLICT (owner) DO NOTHING",
+                (owner_key,),
+            )
+            if row is None:
+                cur = conn.execute(
+                    "UPDATE owners SET current_id = NULL "
+                    "WHERE owner = ? AND current_id IS NOT NULL",
+                    (owner_key,),
+                )
+                if cur.rowcount:
+                    self._touch(conn, owner_key, changed=[self.queue_member])
+                return None
+
+            tid = row["task_id"]
+            conn.execute("DELETE FROM queue WHERE pos = ?", (row["pos"],))
+            conn.execute(
+                "UPDATE owners SET current_id = ? WHERE owner = ?", (tid, owner_key)
+            )
+            self._touch(conn, owner_key, changed=[self.queue_member])
+            owned = self._owned(conn, owner_key, [tid])
+            self._feed(conn, owner_key, "task_events", {
+                "type": "rescue_pick",
+                "task_id": tid,
+                "title": owned[0][1].get("title", "") if owned else "",
+                "owner": owner_key,
+                "ts": str(int(time.time())),
+            })
+            return tid
+
+    # -------------------------------------------------
+    # 紀錄（events / done / checkin）
+    # -------------------------------------------------
+    def recent_feed(self, owner_key, stream, count):
+        rows = self._conn().execute(
+            "SELECT id, fields FROM feed WHERE owner = ? AND stream = ? "
+            "ORDER BY id DESC LIMIT ?",
+            (owner_key, stream, count),
+        ).fetchall()
+        return [(str(row["id"]), json.loads(row["fields"])) for row in rows]
+
+    def iter_feed(self, owner_key, stream, chunk):
+        last_id = 0
+        while True:
+            rows = self._conn().execute(
+                "SELECT id, fields FROM feed WHERE owner = ? AND stream = ? AND id > ? "
+                "ORDER BY id LIMIT ?",
+                (owner_key, stream, last_id, chunk),
+            ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1]["id"]
+            for row in rows:
+                yield str(row["id"]), json.loads(row["fields"])
+
+    # -------------------------------------------------
+    # 離線同步
+    # -------------------------------------------------
+    def changes_since(self, owner_key, since):
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute(
+                "SELECT seq FROM owners WHERE owner = ?", (owner_key,)
+            ).fetchone()
+            rows = conn.execute(
+                "SELECT task_id, deleted FROM changes WHERE owner = ? AND seq > ? "
+                "ORDER BY seq",
+                (owner_key, since),
+            ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        changed = [row["task_id"] for row in rows if not row["deleted"]]
+        deleted = [row["task_id"] for row in rows if row["deleted"]]
+        return (row[0] if row else 0), changed, deleted
+
+    def sync_checkins(self, owner_key, items):
+        """items = [{"task_id", "note", "ts", "client_id"}]，回傳 (accepted, rejected, seq)"""
+        now_ts = time.time()
+        accepted, rejected, latest = [], [], {}
+        with self._tx() as conn:
+            conn.execute("DELETE FROM seen WHERE expires_at < ?", (now_ts,))
+            owned = dict(self._owned(conn, owner_key,
+                                     list(dict.fromkeys(c["task_id"] for c in items))))
+            for c in items:
+                data = owned.get(c["task_id"])
+                if data is None:
+                    rejected.append({"task_id": c["task_id"], "reason": "not found"})
+                    continue
+                if c["client_id"]:
+                    cur = conn.execute(
+                        "INSERT INTO seen (owner, client_id, expires_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT (owner, client_id) DO NOTHING",
+                        (owner_key, c["client_id"], now_ts + self.dedup_ttl),
+                    )
+                    if not cur.rowcount:
+                        # 之前已經收過了，當作成功
+                        accepted.append(c["task_id"])
+                        continue
+
+                prev = to_number(data.get("last_checkin_ts")) or 0.0
+                if not isinstance(prev, float):
+                    prev = 0.0
+                latest[c["task_id"]] = max(latest.get(c["task_id"], prev), c["ts"])
+                ts = str(int(c["ts"]))
+                self._feed(conn, owner_key, "task_checkin", {
+                    "task_id": c["task_id"], "title": data.get("title", ""),
+                    "note": c["note"], "owner": owner_key, "ts": ts,
+                })
+                self._feed(conn, owner_key, "task_events", {
+                    "type": "checkin", "task_id": c["task_id"],
+                    "title": data.get("title", ""), "owner": owner_key, "ts": ts,
+                })
+                self._index_note(conn, owner_key, c["task_id"], c["note"])
+                accepted.append(c["task_id"])
+
+            conn.executemany(
+                "UPDATE tasks SET last_checkin_ts = ? WHERE owner = ? AND id = ?",
+                [(ts, owner_key, int(tid)) for tid, ts in latest.items()],
+            )
+            self._touch(conn, owner_key, changed=list(latest))
+            row = conn.execute(
+                "SELECT seq FROM owners WHERE owner = ?", (owner_key,)
+            ).fetchone()
+        return accepted, rejected, (row[0] if row else 0)
+
+    # -------------------------------------------------
+    # 全文搜尋
+    # -------------------------------------------------
+    def search(self, owner_key, tokens, limit):
+        marks = ",".join("?" * len(tokens))
+        rows = self._conn().execute(
+            f"SELECT task_id FROM search_index WHERE owner = ? AND token IN ({marks}) "
+            f"GROUP BY task_id HAVING COUNT(*) = ? "
+            f"ORDER BY CAST(task_id AS INTEGER) DESC",
+            (owner_key, *tokens, len(tokens)),
+        ).fetchall()
+        task_ids = [row[0] for row in rows]
+        return self.get_tasks(owner_key, task_ids[:limit]), len(task_ids)
+
+    def iter_owners(self):
+        rows = self._conn().execute(
+            "SELECT owner FROM owners UNION SELECT DISTINCT owner FROM tasks"
+        ).fetchall()
+        for row in rows:
+            yield row[0]
+
+    def reindex_search(self, owner_key):
+        with self._tx() as conn:
+            rows = conn.execute(
+                "SELECT id, title FROM tasks WHERE owner = ?", (owner_key,)
+            ).fetchall()
+            for row in rows:
+                self._index(conn, owner_key, row["id"], self.tokenize(row["title"]))
+            task_ids = {str(row["id"]) for row in rows}
+            for _, fields in self.iter_feed(owner_key, "task_checkin", 500):
+                if fields.get("task_id") in task_ids:
+                    self._index_note(conn, owner_key, fields["task_id"], fields.get("note"))
+        return len(rows)
+
+    # -------------------------------------------------
+    # 腐爛度趨勢
+    # -------------------------------------------------
+    def rot_counts(self, owner_key, now):
+        """沒有排行榜 sorted set 可以數，只讀算腐爛度要用的幾個欄位自己算"""
+        rows = self._conn().execute(
+            "SELECT created_at, deadline_ts, is_routine, initial_rot, interval_days, "
+            "last_checkin_ts FROM tasks WHERE owner = ?",
+            (owner_key,),
+        )
+        counts = {}
+        for row in rows:
+            level = self.rot_level(to_hash(row))
+            counts[level] = counts.get(level, 0) + 1
+        return counts
+
+    def add_rot_sample(self, owner_key, counts, slots):
+        """counts 的 key 是四個腐爛度（由小到大），同一個時段就累加，換時段就蓋掉"""
+        values = [counts[level] for level in sorted(counts)]
+        with self._tx() as conn:
+            for resolution, slot, period in slots:
+                conn.execute(
+                    "INSERT INTO rot_series VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?) "
+                    "ON CONFLICT (owner, resolution, slot) DO UPDATE SET "
+                    "samples = CASE WHEN period = excluded.period THEN samples + 1 ELSE 1 END, "
+                    "fresh = excluded.fresh "
+                    "+ CASE WHEN period = excluded.period THEN fresh ELSE 0 END, "
+                    "mild = excluded.mild "
+                    "+ CASE WHEN period = excluded.period THEN mild ELSE 0 END, "
+                    "medium = excluded.medium "
+                    "+ CASE WHEN period = excluded.period THEN medium ELSE 0 END, "
+                    "critical = excluded.critical "
+                    "+ CASE WHEN period = excluded.period THEN critical ELSE 0 END, "
+                    "period = excluded.period",
+                    (owner_key, resolution, slot, period, *values),
+                )
+
+    def rot_series(self, owner_key, resolution):
+        rows = self._conn().execute(
+            "SELECT period, samples, fresh, mild, medium, critical FROM rot_series "
+            "WHERE owner = ? AND resolution = ?",
+            (owner_key, resolution),
+        ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def rot_leaderboard(self, by, limit):
+        """
+        全站排行榜。SQLite 沒有存每個任務的腐爛度，
+        直接拿最近一次 rot-snapshot 的小時資料排（一個查詢，不用掃任務）
+        """
+        score = "critical" if by == "critical" else "mild * 30 + medium * 60 + critical * 90"
+        rows = self._conn().execute(
+            f"SELECT owner, ({score}) / samples AS score FROM rot_series "
+            f"WHERE resolution = 'hour' "
+            f"AND period = (SELECT MAX(period) FROM rot_series WHERE resolution = 'hour') "
+            f"AND ({score}) > 0 ORDER BY score DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return [(row["owner"].split("#", 1)[0], int(row["score"])) for row in rows]
+
+    # -------------------------------------------------
+    # 匯入
+    # -------------------------------------------------
+    def import_records(self, owner_key, records, id_map, stats):
+        with self._tx() as conn:
+            unseen = []
+            for rec in records:
+                if rec["type"] == "task":
+                    old_id = str(rec.get("id") or "")
+                else:
+                    old_id = str(rec["fields"].get("task_id") or "")
+                if old_id and old_id not in id_map and old_id not in unseen:
+                    unseen.append(old_id)
+            if unseen:
+                id_map.update(zip(unseen, self._allocate_ids(conn, len(unseen))))
+
+            new_task_ids = []
+            for rec in records:
+                if rec["type"] == "task":
+                    old_id = str(rec.get("id") or "")
+                    if not old_id:
+                        stats["skipped"] += 1
+                        continue
+                    new_id = id_map[old_id]
+                    data = dict(rec)
+                    data.setdefault("created_at", time.time())
+                    self._insert_task(conn, owner_key, new_id, data)
+                    self._index(conn, owner_key, new_id, self.tokenize(data.get("title")))
+                    new_task_ids.append(new_id)
+                    stats["tasks"] += 1
+                else:
+                    fields = {
+                        k: str(v) for k, v in rec["fields"].items() if v is not None
+                    }
+                    if fields.get("task_id"):
+                        fields["task_id"] = id_map[str(fields["task_id"])]
+                    fields["owner"] = owner_key
+                    self._feed(conn, owner_key, self.stream_by_type[rec["type"]], fields)
+                    if rec["type"] == "checkin" and fields.get("task_id"):
+                        self._index_note(conn, owner_key, fields["task_id"],
+                                         fields.get("note"))
+                    stats[rec["type"]] += 1
+            self._touch(conn, owner_key, changed=new_task_ids)
@@ -0,0 +1,457 @@
+// 首頁（index.html）的互動
+// ---------- 首頁任務卡片：從任務清單頁複製 ----------
+// 卡片只 render 一份（任務清單頁），其他事件都在這之後才綁，複製出來的卡片也會有
+document.querySelectorAll('.tasks-grid[data-copy-from]').forEach(grid => {
+  const source = document.getElementById(grid.dataset.copyFrom);
+  if (!source) return;
+  const copy = source.cloneNode(true);
+  copy.querySelectorAll('.bulk-check').forEach(el => el.remove());
+  grid.append(...copy.children);
+});
+
+// ---------- Page 切換 ----------
+const navLinks = document.querySelectorAll('.nav-link');
+const pages = document.querySelectorAll('.page');
+
+navLinks.forEach(link => {
+  link.addEventListener('click', (e) => {
+    e.preventDefault();
+    const pageName = link.dataset.page;
+    pages.forEach(p => p.classList.remove('page-active'));
+    document.getElementById('page-' + pageName).classList.add('page-active');
+
+    navLinks.forEach(l => l.classList.remove('active'));
+    link.classList.add('active');
+
+    window.scrollTo({ top: 0, behavior: 'smooth' });
+  });
+});
+
+// ---------- 左右漂浮樹懶 top 隨機 ----------
+document.querySelectorAll('.side-sloth').forEach(el => {
+  const min = 18, max = 70;
+  const top = min + Math.random() * (max - min);
+  el.style.top = top + 'vh';
+});
+
+// ---------- 中央樹懶 hover 換圖 ----------
+// <picture> 會優先用 <source> 的 WebP，所以兩邊都要換
+const heroSloth = document.getElementById('hero-sloth-img');
+const heroSlothWebp = document.getElementById('hero-sloth-webp');
+if (heroSloth) {
+  const idleSrc = heroSloth.getAttribute('src');
+  const hoverSrc = heroSloth.dataset.hover;
+  const idleWebp = heroSlothWebp ? heroSlothWebp.getAttribute('srcset') : null;
+  const hoverWebp = heroSlothWebp ? heroSlothWebp.dataset.hover : null;
+  // 先載入揮手的圖，第一次 hover 才不會閃一下
+  if (hoverWebp || hoverSrc) new Image().src = hoverWebp || hoverSrc;
+  heroSloth.addEventListener('mouseenter', () => {
+    if (hoverWebp) heroSlothWebp.srcset = hoverWebp;
+    if (hoverSrc) heroSloth.src = hoverSrc;
+  });
+  heroSloth.addEventListener('mouseleave', () => {
+    if (idleWebp) heroSlothWebp.srcset = idleWebp;
+    heroSloth.src = idleSrc;
+  });
+}
+
+// ---------- 新增任務：截止時間 / 無期限 ----------
+const noDeadlineCheckbox = document.getElementById('no_deadline');
+const deadlineInput = document.getElementById('deadline');
+const intervalInput = document.getElementById('interval_days');
+
+function updateDeadlineState() {
+  if (!noDeadlineCheckbox || !deadlineInput || !intervalInput) return;
+  const hasDeadline = deadlineInput.value !== "";
+  if (hasDeadline) {
+    noDeadlineCheckbox.checked = false;
+    noDeadlineCheckbox.disabled = true;
+    intervalInput.value = "";
+    intervalInput.disabled = true;
+    deadlineInput.disabled = false;
+  } else {
+    noDeadlineCheckbox.disabled = false;
+    if (noDeadlineCheckbox.checked) {
+      deadlineInput.value = "";
+      deadlineInput.disabled = true;
+      intervalInput.disabled = false;
+    } else {
+      deadlineInput.disabled = false;
+      intervalInput.value = "";
+      intervalInput.disabled = true;
+    }
+  }
+}
+
+if (noDeadlineCheckbox && deadlineInput && intervalInput) {
+  noDeadlineCheckbox.addEventListener('change', updateDeadlineState);
+  deadlineInput.addEventListener('change', updateDeadlineState);
+  deadlineInput.addEventListener('input', updateDeadlineState);
+  updateDeadlineState();
+}
+
+// ---------- 批次操作 ----------
+const bulkForm = document.getElementById('bulk-form');
+if (bulkForm) {
+  const bulkChecks = document.querySelectorAll('.bulk-check');
+  const bulkCount = document.getElementById('bulk-count');
+  const bulkSubmit = document.getElementById('bulk-submit');
+  const bulkAction = document.getElementById('bulk-action');
+  const bulkNote = document.getElementById('bulk-note');
+
+  function updateBulkState() {
+    const n = document.querySelectorAll('.bulk-check:checked').length;
+    bulkCount.textContent = n;
+    bulkSubmit.disabled = n === 0;
+    bulkNote.style.display = bulkAction.value === 'checkin' ? '' : 'none';
+  }
+
+  bulkChecks.forEach(el => el.addEventListener('change', updateBulkState));
+  bulkAction.addEventListener('change', updateBulkState);
+  bulkForm.addEventListener('submit', (e) => {
+    const n = document.querySelectorAll('.bulk-check:checked').length;
+    const label = bulkAction.options[bulkAction.selectedIndex].text;
+    if ((bulkAction.value === 'done' || bulkAction.value === 'delete') &&
+        !confirm(`確定要把勾選的 ${n} 個任務「${label}」嗎？`)) {
+      e.preventDefault();
+    }
+  });
+  updateBulkState();
+}
+
+// ---------- 完成任務 Modal ----------
+const doneForms = document.querySelectorAll('.done-form');
+const doneModalOverlay = document.getElementById('done-modal-overlay');
+const doneConfirmBtn = document.getElementById('done-confirm-btn');
+const doneCancelBtn = document.getElementById('done-cancel-btn');
+const doneModalText = document.getElementById('done-modal-text');
+let currentDoneForm = null;
+
+function openDoneModal(title) {
+  if (doneModalText) {
+    doneModalText.textContent = `樹懶恭喜你：終於把「${title}」完成了嗎？`;
+  }
+  doneModalOverlay.style.display = 'flex';
+}
+function closeDoneModal() {
+  doneModalOverlay.style.display = 'none';
+  currentDoneForm = null;
+}
+
+doneForms.forEach(form => {
+  form.addEventListener('submit', function (e) {
+    e.preventDefault();
+    const title = this.dataset.title || '這個任務';
+    currentDoneForm = this;
+    openDoneModal(title);
+  });
+});
+
+if (doneCancelBtn) {
+  doneCancelBtn.addEventListener('click', closeDoneModal);
+}
+if (doneConfirmBtn) {
+  doneConfirmBtn.addEventListener('click', () => {
+    if (currentDoneForm) currentDoneForm.submit();
+    closeDoneModal();
+  });
+}
+if (doneModalOverlay) {
+  doneModalOverlay.addEventListener('click', (e) => {
+    if (e.target === doneModalOverlay) closeDoneModal();
+  });
+}
+
+// ---------- 刪除任務 Modal ----------
+const deleteForms = document.querySelectorAll('.delete-form');
+const deleteModalOverlay = document.getElementById('delete-modal-overlay');
+const deleteConfirmBtn = document.getElementById('delete-confirm-btn');
+const deleteCancelBtn = document.getElementById('delete-cancel-btn');
+const deleteModalText = document.getElementById('delete-modal-text');
+let currentDeleteForm = null;
+
+function openDeleteModal(title) {
+  if (deleteModalText) {
+    deleteModalText.textContent =
+      `樹懶小聲問：真的要把「${title}」整個刪掉嗎？（之後就找不到囉）`;
+  }
+  deleteModalOverlay.style.display = 'flex';
+}
+function closeDeleteModal() {
+  deleteModalOverlay.style.display = 'none';
+  currentDeleteForm = null;
+}
+
+deleteForms.forEach(form => {
+  form.addEventListener('submit', function (e) {
+    e.preventDefault();
+    const title = this.dataset.title || '這個任務';
+    currentDeleteForm = this;
+    openDeleteModal(title);
+  });
+});
+
+if (deleteCancelBtn) {
+  deleteCancelBtn.addEventListener('click', closeDeleteModal);
+}
+if (deleteConfirmBtn) {
+  deleteConfirmBtn.addEventListener('click', () => {
+    if (currentDeleteForm) currentDeleteForm.submit();
+    closeDeleteModal();
+  });
+}
+if (deleteModalOverlay) {
+  deleteModalOverlay.addEventListener('click', (e) => {
+    if (e.target === deleteModalOverlay) closeDeleteModal();
+  });
+}
+
+// ---------- 任務分類篩選 & 空清單提示 ----------
+const filterButtons = document.querySelectorAll('.filter-btn[data-filter]');
+const taskCards = document.querySelectorAll('.task-card');
+const tasksGrids = document.querySelectorAll('.tasks-grid');
+const emptyHints = document.querySelectorAll('.tasks-empty-hint');
+
+tasksGrids.forEach(grid => {
+  grid.classList.add('three-cols');
+});
+
+function updateEmptyHint() {
+  if (!emptyHints.length) return;
+  let anyVisible = false;
+  taskCards.forEach(card => {
+    if (card.style.display !== 'none') {
+      anyVisible = true;
+    }
+  });
+  emptyHints.forEach(hint => {
+    hint.style.display = anyVisible ? 'none' : 'block';
+  });
+}
+
+filterButtons.forEach(btn => {
+  btn.addEventListener('click', () => {
+    const filter = btn.dataset.filter || 'all';
+
+    filterButtons.forEach(b => b.classList.remove('active'));
+    btn.classList.add('active');
+
+    taskCards.forEach(card => {
+      const category = card.dataset.category || 'other';
+      if (filter === 'all' || filter === category) {
+        card.style.display = '';
+      } else {
+        card.style.display = 'none';
+      }
+    });
+
+    tasksGrids.forEach(grid => {
+      grid.classList.remove('two-cols', 'three-cols');
+      grid.classList.add('three-cols');
+    });
+
+    updateEmptyHint();
+  });
+});
+
+// ---------- 心靈雞湯 ----------
+const lazyQuotes = [
+  "舒服是留給死人的，交作業的是活人。你現在還活著，快去寫。🧟‍♀️",
+  "你不是沒有時間，你只是把時間全部捐給了手機螢幕。📱",
+  "再滑一下沒關係啦——你的腐爛度這麼高，也不差這 5 分鐘。（誤）",
+  "先做 10 分鐘就好，不想做再爛回去也可以。但通常你會做超過。⏱️",
+  "如果未來的你可以回訊息，他現在會說：拜託快點開始，我真的快爆掉了。💥",
+  "你現在偷懶的每一分鐘，未來都要拿加倍的焦慮來還。⏰😵‍💫",
+  "你不是在休息，你只是在旁觀自己的人生慢慢腐爛。🧟‍♀️🍃",
+  "作業沒有自己會好，只有分數會自己變難看而已。📚📉",
+  "再滑一下手機沒關係，只是未來的你會多掉幾撮頭髮而已。📱😵‍💫",
+  "你說你在醞釀靈感，其實只是把deadline當嚇人用。📅👻",
+  "現在偷的懶，都會變成未來熬的夜。🌙💤",
+  "你不是不會，你只是把「等一下」用到爛掉。🕒🧟‍♂️",
+  "今天不動，明天就會為今天的自己跪著寫作業。🧎‍♀️📚",
+  "害怕開始的你，之後會更害怕成績單。📄😰",
+  "你把時間存進耍廢銀行，利息就是成堆的後悔。🏦😩",
+  "舒服是現在領的，痛苦是之後一次付清的。🛋️💸",
+  "你以為在放鬆，其實是在幫壓力慢慢加碼。🎈💣",
+  "待辦清單不會自己變少，但你壽命會。📋🧓",
+  "再拖一下沒關係啦，反正到時候崩潰的不是現在的你，是未來的你。🤯⏳",
+  "你不是沒時間，只是把時間都捐給了廢掉的一天。🎁🕒",
+  "你一直說「等我狀態好一點」，結果最穩定的就是你的拖延。😪📆",
+  "那個一直說「明天再開始」的人，今天也在重複同一句台詞。🔁😶",
+  "你現在假裝看不見任務，之後任務會用成績把你叫醒。📢📊",
+  "你說你在養精蓄銳，但你的精力只花在滑手機。📱🪫",
+  "你嘴上說著要改變，手指卻準備按下一集播放。▶️😑",
+  "現在多打幾個字，之後就少掉幾聲崩潰的哀號。⌨️😵",
+  "你不欠別人作業，你欠的是未來想躺平卻不能躺的自己。🛏️🚫",
+  "你以為自己在放假，其實只是把人生按了慢速拖延。🐌📆",
+  "你的進度條不是卡住，是你自己按了暫停。⏸️📊",
+  "每一次「等一下」都在幫腐爛指數+10%。🧟‍♀️📈",
+  "你不是沒有機會，而是每次機會來你都在發呆。👀💤",
+  "你怕辛苦，所以選擇每天被壓力小拳拳捶胸口。👊😵‍💫",
+  "現在不讀書，以後就會專心讀別人的成功故事。📚✨",
+  "你說你要開始了，結果開始整理桌子、房間、整個世界，就是沒開始寫。🧹🙃",
+  "你在等動力來，其實動力在等你先動起來。🏃‍♀️⚡",
+  "你不是在放空，你是在把未來變得爆滿。🌫️📅",
+  "明明只是寫一頁的距離，你卻選擇拉長成一晚的折磨。📄🌙",
+  "你一直說「等有空再做」，事實是「不做所以一直很空」。🕳️🕒",
+  "你現在省下的是努力，之後加倍付出的是眼淚。💧📚",
+  "如果壓力會說話，它現在應該在門口排隊等你正眼看它。🚪😰",
+  "你把「先休息一下」當口頭禪，難怪疲憊一直當你室友。🛋️😴",
+  "作業放久不會變成熟作品，只會變臭掉的炸彈。🧨🧟‍♂️",
+  "你越假裝沒事，待辦就越像鬼一樣半夜出來嚇你。👻📋",
+  "現在說「等一下」，之後就會對著螢幕說「完蛋了」。😱💻",
+  "你滑過的每一則短影片，都在幫你的時間做破碎測試。📱🧩",
+  "你不是需要再想一下，你只是捨不得離開床。🛏️😪",
+  "你把腦容量拿去記梗圖，難怪記不起考試內容。🧠🖼️",
+  "每一次拖延，都在偷偷訓練你成為專業逃避選手。🏅🏃‍♂️",
+  "你說你要好好生活，但你對枕頭的態度最認真。🌙🤝",
+  "你不是沒時間寫，而是把時間全拿去焦慮要怎麼寫。😵‍💫🕒",
+  "現在不逼自己，以後生活就會逼你到牆角。🧱😓",
+  "你一直說要重啟人生，其實只需要先重啟文件就好。📄🔁",
+  "你覺得自己在充電，結果只是讓罪惡感滿格。🔋😖",
+  "你和桌上的待辦已讀不回太久了，它們準備報警了。📋🚨",
+  "你以為明天會比較有動力，其實明天只會比較累。😮‍💨📆",
+  "你已經練習逃避很久了，該輪到練習把事情做完了吧。📚💪",
+  "別再說你在等靈感，靈感在旁邊等你先打開檔案。💡💻",
+  "每一次偷懶，都在替未來的你加班加到懷疑人生。🕯️😵",
+  "你說你想要改變，可是鬧鐘一響就選擇繼續當昨天的那個人。⏰😴",
+  "你現在選擇滑手機，未來就會狂滑題目找救贖。📱➡️📖",
+  "要不是你一直拖延，你早就可以躺著爽滑成就感了。🛏️✨",
+  "你怕做不好，所以先選擇乾脆不要做，超級徹底。🎯😶",
+  "你最擅長的行動，就是把事情加入「之後再說」清單。📂🌀",
+  "你說你在調整心情，其實只是幫拖延症鋪紅毯。🟥🤡",
+  "你不是沒時間休息，而是根本還沒開始努力就先休息。🛋️😵‍💫",
+  "你把「等一下」講得像咒語，結果真的把今天變不見了。🕳️✨",
+  "你害怕開始，卻不怕每天被未完成的事折磨。🔁💔",
+  "你現在覺得沒差的小事，期末會變成你想跪地求饒的大事。📊😱",
+  "你說你壓力好大，但你做的事情只有把壓力養更大。🐷💣",
+  "你對鬧鐘的態度，跟你對目標的態度一樣：先關掉再說。⏰🙈",
+  "你把「努力」當選項，難怪結果一直當你。🎲😬",
+  "你以為自己在追劇，其實被追的是你的進度。📺🏃‍♀️",
+  "你現在不肯寫的每一個字，之後都會變成一聲嘆氣。✍️😮‍💨",
+  "你說你想變更好，但你每天最穩定的行程就是耍廢。📆😴",
+  "你不是沒夢想，只是夢想不喜歡一直躺著的人。💤🌟",
+  "你每次都說「下次一定」，結果「下次」永遠當工具人。🔁🧍‍♀️",
+  "你幫自己找了一堆理由不做事，卻沒幫未來找半條出路。🛣️😵",
+  "你把作業當背景音樂，久了就會變成心裡的警報聲。📚🚨",
+  "你追的是短暫的放鬆，卻丟掉長期的安心。🛋️❌🧠",
+  "你說你現在狀態不好，但你從來沒在好好狀態下開始過。🧊😐",
+  "你一次又一次拖延，已經快把自己變成高級版樹懶。🦥👑",
+  "你讓舒適圈變成監獄，還幫它鋪好溫暖的棉被。🛌🚫",
+  "你說你怕失敗，所以先選擇在原地爛掉。🧟‍♀️📍",
+  "你把每個夜晚變成補作業馬拉松，然後怪早上起不來。🌙🏃‍♂️",
+  "你不是沒能力，你只是把能力鎖在「明天再用」的抽屜。🔒📦",
+  "你說你在等好時機，其實時機早就被你晾到發霉了。🕰️🍄",
+  "你覺得事情好多好煩，卻還是選擇把時間丟給廢事。🗑️📱",
+  "你老是說「之後會補」，結果補考的人生越來越多。📚🔁",
+  "你把能量全浪費在內心小劇場，現實的事情一件都沒做。🎭📉",
+  "你怕失敗不敢開始，其實你早就用「不開始」徹底失敗。🚫🏁",
+  "你說你只是想放鬆一下，但你的「一下」通常是一整天。🌤️➡️🌃",
+  "你懶得規劃未來，未來也懶得給你好日子過。📆😒",
+  "你看到難的東西就關頁面，難怪現實越來越難看。❌💻",
+  "你羨慕別人有選擇，其實你每天都在選爛選項。🎲🗑️",
+  "你以為裝沒看到就沒事了，最後是成績偷偷在記仇。📊👀",
+  "你讓拖延幫你做的人生決定，然後再抱怨自己過得不好。🕰️😤",
+  "你不是被打趴在地，而是自己走進去躺平區。🛌🚧",
+  "你每次都說下次會更好，結果只是下次更慌。📆😰",
+  "你寧願每天被壓力追殺，也不願意先做一點點減輕負擔。🔪😵‍💫",
+  "你不是沒有時間，是你從來沒有把「認真」排進行程。📅🚫",
+  "你對休息很主動，對努力超被動。🔁🛋️",
+  "你說你很累，但那是因為你讓所有事情擠在一起來。🧱💥",
+  "你怕辛苦練習，只好習慣一直當沒準備好的那個人。🎤😓",
+  "你不肯現在痛一下，就會一直在「為什麼那時候不做」裡痛很久。🧠💣",
+  "你把人生活成待辦堆成山的樣子，卻還說「再看看」。⛰️👀",
+  "你不是沒有鬥志，你只是把鬥志浪費在和自己吵架。⚔️🧠",
+  "你說你壓力爆棚，但你連正事都還沒正式開工。📦😵",
+  "你害怕被否定，乾脆直接不做，連被肯定的機會都沒了。🚫⭐",
+  "你不是被環境拖累，你是自願被沙發綁架。🛋️🪤",
+  "你覺得人生好像卡住了，其實是你死抓著懶惰不放。✊😴",
+  "你每天都在祈禱一切變好，卻連最基本的一步都懶得踏出去。🙏🚫",
+  "你說你要重新開始，結果只是重新打開同一個耍廢循環。🔄📱",
+  "你拿未來當垃圾桶，把現在不想做的全部丟給它。🗑️📆",
+  "你怕現在不舒服，最後會換來長期的不舒服。💢⏳",
+  "你不是在「調整狀態」，你只是在替拖延找高級說法。🛋️🎓",
+  "你說你在觀察時機，其實只是一直待在原地不敢走。🔍📍",
+  "你怕別人看你笑話，可是你已經先陪自己演了一整齣。🎭😑",
+  "你不是沒路走，是你堅持要在床上等奇蹟。🛏️✨",
+  "你對明天有很多期待，對今天卻只剩下放棄。🌅💤",
+  "你明知道這樣下去會後悔，卻還是一邊喊怕後悔一邊繼續爛。🧟‍♀️💔",
+  "你把自己困在同一個爛循環裡，卻一直問為什麼沒變好。🔁😵",
+  "你怕努力沒用，乾脆選擇完全不用心。🧊💀",
+  "你不是被壓力打垮，是被自己的懶惰拖進水裡。🌊😫",
+  "你努力維持現在這個爛狀態，比改變還認真。🧱🙃",
+  "你說你想要翻身，可是你連側身離開手機都很勉強。📱😪",
+  "你把「改天」講到變口頭禪，結果真正被改掉的是人生機會。📆🗑️",
+  "你明明知道該做什麼，卻故意假裝自己很迷茫。🌫️🎭",
+  "你怕累，所以把所有累集中到最後一起收。📦😵‍💫",
+  "你不是被打擊到躺平，是早就躺好等藉口來蓋被子。🛌🧻",
+  "你讓懶惰幫你做主，難怪結果都長得一樣爛。🤝🗑️",
+  "你不是沒有時間振作，你只是不想放下手機。📱⛓️",
+  "你想要的東西很多，但你願意付出的力氣少得可憐。🎁📉",
+  "你把理想活成幻想，把現實活成笑話。🧠🤣",
+  "你一直喊要改變人生，結果唯一改變的只有睡覺時間。⏰🌙",
+  "你不是輸在天份，而是輸在「懶到爆」三個字。💤💥",
+  "你口口聲聲說想離開爛狀態，卻把每天都活成延長腐爛。🧟‍♂️📆",
+  "你怕開始會辛苦，卻接受每天被爛結果折磨。📊💣",
+  "你不是在等好機會，你是在等一個可以繼續廢的理由。🛋️🌀",
+  "你說你對自己很失望，但明天起床還是會照抄今天再演一次。🔁😐",
+  "拖延的不是事情，是你原本可以很輕鬆的自己。給他一點尊重。🤝"
+];
+function randomQuote() {
+  const idx = Math.floor(Math.random() * lazyQuotes.length);
+  return lazyQuotes[idx];
+}
+const quoteBackdrop = document.getElementById("quote-backdrop");
+const btnOpenQuote = document.getElementById("open-quote-modal");
+const btnCloseQuote = document.getElementById("quote-close");
+const btnNextQuote = document.getElementById("quote-next");
+const quoteTextEl = document.getElementById("quote-text");
+
+if (btnOpenQuote && quoteBackdrop) {
+  btnOpenQuote.addEventListener("click", () => {
+    quoteTextEl.textContent = randomQuote();
+    quoteBackdrop.classList.add("show");
+  });
+}
+if (btnCloseQuote) {
+  btnCloseQuote.addEventListener("click", () => {
+    quoteBackdrop.classList.remove("show");
+  });
+}
+if (btnNextQuote) {
+  btnNextQuote.addEventListener("click", () => {
+    quoteTextEl.textContent = randomQuote();
+  });
+}
+if (quoteBackdrop) {
+  quoteBackdrop.addEventListener("click", (e) => {
+    if (e.target === quoteBackdrop) quoteBackdrop.classList.remove("show");
+  });
+}
+
+// ---------- 使用者名稱：只在「尚未登入」時，把最後一次用過的名字填回去 ----------
+const NAME_KEY = 'rot_user_name';
+const SERVER_OWNER = document.body.dataset.owner || "";
+const topNameInput = document.getElementById('top-name-input');
+const setUserBtn = document.getElementById('set-user-btn');
+
+// 如果後端還沒有登入的使用者，就用 localStorage 幫忙帶入上次打過的名字
+if (!SERVER_OWNER && topNameInput) {
+  const storedName = localStorage.getItem(NAME_KEY);
+  if (storedName && storedName.trim()) {
+    topNameInput.value = storedName.trim();
+  }
+}
+
+// 按下「登入 / 切換使用者」時，把名字記在 localStorage（方便下次自動帶入）
+if (setUserBtn && topNameInput) {
+  setUserBtn.addEventListener('click', () => {
+    const name = (topNameInput.value || '').trim();
+    if (name) {
+      localStorage.setItem(NAME_KEY, name);
+    } else {
+      localStorage.removeItem(NAME_KEY);
+    }
+    // 不擋表單送出
+  });
+}
@@ -0,0 +1,63 @@
+import importlib
+import os
+import sys
+
+import fakeredis
+import pytest
+import redis
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def load_app(monkeypatch, tmp_path):
+    """
+    用指定的環境變數重新載入 app（設定都是 import 時讀的）。
+    Redis 換成 fakeredis：同一個 URL 是同一台，不同 URL 是不同台。
+    """
+    servers = {}
+
+    def from_url(url, **kwargs):
+        return fakeredis.FakeRedis(server=servers.setdefault(url, fakeredis.FakeServer()), **kwargs)
+
+    monkeypatch.setattr(redis, "from_url", from_url)
+
+    def load(backend="redis", urls="redis://test:6379/0", **env):
+        values = {
+            "STORAGE_BACKEND": backend,
+            "REDIS_URLS": urls,
+            "SQLITE_PATH": str(tmp_path / "rot.db"),
+            "JINJA_CACHE_DIR": str(tmp_path / "jinja"),
+            "RATE_LIMIT_DEFAULT": "off",
+            "RATE_LIMITS": "",
+            **env,
+        }
+        for name, value in values.items():
+            monkeypatch.setenv(name, value)
+        for name in ("REDIS_URL", "REDIS_REPLICA_URLS", "PROFILE_SAMPLE_RATE", "PROFILE_TOKEN"):
+            monkeypatch.delenv(name, raising=False)
+        if "app" in sys.modules:
+            return importlib.reload(sys.modules["app"])
+        return importlib.import_module("app")
+
+    return load
+
+
+@pytest.fixture(params=["redis", "sqlite"])
+def backend(request):
+    return request.param
+
+
+def login(app_module, name, secret="abcd"):
+    client = app_module.app.test_client()
+    resp = client.post("/set_owner", data={"owner": name, "secret": secret})
+    assert resp.status_code == 302
+    return client
+
+
+def add_task(client, title, **fields):
+    client.post("/add", data={"title": title, "category": "life", **fields})
+    tasks = client.get("/sync?since=0").get_json()["tasks"]
+    return next(t["id"] for t in tasks if t["title"] == title)
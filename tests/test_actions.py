@@ -0,0 +1,45 @@
+from conftest import add_task, login
+
+OWNER = "amy#abcd"
+
+
+def interleave(A, monkeypatch, concurrent):
+    """第一次 decode_task（讀完、還沒 MULTI）時插進另一個寫入，模擬同時進來的 request"""
+    decode_task = A.decode_task
+    state = {"done": False}
+
+    def racing_decode(*args):
+        if not state["done"]:
+            state["done"] = True
+            concurrent()
+        return decode_task(*args)
+
+    monkeypatch.setattr(A, "decode_task", racing_decode)
+
+
+def test_checkin_racing_delete_does_not_resurrect_task(load_app, monkeypatch):
+    A = load_app("redis")
+    client = login(A, "amy")
+    tid = add_task(client, "寫作業")
+
+    interleave(A, monkeypatch, lambda: A.store.apply_action(OWNER, "delete", [tid]))
+    with A.app.app_context():
+        assert A.store.apply_action(OWNER, "checkin", [tid], note="洗衣服") == []
+
+    assert not A.directory.exists(A.task_key(OWNER, tid))
+    assert A.directory.zscore(A.rot_rank_key(OWNER), tid) is None
+    assert A.directory.zscore(A.rot_due_key(OWNER), tid) is None
+    assert not A.directory.keys("search:*")
+
+
+def test_concurrent_enqueue_adds_task_once(load_app, monkeypatch):
+    A = load_app("redis")
+    client = login(A, "amy")
+    tid = add_task(client, "寫作業")
+
+    interleave(A, monkeypatch, lambda: A.store.apply_action(OWNER, "queue", [tid]))
+    with A.app.app_context():
+        A.store.apply_action(OWNER, "queue", [tid])
+
+    queue_key, _ = A.get_queue_keys(OWNER)
+    assert A.directory.lrange(queue_key, 0, -1) == [tid]
@@ -0,0 +1,38 @@
+from conftest import add_task, login
+
+OWNER = "amy#abcd"
+
+
+def titles(client):
+    return sorted(t["title"] for t in client.get("/sync?since=0").get_json()["tasks"])
+
+
+def test_owner_restore_is_point_in_time(load_app, tmp_path):
+    A = load_app("redis", urls="a=redis://test:6379/0,b=redis://test:6379/1")
+    run = A.app.test_cli_runner()
+    amy = login(A, "amy")
+    add_task(amy, "寫作業")
+    kept = add_task(amy, "讀書")
+    bob = login(A, "bob")
+    add_task(bob, "運動")
+
+    result = run.invoke(args=["backup", str(tmp_path / "bk")])
+    assert result.exit_code == 0, result.output
+
+    later = add_task(amy, "後來的柔軟精")
+    amy.post(f"/checkin/{later}", data={"note": "備份之後才寫的"})
+    amy.post(f"/delete/{kept}")
+    add_task(bob, "bob 後來的")
+
+    result = run.invoke(args=["restore", str(tmp_path / "bk"), "--owner", OWNER])
+    assert result.exit_code == 0, result.output
+
+    assert titles(amy) == ["寫作業", "讀書"]
+    assert amy.get("/api/search?q=柔軟").get_json()["total"] == 0
+    shard = A.SHARDS[A.shard_for(OWNER)[0]]
+    assert not shard.exists(A.task_key(OWNER, later))
+    assert titles(bob) == ["bob 後來的", "運動"]
+
+    result = run.invoke(args=["fsck"])
+    assert result.exit_code == 0, result.output
+    assert "沒有發現問題" in result.output
@@ -0,0 +1,33 @@
+import json
+
+from conftest import login
+
+
+def ndjson(*records):
+    return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode()
+
+
+def test_bad_field_types_are_skipped(load_app, backend):
+    A = load_app(backend)
+    client = login(A, "amy")
+    body = ndjson(
+        {"type": "meta", "version": 1},
+        {"type": "task", "id": "1", "title": 123, "category": "作業", "created_at": 1700000000},
+        {"type": "task", "id": "2", "title": None, "initial_rot": "90", "is_routine": True},
+        {"type": "task", "id": "3", "title": ["壞掉"]},
+        {"type": "task", "id": "4", "title": "壞時間", "deadline_ts": "NaN"},
+        {"type": "task", "id": "5", "title": "壞分類", "category": {"x": 1}},
+        {"type": "checkin", "fields": {"task_id": "1", "note": 42, "ts": 1700000100}},
+        {"type": "checkin", "fields": {"task_id": ["1"], "note": "壞"}},
+    )
+    resp = client.post("/import", data=body)
+    assert resp.status_code == 200
+    stats = resp.get_json()
+    assert stats["tasks"] == 2 and stats["checkin"] == 1 and stats["skipped"] == 4
+
+    tasks = {t["title"]: t for t in client.get("/sync?since=0").get_json()["tasks"]}
+    assert set(tasks) == {"123", ""}
+    assert tasks["123"]["category"] == "homework"
+    assert tasks[""]["rot_level"] == 90
+    assert client.get("/api/search?q=123").get_json()["total"] == 1
+    assert client.get("/api/search?q=42").get_json()["total"] == 1
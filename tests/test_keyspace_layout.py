@@ -0,0 +1,29 @@
+import time
+
+from conftest import login
+
+
+def test_fresh_database_needs_no_migration(load_app):
+    A = load_app("redis")
+    client = login(A, "amy")
+    assert client.get("/home").status_code == 200
+    assert A.directory.get(A.LAYOUT_FLAG_KEY) == A.KEYSPACE_LAYOUT
+
+
+def test_unmigrated_owner_waits_for_migrate_keyspace(load_app):
+    A = load_app("redis")
+    A.directory.hset("task:7", mapping={
+        "owner": "amy#abcd", "title": "舊任務", "category": "其他", "created_at": str(time.time()),
+    })
+    A.directory.rpush("tasks", "7")
+    client = login(A, "amy")
+
+    resp = client.get("/sync?since=0")
+    assert resp.status_code == 503 and "Retry-After" in resp.headers
+    with A.app.test_request_context():
+        assert client.get(A.url_for("static", filename="css/index.css")).status_code == 200
+
+    result = A.app.test_cli_runner().invoke(args=["migrate-keyspace"])
+    assert result.exit_code == 0, result.output
+    tasks = client.get("/sync?since=0").get_json()["tasks"]
+    assert [t["title"] for t in tasks] == ["舊任務"]
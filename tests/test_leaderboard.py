@@ -0,0 +1,96 @@
+import time
+
+from conftest import add_task, login
+
+OWNER = "amy#abcd"
+
+
+def age_tasks(A, task_ids, days=30):
+    """把任務的建立時間往前調，讓它們變成 💥（跟 rot-snapshot 一樣重排一次）"""
+    created_at = time.time() - days * 86400
+    with A.app.app_context():
+        pipe = A.directory.pipeline()
+        tasks = [(tid, dict(data, created_at=created_at))
+                 for tid, data in A.fetch_tasks(OWNER, task_ids)]
+        for tid, data in tasks:
+            A.write_task(pipe, OWNER, tid, data)
+        A.rank_tasks(pipe, OWNER, tasks)
+        pipe.execute()
+        A.publish_dirty_rot()
+
+
+def totals(A):
+    rot_sum, critical = A.directory.hmget(A.owner_meta_key(OWNER), "rot_sum", "rot_critical")
+    return int(rot_sum or 0), int(critical or 0)
+
+
+def ranked_totals(A):
+    scores = [score for _, score in A.directory.zrange(A.rot_rank_key(OWNER), 0, -1, withscores=True)]
+    return int(sum(scores)), sum(1 for s in scores if s >= 90)
+
+
+def board(client, by="sum"):
+    return client.get(f"/api/leaderboard?by={by}").get_json()["owners"]
+
+
+def test_sync_checkin_updates_rank_and_leaderboard(load_app):
+    A = load_app("redis")
+    client = login(A, "amy")
+    ids = [add_task(client, f"任務{i}") for i in range(3)]
+    age_tasks(A, ids)
+    assert totals(A) == (270, 3)
+
+    client.post("/sync/checkins", json={"checkins": [
+        {"task_id": ids[0], "ts": time.time(), "client_id": "c1"},
+    ]})
+
+    assert A.directory.zscore(A.rot_rank_key(OWNER), ids[0]) == 0
+    assert A.directory.zscore(A.rot_due_key(OWNER), ids[0]) != float("inf")
+    assert totals(A) == ranked_totals(A) == (180, 2)
+    assert board(client) == [{"name": "amy", "score": 180}]
+    assert board(client, "critical") == [{"name": "amy", "score": 2}]
+
+
+def test_dangling_ids_are_removed_from_totals(load_app):
+    A = load_app("redis")
+    client = login(A, "amy")
+    ids = [add_task(client, f"任務{i}") for i in range(3)]
+    age_tasks(A, ids)
+
+    A.directory.delete(A.task_key(OWNER, ids[1]))
+    A.directory.zadd(A.rot_due_key(OWNER), {ids[1]: 0})
+    result = A.app.test_cli_runner().invoke(args=["rot-snapshot"])
+    assert result.exit_code == 0, result.output
+
+    assert ids[1] not in A.directory.zrange(A.rot_rank_key(OWNER), 0, -1)
+    assert totals(A) == ranked_totals(A) == (180, 2)
+    assert board(client) == [{"name": "amy", "score": 180}]
+
+
+def test_delete_and_fsck_keep_totals(load_app):
+    A = load_app("redis")
+    client = login(A, "amy")
+    ids = [add_task(client, f"任務{i}") for i in range(3)]
+    age_tasks(A, ids)
+
+    client.post(f"/delete/{ids[0]}")
+    assert totals(A) == ranked_totals(A) == (180, 2)
+
+    A.directory.hset(A.owner_meta_key(OWNER), "rot_sum", 999)
+    result = A.app.test_cli_runner().invoke(args=["fsck", "--repair"])
+    assert result.exit_code == 0, result.output
+    assert totals(A) == (180, 2)
+    assert board(client) == [{"name": "amy", "score": 180}]
+
+
+def test_sqlite_leaderboard_uses_latest_snapshot(load_app):
+    A = load_app("sqlite")
+    for name, n in (("amy", 2), ("bob", 1)):
+        client = login(A, name)
+        for i in range(n):
+            add_task(client, f"任務{i}", initial_rot="90")
+        add_task(client, "新鮮的")
+    result = A.app.test_cli_runner().invoke(args=["rot-snapshot"])
+    assert result.exit_code == 0, result.output
+
+    assert board(client, "critical") == [{"name": "amy", "score": 2}, {"name": "bob", "score": 1}]
@@ -0,0 +1,19 @@
+import redis
+
+
+def test_timeouts_are_not_retried(load_app, monkeypatch):
+    A = load_app("redis")
+    # fakeredis 不管 retry 設定，這裡用真的 client 看設定（lazy，不會真的連線）
+    monkeypatch.setattr(redis, "from_url", redis.Redis.from_url)
+    client = A.make_redis_client("redis://localhost:6379/0")
+    supported = client.get_retry()._supported_errors
+    assert issubclass(redis.exceptions.ConnectionError, supported)
+    assert not issubclass(redis.exceptions.TimeoutError, supported)
+
+
+def test_cli_commands_use_their_own_timeout(load_app):
+    A = load_app("redis", REDIS_SOCKET_TIMEOUT="1", REDIS_CLI_SOCKET_TIMEOUT="45")
+    assert A.directory.connection_pool.connection_kwargs["socket_timeout"] == 1
+    result = A.app.test_cli_runner().invoke(args=["shards", "status"])
+    assert result.exit_code == 0, result.output
+    assert A.directory.connection_pool.connection_kwargs["socket_timeout"] == 45
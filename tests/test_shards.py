@@ -0,0 +1,60 @@
+from conftest import add_task, login
+
+ONE_SHARD = "a=redis://test:6379/0"
+TWO_SHARDS = "a=redis://test:6379/0,b=redis://test:6379/1"
+OWNERS = [f"user{i}" for i in range(8)]
+# shards pin 跑完、部署新設定之前才註冊的 owner
+LATE_OWNERS = [f"late{i}" for i in range(8)]
+
+
+def setup_owner(A, name, task_ids):
+    client = login(A, name)
+    tid = task_ids[name] = add_task(client, "寫作業")
+    client.post("/sync/checkins", json={"checkins": [
+        {"task_id": tid, "ts": 1000, "client_id": f"new-{name}"},
+    ]})
+    # 舊版一個 client_id 一個 key 的去重記錄
+    A.directory.set(A.legacy_seen_key(f"{name}#abcd", f"old-{name}"), 1, ex=3600)
+    # 對不上任何任務的搜尋 token（fsck 之前的殘留），搬家也要一起清掉
+    A.directory.sadd(A.search_token_key(f"{name}#abcd", "殘留"), "999")
+
+
+def test_shard_move_keeps_data_and_dedup(load_app, monkeypatch):
+    A = load_app("redis", urls=ONE_SHARD)
+    task_ids = {}
+    for name in OWNERS:
+        setup_owner(A, name, task_ids)
+
+    result = A.app.test_cli_runner().invoke(args=["shards", "pin", "--add", "b=redis://test:6379/1"])
+    assert result.exit_code == 0, result.output
+    for name in LATE_OWNERS:
+        setup_owner(A, name, task_ids)
+
+    A = load_app("redis", urls=TWO_SHARDS)
+    monkeypatch.setattr(A, "SHARD_PIN_REFRESH", 0)
+    monkeypatch.setattr(A.time, "sleep", lambda seconds: None)
+    result = A.app.test_cli_runner().invoke(args=["shards", "move"])
+    assert result.exit_code == 0, result.output
+
+    for group in (OWNERS, LATE_OWNERS):
+        moved = [name for name in group if A.shard_for(f"{name}#abcd")[0] == "b"]
+        assert moved, "hash ring 應該至少把一個 owner 分到 b"
+    assert not A.directory.hgetall(A.SHARD_PINS_KEY)
+    assert not A.directory.exists(A.SHARD_PENDING_KEY)
+
+    for name in OWNERS + LATE_OWNERS:
+        owner_key = f"{name}#abcd"
+        shard = A.SHARDS[A.shard_for(owner_key)[0]]
+        other = A.SHARDS["a" if shard is A.SHARDS["b"] else "b"]
+        assert not other.keys(f"*{A.owner_tag(owner_key)}*")
+
+        client = login(A, name)
+        tid = task_ids[name]
+        assert [t["id"] for t in client.get("/sync?since=0").get_json()["tasks"]] == [tid]
+        result = client.post("/sync/checkins", json={"checkins": [
+            {"task_id": tid, "ts": 1000, "client_id": f"new-{name}"},
+            {"task_id": tid, "ts": 1000, "client_id": f"old-{name}"},
+        ]}).get_json()
+        assert result["accepted"] == [tid, tid]
+        assert shard.xlen(A.stream_key(owner_key, "task_checkin")) == 1
+        assert shard.ttl(A.sync_seen_key(owner_key)) > 0
@@ -0,0 +1,33 @@
+import pytest
+
+
+@pytest.fixture
+def client_and_url(load_app):
+    A = load_app("sqlite")
+    with A.app.test_request_context():
+        url = A.url_for("static", filename="css/index.css")
+    return A.app.test_client(), url
+
+
+def test_compressed_asset_revalidates_with_304(client_and_url):
+    client, url = client_and_url
+    first = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert first.status_code == 200
+    assert first.headers["Content-Encoding"] == "gzip"
+    assert first.headers["ETag"].endswith('-gzip"')
+    assert "Accept-Ranges" not in first.headers
+    assert "immutable" in first.headers["Cache-Control"]
+
+    again = client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert again.data == b""
+
+
+def test_identity_asset_revalidates_with_304(client_and_url):
+    client, url = client_and_url
+    first = client.get(url)
+    assert "Content-Encoding" not in first.headers
+    assert first.headers["Accept-Ranges"] == "bytes"
+
+    again = client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
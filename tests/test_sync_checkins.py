@@ -0,0 +1,82 @@
+import redis
+
+from conftest import add_task, login
+
+OWNER = "amy#abcd"
+
+
+def post_checkins(client, *items):
+    resp = client.post("/sync/checkins", json={"checkins": list(items)})
+    assert resp.status_code == 200
+    return resp.get_json()
+
+
+def checkin_count(A):
+    return len(A.store.recent_feed(OWNER, "task_checkin", 100))
+
+
+def test_replay_is_applied_once(load_app, backend):
+    A = load_app(backend)
+    client = login(A, "amy")
+    tid = add_task(client, "寫作業")
+    item = {"task_id": tid, "ts": 1000, "client_id": "c1"}
+
+    assert post_checkins(client, item, item)["accepted"] == [tid, tid]
+    assert post_checkins(client, item)["accepted"] == [tid]
+    assert checkin_count(A) == 1
+
+
+def test_unknown_task_does_not_consume_client_id(load_app, backend):
+    A = load_app(backend)
+    client = login(A, "amy")
+    tid = add_task(client, "寫作業")
+
+    result = post_checkins(client, {"task_id": "999", "ts": 1000, "client_id": "c1"})
+    assert result["rejected"] == [{"task_id": "999", "reason": "not found"}]
+
+    assert post_checkins(client, {"task_id": tid, "ts": 1000, "client_id": "c1"})["accepted"] == [tid]
+    assert checkin_count(A) == 1
+
+
+def test_failed_transaction_can_be_retried(load_app, monkeypatch):
+    A = load_app("redis")
+    client = login(A, "amy")
+    tid = add_task(client, "寫作業")
+    item = {"task_id": tid, "ts": 1000, "client_id": "c1"}
+
+    execute = redis.client.Pipeline.execute
+
+    def drop_checkin(pipe, *args, **kwargs):
+        if pipe.transaction and any(cmd[0][0] == "XADD" for cmd in pipe.command_stack):
+            raise redis.exceptions.ConnectionError("connection dropped")
+        return execute(pipe, *args, **kwargs)
+
+    monkeypatch.setattr(redis.client.Pipeline, "execute", drop_checkin)
+    assert client.post("/sync/checkins", json={"checkins": [item]}).status_code == 503
+    monkeypatch.setattr(redis.client.Pipeline, "execute", execute)
+    A.BREAKERS[A.DIRECTORY_SHARD].record_success()
+
+    assert checkin_count(A) == 0
+    assert post_checkins(client, item)["accepted"] == [tid]
+    assert checkin_count(A) == 1
+    assert A.directory.ttl(A.sync_seen_key(OWNER)) > 0
+
+
+def test_non_finite_timestamps_are_rejected(load_app, backend):
+    A = load_app(backend)
+    client = login(A, "amy")
+    tid = add_task(client, "寫作業")
+
+    result = post_checkins(
+        client,
+        {"task_id": tid, "ts": "NaN", "client_id": "c1"},
+        {"task_id": tid, "ts": "-1e400", "client_id": "c2"},
+        {"task_id": tid, "ts": -5, "client_id": "c3"},
+    )
+    assert result["rejected"] == [
+        {"task_id": tid, "reason": "invalid ts"},
+        {"task_id": tid, "reason": "invalid ts"},
+    ]
+    assert result["accepted"] == [tid]
+    task = next(t for t in client.get("/sync?since=0").get_json()["tasks"] if t["id"] == tid)
+    assert float(task["last_checkin_ts"]) > 0